@@ -100,6 +100,7 @@
               python3Packages.mypy
               python3Packages.pytest
               python3Packages.pytest-cov
+              python3Packages.pytest-xdist
             ];
 
             shellHook = ''
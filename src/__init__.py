@@ -2,17 +2,6 @@
 Claude Code Queue - A tool to queue prompts and execute them when token limits reset.
 """
 
-from .claude_interface import ClaudeCodeInterface
-from .models import (
-    ExecutionResult,
-    PromptStatus,
-    QueuedPrompt,
-    QueueState,
-    RateLimitInfo,
-)
-from .queue_manager import QueueManager
-from .storage import MarkdownPromptParser, QueueStorage
-
 __version__ = "0.1.0"
 __all__ = [
     "QueuedPrompt",
@@ -25,3 +14,31 @@ __all__ = [
     "ClaudeCodeInterface",
     "QueueManager",
 ]
+
+# Exported name -> submodule that defines it, imported on first access (PEP 562)
+_LAZY = {
+    "QueuedPrompt": "models",
+    "QueueState": "models",
+    "PromptStatus": "models",
+    "ExecutionResult": "models",
+    "RateLimitInfo": "models",
+    "QueueStorage": "storage",
+    "MarkdownPromptParser": "storage",
+    "ClaudeCodeInterface": "claude_interface",
+    "QueueManager": "queue_manager",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        import importlib
+
+        module = importlib.import_module(f".claude_code_queue.{_LAZY[name]}", __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -2,7 +2,6 @@
 Interface for executing prompts via Claude Code CLI.
 """
 
-import os
 import subprocess
 import time
 from datetime import datetime, timedelta
@@ -26,6 +25,7 @@ class ClaudeCodeInterface:
         try:
             result = subprocess.run(
                 [self.claude_command, "--version"],
+                stdin=subprocess.DEVNULL,
                 capture_output=True,
                 text=True,
                 timeout=10,
@@ -44,18 +44,16 @@ class ClaudeCodeInterface:
         start_time = time.time()
 
         try:
-            original_cwd = os.getcwd()
-
+            # Passed to subprocess as cwd rather than chdir'ing the whole
+            # process, so prompts can run off the main thread
             working_dir = Path(prompt.working_directory).resolve()
             if not working_dir.exists():
                 working_dir.mkdir(parents=True, exist_ok=True)
 
-            os.chdir(working_dir)
-
             # Check if we should create a jj change before execution
-            should_create, reason = JujutsuIntegration.should_create_change(
-                str(working_dir)
-            )
+            jj_context = JujutsuIntegration.prepare_dispatch(str(working_dir))
+            should_create = jj_context.should_create_change
+            reason = jj_context.skip_reason
             jj_bookmark_to_set = None  # Track if we need to set a bookmark on success
             if should_create:
                 success, message = JujutsuIntegration.create_new_change(
@@ -95,7 +93,7 @@ class ClaudeCodeInterface:
             if prompt.context_files:
                 context_refs = []
                 for context_file in prompt.context_files:
-                    context_path = Path(context_file)  # Relative to working directory
+                    context_path = working_dir / context_file
                     if context_path.exists():
                         context_refs.append(f"@{context_file}")
 
@@ -115,7 +113,12 @@ class ClaudeCodeInterface:
             print(f"   {full_prompt}")
 
             result = subprocess.run(
-                cmd, capture_output=True, text=True, timeout=effective_timeout
+                cmd,
+                cwd=str(working_dir),
+                stdin=subprocess.DEVNULL,
+                capture_output=True,
+                text=True,
+                timeout=effective_timeout,
             )
 
             execution_time = time.time() - start_time
@@ -130,15 +133,13 @@ class ClaudeCodeInterface:
             if success and should_create:
                 # If jj was used to create a change, check if there are actual changes
                 has_changes, check_error = JujutsuIntegration.has_working_copy_changes(
-                    str(working_dir)
+                    str(working_dir), jj_context
                 )
                 if check_error is None:
                     # Successfully checked - if no changes, mark as such
                     no_changes_detected = not has_changes
                 # If check failed, we can't determine - assume changes were made
 
-            os.chdir(original_cwd)
-
             return ExecutionResult(
                 success=success,
                 output=result.stdout,
@@ -151,10 +152,6 @@ class ClaudeCodeInterface:
             )
 
         except subprocess.TimeoutExpired:
-            try:
-                os.chdir(original_cwd)
-            except:
-                pass
             execution_time = time.time() - start_time
             effective_timeout = (
                 prompt.timeout if prompt.timeout is not None else self.timeout
@@ -166,10 +163,6 @@ class ClaudeCodeInterface:
                 execution_time=execution_time,
             )
         except Exception as e:
-            try:
-                os.chdir(original_cwd)
-            except:
-                pass
             execution_time = time.time() - start_time
             return ExecutionResult(
                 success=False,
@@ -269,6 +262,7 @@ class ClaudeCodeInterface:
         try:
             result = subprocess.run(
                 [self.claude_command, "--help"],
+                stdin=subprocess.DEVNULL,
                 capture_output=True,
                 text=True,
                 timeout=10,
@@ -291,6 +285,7 @@ class ClaudeCodeInterface:
         try:
             result = subprocess.run(
                 [self.claude_command, "--help"],
+                stdin=subprocess.DEVNULL,
                 capture_output=True,
                 text=True,
                 timeout=10,
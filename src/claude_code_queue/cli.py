@@ -5,25 +5,38 @@ Claude Code Queue - Main CLI entry point.
 A tool to queue Claude Code prompts and automatically execute them when token limits reset.
 """
 
-import argparse
+from __future__ import annotations
+
 import json
 import os
-import subprocess
+import signal
 import sys
-import tempfile
-from datetime import datetime
-from pathlib import Path
-
-from .models import PromptStatus, QueuedPrompt
-from .queue_manager import QueueManager
-from .storage import MarkdownPromptParser
-
-
-def main():
-    parser = argparse.ArgumentParser(
-        description="Claude Code Queue - Queue prompts and execute when limits reset",
-        formatter_class=argparse.RawDescriptionHelpFormatter,
-        epilog="""
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Callable, Optional
+
+# Only argparse is needed to print help or report usage errors; the queue
+# machinery is imported by the code paths that actually use it.
+if TYPE_CHECKING:
+    import argparse
+
+    from .queue_manager import QueueManager
+
+# Defaults of the global options, shared by argparse and the fast path
+DEFAULT_STORAGE_DIR = "~/.claude-queue"
+DEFAULT_CLAUDE_COMMAND = "claude"
+DEFAULT_CHECK_INTERVAL = 30
+DEFAULT_TIMEOUT = 3600
+
+# Keyed by PromptStatus value so the models module need not be imported here
+_STATUS_ICONS = {
+    "queued": "⏳",
+    "executing": "▶️",
+    "completed": "✅",
+    "failed": "❌",
+    "cancelled": "🚫",
+}
+
+EPILOG = """
 Examples:
   # Start the queue processor
   claude-queue start
@@ -49,71 +62,113 @@ Examples:
 
   # Test Claude Code connection
   claude-queue test
-        """,
+"""
+
+
+def build_main_parser(command: Optional[str] = None) -> argparse.ArgumentParser:
+    """Build the top-level parser.
+
+    Without a command, the parser only finds the command and leaves its
+    arguments unparsed. With one, it gets a real sub-command parser for that
+    command alone, which parses the arguments as argparse does for any
+    sub-command, '--' included.
+    """
+    import argparse
+
+    commands_help = "\n".join(
+        f"  {name:<10} {help_text}" for name, (help_text, _, _) in COMMANDS.items()
+    )
+    parser = argparse.ArgumentParser(
+        description="Claude Code Queue - Queue prompts and execute when limits reset",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f"\nAvailable commands:\n{commands_help}\n{EPILOG}",
     )
 
     parser.add_argument(
         "--storage-dir",
-        default="~/.claude-queue",
-        help="Storage directory for queue data (default: ~/.claude-queue)",
+        default=DEFAULT_STORAGE_DIR,
+        help=f"Storage directory for queue data (default: {DEFAULT_STORAGE_DIR})",
     )
 
     parser.add_argument(
         "--claude-command",
-        default="claude",
-        help="Claude Code CLI command (default: claude)",
+        default=DEFAULT_CLAUDE_COMMAND,
+        help=f"Claude Code CLI command (default: {DEFAULT_CLAUDE_COMMAND})",
     )
 
     parser.add_argument(
         "--check-interval",
         type=int,
-        default=30,
-        help="Check interval in seconds (default: 30)",
+        default=DEFAULT_CHECK_INTERVAL,
+        help=f"Check interval in seconds (default: {DEFAULT_CHECK_INTERVAL})",
     )
 
     parser.add_argument(
         "--timeout",
         type=int,
-        default=3600,
-        help="Command timeout in seconds (default: 3600)",
+        default=DEFAULT_TIMEOUT,
+        help=f"Command timeout in seconds (default: {DEFAULT_TIMEOUT})",
     )
 
-    subparsers = parser.add_subparsers(dest="command", help="Available commands")
-
-    start_parser = subparsers.add_parser("start", help="Start the queue processor")
-    start_parser.add_argument(
-        "--verbose", "-v", action="store_true", help="Verbose output"
+    parser.add_argument(
+        "--max-prompts-per-minute",
+        type=float,
+        default=None,
+        help="Start at most this many prompts per minute (default: no limit)",
     )
 
-    next_parser = subparsers.add_parser(
-        "next", help="Process only the next queue item and stop"
-    )
-    next_parser.add_argument(
-        "--verbose", "-v", action="store_true", help="Verbose output"
-    )
+    if command is None:
+        parser.add_argument(
+            "command", nargs="?", choices=list(COMMANDS), help="Command to run"
+        )
+        # Left for the sub-command parser of the second pass
+        parser.add_argument(
+            "command_args", nargs=argparse.REMAINDER, help=argparse.SUPPRESS
+        )
+    else:
+        help_text, build_parser, _ = COMMANDS[command]
+        subparsers = parser.add_subparsers(dest="command")
+        build_parser(
+            subparsers.add_parser(command, help=help_text, description=help_text)
+        )
+
+    return parser
+
 
-    add_parser = subparsers.add_parser("add", help="Add a prompt to the queue")
-    add_parser.add_argument("prompt", help="The prompt text")
-    add_parser.add_argument(
+def build_start_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+
+
+def build_next_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--verbose", "-v", action="store_true", help="Verbose output")
+
+
+def add_prompt_options(parser: argparse.ArgumentParser) -> None:
+    """Add the prompt options shared by the add and edit commands."""
+    parser.add_argument(
         "--priority",
         "-p",
         type=int,
         default=0,
         help="Priority (lower = higher priority)",
     )
-    add_parser.add_argument(
+    parser.add_argument(
         "--working-dir", "-d", default=os.getcwd(), help="Working directory"
     )
-    add_parser.add_argument(
+    parser.add_argument(
         "--context-files", "-f", nargs="*", default=[], help="Context files to include"
     )
-    add_parser.add_argument(
+    parser.add_argument(
         "--max-retries", "-r", type=int, default=3, help="Maximum retry attempts"
     )
-    add_parser.add_argument(
-        "--estimated-tokens", "-t", type=int, help="Estimated token usage"
+    parser.add_argument(
+        "--estimated-tokens",
+        "-t",
+        type=int,
+        default=None,
+        help="Estimated token usage",
     )
-    add_parser.add_argument(
+    parser.add_argument(
         "--permission-mode",
         choices=[
             "acceptEdits",
@@ -123,170 +178,142 @@ Examples:
             "dontAsk",
             "plan",
         ],
+        default=None,
         help="Permission mode for this prompt (default: acceptEdits)",
     )
-    add_parser.add_argument(
+    parser.add_argument(
         "--allowed-tools",
         nargs="*",
+        default=None,
         help='Allowed tools (e.g. "Edit" "Write" "Bash(git:*)")',
     )
-    add_parser.add_argument(
+    parser.add_argument(
         "--prompt-timeout",
         type=int,
         dest="prompt_timeout",
+        default=None,
         help="Timeout in seconds for this prompt (overrides global --timeout)",
     )
-    add_parser.add_argument(
+    parser.add_argument(
         "--model",
         "-m",
         choices=["sonnet", "opus", "haiku"],
+        default=None,
         help="Claude model to use (default: sonnet)",
     )
-    add_parser.add_argument(
+    parser.add_argument(
         "--bookmark",
         "-b",
+        default=None,
         help="jj bookmark name for dependent queue items",
     )
 
-    # Edit command - opens $EDITOR to compose a prompt
-    edit_parser = subparsers.add_parser(
-        "edit", help="Open $EDITOR to compose a prompt or edit an existing one"
-    )
-    edit_parser.add_argument(
+
+def build_add_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("prompt", help="The prompt text")
+    add_prompt_options(parser)
+
+
+def build_edit_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
         "prompt_id",
         nargs="?",
+        default=None,
         help="Optional prompt ID to edit (if not provided, creates new prompt)",
     )
-    edit_parser.add_argument(
-        "--priority",
-        "-p",
-        type=int,
-        default=0,
-        help="Priority (lower = higher priority)",
-    )
-    edit_parser.add_argument(
-        "--working-dir", "-d", default=os.getcwd(), help="Working directory"
-    )
-    edit_parser.add_argument(
-        "--context-files", "-f", nargs="*", default=[], help="Context files to include"
-    )
-    edit_parser.add_argument(
-        "--max-retries", "-r", type=int, default=3, help="Maximum retry attempts"
-    )
-    edit_parser.add_argument(
-        "--estimated-tokens", "-t", type=int, help="Estimated token usage"
-    )
-    edit_parser.add_argument(
-        "--permission-mode",
-        choices=[
-            "acceptEdits",
-            "bypassPermissions",
-            "default",
-            "delegate",
-            "dontAsk",
-            "plan",
-        ],
-        help="Permission mode for this prompt (default: acceptEdits)",
-    )
-    edit_parser.add_argument(
-        "--allowed-tools",
-        nargs="*",
-        help='Allowed tools (e.g. "Edit" "Write" "Bash(git:*)")',
-    )
-    edit_parser.add_argument(
-        "--prompt-timeout",
-        type=int,
-        dest="prompt_timeout",
-        help="Timeout in seconds for this prompt (overrides global --timeout)",
-    )
-    edit_parser.add_argument(
-        "--model",
-        "-m",
-        choices=["sonnet", "opus", "haiku"],
-        help="Claude model to use (default: sonnet)",
-    )
-    edit_parser.add_argument(
-        "--bookmark",
-        "-b",
-        help="jj bookmark name for dependent queue items",
-    )
+    add_prompt_options(parser)
 
-    status_parser = subparsers.add_parser("status", help="Show queue status")
-    status_parser.add_argument("--json", action="store_true", help="Output as JSON")
-    status_parser.add_argument(
+
+def build_status_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--json", action="store_true", help="Output as JSON")
+    parser.add_argument(
         "--detailed", "-d", action="store_true", help="Show detailed prompt info"
     )
 
-    cancel_parser = subparsers.add_parser("cancel", help="Cancel a prompt")
-    cancel_parser.add_argument("prompt_id", help="Prompt ID to cancel")
 
-    delete_parser = subparsers.add_parser(
-        "delete", help="Permanently delete one or more prompts from storage"
-    )
-    delete_parser.add_argument("prompt_ids", nargs="+", help="Prompt ID(s) to delete")
+def build_cancel_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("prompt_id", help="Prompt ID to cancel")
+
+
+def build_delete_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("prompt_ids", nargs="+", help="Prompt ID(s) to delete")
+
 
-    retry_parser = subparsers.add_parser("retry", help="Retry a failed prompt")
-    retry_parser.add_argument("prompt_id", help="Prompt ID to retry")
-    retry_parser.add_argument(
+def build_retry_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("prompt_id", help="Prompt ID to retry")
+    parser.add_argument(
         "--delete",
         "-d",
         action="store_true",
         help="Delete the original prompt after successful retry",
     )
 
-    path_parser = subparsers.add_parser("path", help="Get the file path for a prompt")
-    path_parser.add_argument("prompt_id", help="Prompt ID")
 
-    list_parser = subparsers.add_parser("list", help="List prompts")
-    list_parser.add_argument(
+def build_path_parser(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("prompt_id", help="Prompt ID")
+
+
+def build_list_parser(parser: argparse.ArgumentParser) -> None:
+    from .models import PromptStatus
+
+    parser.add_argument(
         "--status", choices=[s.value for s in PromptStatus], help="Filter by status"
     )
-    list_parser.add_argument("--json", action="store_true", help="Output as JSON")
-    list_parser.add_argument(
+    parser.add_argument("--json", action="store_true", help="Output as JSON")
+    parser.add_argument(
         "--all", "-a", action="store_true", help="Include completed prompts"
     )
 
-    test_parser = subparsers.add_parser("test", help="Test Claude Code connection")
 
-    args = parser.parse_args()
+def build_test_parser(parser: argparse.ArgumentParser) -> None:
+    pass
+
+
+def main():
+    argv = sys.argv[1:]
+
+    # Fast path: 'path <id>' with default global options is called from
+    # scripts in tight loops, so skip argparse entirely
+    if len(argv) == 2 and argv[0] == "path" and not argv[1].startswith("-"):
+        args = SimpleNamespace(
+            storage_dir=DEFAULT_STORAGE_DIR,
+            claude_command=DEFAULT_CLAUDE_COMMAND,
+            check_interval=DEFAULT_CHECK_INTERVAL,
+            timeout=DEFAULT_TIMEOUT,
+            max_prompts_per_minute=None,
+            command="path",
+            prompt_id=argv[1],
+        )
+        return run_command(cmd_path, args)
+
+    parser = build_main_parser()
+    args = parser.parse_args(argv)
 
     if not args.command:
         parser.print_help()
         return 1
 
+    # Parse again with the options of the selected command only
+    args = build_main_parser(args.command).parse_args(argv)
+    _, _, handler = COMMANDS[args.command]
+
+    return run_command(handler, args)
+
+
+def run_command(handler, args) -> int:
+    """Create the queue manager from the global options and run a command."""
     try:
+        from .queue_manager import QueueManager
+
         manager = QueueManager(
             storage_dir=args.storage_dir,
             claude_command=args.claude_command,
             check_interval=args.check_interval,
             timeout=args.timeout,
+            max_prompts_per_minute=args.max_prompts_per_minute,
         )
 
-        if args.command == "start":
-            return cmd_start(manager, args)
-        elif args.command == "next":
-            return cmd_next(manager, args)
-        elif args.command == "add":
-            return cmd_add(manager, args)
-        elif args.command == "edit":
-            return cmd_edit(manager, args)
-        elif args.command == "status":
-            return cmd_status(manager, args)
-        elif args.command == "cancel":
-            return cmd_cancel(manager, args)
-        elif args.command == "delete":
-            return cmd_delete(manager, args)
-        elif args.command == "retry":
-            return cmd_retry(manager, args)
-        elif args.command == "path":
-            return cmd_path(manager, args)
-        elif args.command == "list":
-            return cmd_list(manager, args)
-        elif args.command == "test":
-            return cmd_test(manager, args)
-        else:
-            print(f"Unknown command: {args.command}")
-            return 1
+        return handler(manager, args)
 
     except KeyboardInterrupt:
         print("\nInterrupted by user")
@@ -321,6 +348,8 @@ def cmd_next(manager: QueueManager, args) -> int:
 
 def cmd_add(manager: QueueManager, args) -> int:
     """Add a prompt to the queue."""
+    from .models import QueuedPrompt
+
     prompt = QueuedPrompt(
         content=args.prompt,
         working_directory=args.working_dir,
@@ -328,11 +357,11 @@ def cmd_add(manager: QueueManager, args) -> int:
         context_files=args.context_files,
         max_retries=args.max_retries,
         estimated_tokens=args.estimated_tokens,
-        permission_mode=getattr(args, "permission_mode", None),
-        allowed_tools=getattr(args, "allowed_tools", None),
-        timeout=getattr(args, "prompt_timeout", None),
-        model=getattr(args, "model", None),
-        bookmark=getattr(args, "bookmark", None),
+        permission_mode=args.permission_mode,
+        allowed_tools=args.allowed_tools,
+        timeout=args.prompt_timeout,
+        model=args.model,
+        bookmark=args.bookmark,
     )
 
     success = manager.add_prompt(prompt)
@@ -341,6 +370,12 @@ def cmd_add(manager: QueueManager, args) -> int:
 
 def cmd_edit(manager: QueueManager, args) -> int:
     """Open $EDITOR to compose a prompt or edit an existing one."""
+    import tempfile
+    from pathlib import Path
+
+    from .models import QueuedPrompt
+    from .storage import MarkdownPromptParser
+
     # Check if EDITOR is set
     editor = os.environ.get("EDITOR")
     if not editor:
@@ -351,12 +386,13 @@ def cmd_edit(manager: QueueManager, args) -> int:
         return 1
 
     # Check if we're editing an existing prompt
-    prompt_id = getattr(args, "prompt_id", None)
+    prompt_id = args.prompt_id
     is_editing_existing = prompt_id is not None
+    existing_path: Optional[Path] = None
 
     if is_editing_existing:
         # Get the path of the existing prompt
-        existing_path = manager.get_prompt_path(prompt_id)
+        existing_path = manager.storage.get_prompt_path(prompt_id)
         if not existing_path:
             print(f"Error: Prompt {prompt_id} not found", file=sys.stderr)
             return 1
@@ -370,15 +406,11 @@ def cmd_edit(manager: QueueManager, args) -> int:
             return 1
 
         # Create a temporary file with the existing prompt content
-        with tempfile.NamedTemporaryFile(
-            mode="w",
-            suffix=".md",
-            delete=False,
-            prefix=prompt_id + "-",
-        ) as tmp_file:
-            tmp_path = Path(tmp_file.name)
-            # Write the existing prompt to temp file
-            MarkdownPromptParser.write_prompt_file(existing_prompt, tmp_path)
+        fd, tmp_name = tempfile.mkstemp(suffix=".md", prefix=prompt_id + "-")
+        os.close(fd)
+        tmp_path = Path(tmp_name)
+        # Write the existing prompt to temp file
+        MarkdownPromptParser.write_prompt_file(existing_prompt, tmp_path)
     else:
         # Create a new temporary prompt with all the defaults
         prompt = QueuedPrompt(
@@ -388,37 +420,36 @@ def cmd_edit(manager: QueueManager, args) -> int:
             context_files=args.context_files,
             max_retries=args.max_retries,
             estimated_tokens=args.estimated_tokens,
-            permission_mode=getattr(args, "permission_mode", None),
-            allowed_tools=getattr(args, "allowed_tools", None),
-            timeout=getattr(args, "prompt_timeout", None),
-            model=getattr(args, "model", None),
-            bookmark=getattr(args, "bookmark", None),
+            permission_mode=args.permission_mode,
+            allowed_tools=args.allowed_tools,
+            timeout=args.prompt_timeout,
+            model=args.model,
+            bookmark=args.bookmark,
         )
 
-    # Create temporary file with the prompt template
-    with tempfile.NamedTemporaryFile(
-        mode="w",
-        suffix=".md",
-        delete=False,
-        prefix=prompt.id + "-",
-    ) as tmp_file:
-        tmp_path = Path(tmp_file.name)
-        # Write the template using the existing parser in template mode
-        MarkdownPromptParser.write_prompt_file(prompt, tmp_path, template_mode=True)
+        # Write the rendered template straight to the temporary file descriptor
+        fd, tmp_name = tempfile.mkstemp(suffix=".md", prefix=prompt.id + "-")
+        try:
+            os.write(fd, MarkdownPromptParser.render_template(prompt).encode("utf-8"))
+        finally:
+            os.close(fd)
+        tmp_path = Path(tmp_name)
 
     try:
-        # Get mtime before opening editor
-        mtime_before = tmp_path.stat().st_mtime
+        # Take a nanosecond mtime + size signature before opening the editor;
+        # the size also catches edits on filesystems with coarse timestamps
+        stat_before = os.stat(tmp_path)
+        signature_before = (stat_before.st_mtime_ns, stat_before.st_size)
 
         # Open the editor
-        result = subprocess.run([editor, str(tmp_path)])
-        if result.returncode != 0:
-            print(f"Editor exited with code {result.returncode}", file=sys.stderr)
+        returncode = spawn_editor(editor, tmp_path)()
+        if returncode != 0:
+            print(f"Editor exited with code {returncode}", file=sys.stderr)
             return 1
 
         # Check if file was modified
-        mtime_after = tmp_path.stat().st_mtime
-        if mtime_after == mtime_before:
+        stat_after = os.stat(tmp_path)
+        if (stat_after.st_mtime_ns, stat_after.st_size) == signature_before:
             print("File was not modified, aborting")
             return 0
 
@@ -436,7 +467,8 @@ def cmd_edit(manager: QueueManager, args) -> int:
         if is_editing_existing:
             # Update the existing prompt file with the edited content
             # Delete the original file
-            existing_path.unlink()
+            if existing_path is not None:
+                existing_path.unlink()
 
             # Move the temp file to the appropriate location
             success = manager.storage.add_prompt_from_markdown(tmp_path)
@@ -458,88 +490,141 @@ def cmd_edit(manager: QueueManager, args) -> int:
 
     finally:
         # Clean up temp file if it still exists (add_prompt_from_markdown moves it)
-        if tmp_path.exists():
-            tmp_path.unlink()
+        tmp_path.unlink(missing_ok=True)
+
+
+def spawn_editor(editor: str, file_path) -> Callable[[], int]:
+    """Start the editor on a file and return a function waiting for its exit code.
+
+    If the wait is interrupted, e.g. by Ctrl-C, the editor is terminated and
+    reaped before the exception propagates.
+    """
+    if not hasattr(os, "posix_spawnp"):
+        import subprocess
+
+        process = subprocess.Popen([editor, str(file_path)])
+
+        def wait_process() -> int:
+            finished = False
+            try:
+                returncode = process.wait()
+                finished = True
+                return returncode
+            finally:
+                if not finished:
+                    process.terminate()
+                    process.wait()
+
+        return wait_process
+
+    # posix_spawnp avoids the fork and fd cleanup work of subprocess.Popen
+    pid = os.posix_spawnp(editor, [editor, str(file_path)], os.environ)
+
+    def wait() -> int:
+        finished = False
+        try:
+            _, status = os.waitpid(pid, 0)
+            finished = True
+        finally:
+            if not finished:
+                try:
+                    os.kill(pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+                os.waitpid(pid, 0)
+        if os.WIFSIGNALED(status):
+            return -os.WTERMSIG(status)
+        return os.WEXITSTATUS(status)
+
+    return wait
 
 
 def cmd_status(manager: QueueManager, args) -> int:
     """Show queue status."""
+    from .models import PromptStatus
+
     state = manager.get_status()
-    stats = state.get_stats()
 
     if args.json:
-        print(json.dumps(stats, indent=2))
+        print(json.dumps(state.get_stats(), indent=2))
         return 0
 
+    # The breakdown and the detailed view share a single bucketing pass,
+    # which an empty queue skips altogether
+    by_status = state.prompts_by_status if state.prompts else {}
+
     print("Claude Code Queue Status")
     print("=" * 40)
-    print(f"Total prompts: {stats['total_prompts']}")
-    print(f"Total processed: {stats['total_processed']}")
-    print(f"Failed count: {stats['failed_count']}")
-    print(f"Rate limited count: {stats['rate_limited_count']}")
+    print(f"Total prompts: {len(state.prompts)}")
+    print(f"Total processed: {state.total_processed}")
+    print(f"Failed count: {state.failed_count}")
+    print(f"Rate limited count: {state.rate_limited_count}")
 
-    if stats["last_processed"]:
-        last_processed = datetime.fromisoformat(stats["last_processed"])
-        print(f"Last processed: {last_processed.strftime('%Y-%m-%d %H:%M:%S')}")
+    if state.last_processed:
+        print(f"Last processed: {state.last_processed.strftime('%Y-%m-%d %H:%M:%S')}")
 
     print("\nStatus breakdown:")
-    for status, count in stats["status_counts"].items():
+    for status, count in state.get_status_counts(by_status).items():
         if count > 0:
             print(f"  {status}: {count}")
 
-    if stats["current_rate_limit"]["is_rate_limited"]:
-        reset_time = stats["current_rate_limit"]["reset_time"]
-        if reset_time:
-            reset_dt = datetime.fromisoformat(reset_time)
-            print(f"\nRate limited until: {reset_dt.strftime('%Y-%m-%d %H:%M:%S')}")
+    rate_limit = state.current_rate_limit
+    if rate_limit and rate_limit.is_rate_limited and rate_limit.reset_time:
+        print(
+            f"\nRate limited until: {rate_limit.reset_time.strftime('%Y-%m-%d %H:%M:%S')}"
+        )
 
     if args.detailed:
         # Show failed prompts sorted by creation date
-        failed_prompts = [p for p in state.prompts if p.status == PromptStatus.FAILED]
+        failed_prompts = by_status.get(PromptStatus.FAILED, [])
 
         if failed_prompts:
             print("\nFailed Prompts (sorted by creation date):")
             print("-" * 80)
+            lines = []
             for prompt in sorted(failed_prompts, key=lambda p: p.created_at):
-                print(f"❌ {prompt.id} (P{prompt.priority})")
-                print(
+                lines.append(f"❌ {prompt.id} (P{prompt.priority})")
+                lines.append(
                     f"   {prompt.content[:70]}{'...' if len(prompt.content) > 70 else ''}"
                 )
-                print(f"   Created: {prompt.created_at.strftime('%Y-%m-%d %H:%M:%S')}")
-                print(f"   Retries: {prompt.retry_count}/{prompt.max_retries}")
-                print(f"   Working directory: {prompt.working_directory}")
+                lines.append(
+                    f"   Created: {prompt.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
+                )
+                lines.append(f"   Retries: {prompt.retry_count}/{prompt.max_retries}")
+                lines.append(f"   Working directory: {prompt.working_directory}")
                 if prompt.execution_log:
-                    # Show last log entry
-                    log_lines = prompt.execution_log.strip().split("\n")
-                    if log_lines:
-                        print(f"   Last log: {log_lines[-1]}")
-                print()
+                    # Show last log entry without splitting the whole log
+                    log = prompt.execution_log.rstrip()
+                    last_entry = log[log.rfind("\n") + 1 :]
+                    lines.append(f"   Last log: {last_entry}")
+                lines.append("")
+            sys.stdout.write("\n".join(lines) + "\n")
         else:
             print("\nNo failed prompts")
 
-        # Also show other prompts for context
+        # Also show other prompts for context; the sort is stable, so equal
+        # priorities stay in queue order
         other_prompts = [p for p in state.prompts if p.status != PromptStatus.FAILED]
         if other_prompts:
             print("\nOther Prompts (sorted by priority):")
             print("-" * 80)
+            lines = []
             for prompt in sorted(other_prompts, key=lambda p: p.priority):
-                status_icon = {
-                    PromptStatus.QUEUED: "⏳",
-                    PromptStatus.EXECUTING: "▶️",
-                    PromptStatus.COMPLETED: "✅",
-                    PromptStatus.CANCELLED: "🚫",
-                }.get(prompt.status, "❓")
-
-                print(
+                status_icon = _STATUS_ICONS.get(prompt.status.value, "❓")
+
+                lines.append(
                     f"{status_icon} {prompt.id} (P{prompt.priority}) - {prompt.status.value}"
                 )
-                print(
+                lines.append(
                     f"   {prompt.content[:70]}{'...' if len(prompt.content) > 70 else ''}"
                 )
-                print(f"   Working directory: {prompt.working_directory}")
+                lines.append(f"   Working directory: {prompt.working_directory}")
                 if prompt.retry_count > 0:
-                    print(f"   Retries: {prompt.retry_count}/{prompt.max_retries}")
-                print()
+                    lines.append(
+                        f"   Retries: {prompt.retry_count}/{prompt.max_retries}"
+                    )
+                lines.append("")
+            sys.stdout.write("\n".join(lines) + "\n")
 
     return 0
 
@@ -552,17 +637,13 @@ def cmd_cancel(manager: QueueManager, args) -> int:
 
 def cmd_delete(manager: QueueManager, args) -> int:
     """Permanently delete one or more prompts from storage."""
-    all_success = True
-    for prompt_id in args.prompt_ids:
-        success = manager.delete_prompt(prompt_id)
-        if not success:
-            all_success = False
-    return 0 if all_success else 1
+    success = manager.delete_prompts(args.prompt_ids)
+    return 0 if success else 1
 
 
 def cmd_retry(manager: QueueManager, args) -> int:
     """Retry a failed prompt by creating a new task with the same parameters."""
-    delete_original = getattr(args, "delete", False)
+    delete_original = args.delete
     success = manager.retry_prompt(args.prompt_id, delete_after_success=delete_original)
     return 0 if success else 1
 
@@ -571,17 +652,10 @@ def cmd_path(manager: QueueManager, args) -> int:
     """Get the file path for a prompt."""
     # Handle special case: "next" returns the path of the next prompt to be processed
     if args.prompt_id == "next":
-        next_prompt_id = manager.get_next_prompt_id()
-        if next_prompt_id:
-            file_path = manager.get_prompt_path(next_prompt_id)
-            if file_path:
-                print(file_path)
-                return 0
-            else:
-                print(
-                    f"Path not found for next prompt {next_prompt_id}", file=sys.stderr
-                )
-                return 1
+        file_path = manager.get_next_prompt_path()
+        if file_path:
+            print(file_path)
+            return 0
         else:
             print("No prompts in queue", file=sys.stderr)
             return 1
@@ -598,30 +672,30 @@ def cmd_path(manager: QueueManager, args) -> int:
 
 def cmd_list(manager: QueueManager, args) -> int:
     """List prompts."""
-    include_completed = getattr(args, "all", False)
+    from .models import PromptStatus
+
+    include_completed = args.all
     state = manager.get_status(include_completed=include_completed)
     prompts = state.prompts
 
     if args.status:
-        status_filter = PromptStatus(args.status)
-        prompts = [p for p in prompts if p.status == status_filter]
+        prompts = state.get_prompts_with_status(PromptStatus(args.status))
 
     if args.json:
-        prompt_data = []
-        for prompt in prompts:
-            prompt_data.append(
-                {
-                    "id": prompt.id,
-                    "content": prompt.content,
-                    "status": prompt.status.value,
-                    "priority": prompt.priority,
-                    "working_directory": prompt.working_directory,
-                    "created_at": prompt.created_at.isoformat(),
-                    "retry_count": prompt.retry_count,
-                    "max_retries": prompt.max_retries,
-                }
-            )
-        print(json.dumps(prompt_data, indent=2))
+        # Serialise one prompt at a time instead of building the whole list
+        _write_json_array(
+            {
+                "id": prompt.id,
+                "content": prompt.content,
+                "status": prompt.status.value,
+                "priority": prompt.priority,
+                "working_directory": prompt.working_directory,
+                "created_at": prompt.created_at.isoformat(),
+                "retry_count": prompt.retry_count,
+                "max_retries": prompt.max_retries,
+            }
+            for prompt in prompts
+        )
     else:
         if not prompts:
             print("No prompts found")
@@ -629,29 +703,37 @@ def cmd_list(manager: QueueManager, args) -> int:
 
         print(f"Found {len(prompts)} prompts:")
         print("-" * 80)
+        lines = []
         for prompt in sorted(prompts, key=lambda p: p.priority):
-            status_icon = {
-                PromptStatus.QUEUED: "⏳",
-                PromptStatus.EXECUTING: "▶️",
-                PromptStatus.COMPLETED: "✅",
-                PromptStatus.FAILED: "❌",
-                PromptStatus.CANCELLED: "🚫",
-            }.get(prompt.status, "❓")
+            status_icon = _STATUS_ICONS.get(prompt.status.value, "❓")
 
             model_str = f" | {prompt.model}" if prompt.model else ""
-            print(
+            lines.append(
                 f"{status_icon} {prompt.id} | P{prompt.priority} | {prompt.status.value}{model_str}"
             )
-            print(f"   Working directory: {prompt.working_directory}")
-            print(f"   Created: {prompt.created_at.strftime('%Y-%m-%d %H:%M:%S')}")
-            print(
+            lines.append(f"   Working directory: {prompt.working_directory}")
+            lines.append(
+                f"   Created: {prompt.created_at.strftime('%Y-%m-%d %H:%M:%S')}"
+            )
+            lines.append(
                 f"   Command: {prompt.content[:70]}{'...' if len(prompt.content) > 70 else ''}"
             )
-            print()
+            lines.append("")
+        sys.stdout.write("\n".join(lines) + "\n")
 
     return 0
 
 
+def _write_json_array(items) -> None:
+    """Write items to stdout as an indented JSON array, one item at a time."""
+    empty = True
+    for item in items:
+        sys.stdout.write("[\n  " if empty else ",\n  ")
+        sys.stdout.write(json.dumps(item, indent=2).replace("\n", "\n  "))
+        empty = False
+    sys.stdout.write("[]\n" if empty else "\n]\n")
+
+
 def cmd_test(manager: QueueManager, args) -> int:
     """Test Claude Code connection."""
     is_working, message = manager.claude_interface.test_connection()
@@ -659,5 +741,33 @@ def cmd_test(manager: QueueManager, args) -> int:
     return 0 if is_working else 1
 
 
+# Command name -> (help text, parser builder, handler)
+COMMANDS = {
+    "start": ("Start the queue processor", build_start_parser, cmd_start),
+    "next": (
+        "Process only the next queue item and stop",
+        build_next_parser,
+        cmd_next,
+    ),
+    "add": ("Add a prompt to the queue", build_add_parser, cmd_add),
+    "edit": (
+        "Open $EDITOR to compose a prompt or edit an existing one",
+        build_edit_parser,
+        cmd_edit,
+    ),
+    "status": ("Show queue status", build_status_parser, cmd_status),
+    "cancel": ("Cancel a prompt", build_cancel_parser, cmd_cancel),
+    "delete": (
+        "Permanently delete one or more prompts from storage",
+        build_delete_parser,
+        cmd_delete,
+    ),
+    "retry": ("Retry a failed prompt", build_retry_parser, cmd_retry),
+    "path": ("Get the file path for a prompt", build_path_parser, cmd_path),
+    "list": ("List prompts", build_list_parser, cmd_list),
+    "test": ("Test Claude Code connection", build_test_parser, cmd_test),
+}
+
+
 if __name__ == "__main__":
     main()
@@ -2,11 +2,30 @@
 Data structures for Claude Code Queue system.
 """
 
+import re
+import sys
+import time
 import uuid
+from collections import Counter
 from dataclasses import dataclass, field
 from datetime import datetime
 from enum import Enum
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+# __slots__ for the dataclasses where supported (Python 3.10+): smaller
+# instances and faster attribute access than a per-instance __dict__
+_SLOTS: Dict[str, bool] = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+# Number of the last change to any prompt list or prompt status. Indexes over
+# QueueState.prompts record the number they were built at and are rebuilt as
+# soon as it has moved on
+_last_change = [0]
+
+
+def _next_change() -> int:
+    """Record a change to a prompt list or a prompt status and return its number."""
+    _last_change[0] += 1
+    return _last_change[0]
 
 
 class PromptStatus(Enum):
@@ -19,17 +38,29 @@ class PromptStatus(Enum):
     CANCELLED = "cancelled"
 
 
-VALID_PERMISSION_MODES = {
-    "acceptEdits",
-    "bypassPermissions",
-    "default",
-    "delegate",
-    "dontAsk",
-    "plan",
-}
+class ResultKind(Enum):
+    """How the queue handles a finished execution."""
+
+    SUCCESS = "success"
+    NO_CHANGES = "no_changes"
+    RATE_LIMITED = "rate_limited"
+    FAILED = "failed"
+
+
+VALID_PERMISSION_MODES = frozenset(
+    {
+        "acceptEdits",
+        "bypassPermissions",
+        "default",
+        "delegate",
+        "dontAsk",
+        "plan",
+    }
+)
+_VALID_PERMISSION_MODES_STR = ", ".join(sorted(VALID_PERMISSION_MODES))
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class QueuedPrompt:
     """Represents a prompt in the queue."""
 
@@ -59,12 +90,19 @@ class QueuedPrompt:
             if self.permission_mode not in VALID_PERMISSION_MODES:
                 raise ValueError(
                     f"Invalid permission_mode: {self.permission_mode}. "
-                    f"Must be one of: {', '.join(sorted(VALID_PERMISSION_MODES))}"
+                    f"Must be one of: {_VALID_PERMISSION_MODES_STR}"
                 )
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name == "status":
+            # Also covers statuses assigned directly rather than through
+            # QueueState.set_status
+            _next_change()
+        object.__setattr__(self, name, value)
+
     def add_log(self, message: str) -> None:
         """Add a log entry with timestamp."""
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        timestamp = time.strftime("%Y-%m-%d %H:%M:%S")
         self.execution_log += f"[{timestamp}] {message}\n"
 
     def can_retry(self) -> bool:
@@ -74,7 +112,21 @@ class QueuedPrompt:
         )
 
 
-@dataclass
+# Common rate limit indicators in Claude Code responses
+_RATE_LIMIT_INDICATORS = [
+    "usage limit reached",
+    "rate limit",
+    "too many requests",
+    "quota exceeded",
+    "limit exceeded",
+]
+# Single case-insensitive pass instead of lowercasing and scanning per indicator
+_RATE_LIMIT_RE = re.compile(
+    "|".join(map(re.escape, _RATE_LIMIT_INDICATORS)), re.IGNORECASE
+)
+
+
+@dataclass(**_SLOTS)
 class RateLimitInfo:
     """Information about rate limiting from Claude Code response."""
 
@@ -86,20 +138,7 @@ class RateLimitInfo:
     @classmethod
     def from_claude_response(cls, response_text: str) -> "RateLimitInfo":
         """Parse rate limit info from Claude Code response."""
-        # Common rate limit indicators in Claude Code responses
-        rate_limit_indicators = [
-            "usage limit reached",
-            "rate limit",
-            "too many requests",
-            "quota exceeded",
-            "limit exceeded",
-        ]
-
-        is_limited = any(
-            indicator in response_text.lower() for indicator in rate_limit_indicators
-        )
-
-        if is_limited:
+        if _RATE_LIMIT_RE.search(response_text):
             return cls(
                 is_rate_limited=True,
                 limit_message=response_text.strip(),
@@ -109,73 +148,287 @@ class RateLimitInfo:
         return cls(is_rate_limited=False)
 
 
-@dataclass
+@dataclass(**_SLOTS)
+class RequestBucket:
+    """Token bucket limiting how many prompts are started per minute.
+
+    Holds up to max(1, per_minute) tokens and refills at per_minute / 60 tokens
+    per second; starting a prompt takes one token. Times are time.monotonic()
+    seconds, pass now to reuse one reading.
+    """
+
+    per_minute: float
+    tokens: float = field(init=False)
+    updated: float = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def capacity(self) -> float:
+        return max(1.0, self.per_minute)
+
+    def _refill(self, now: Optional[float]) -> None:
+        if now is None:
+            now = time.monotonic()
+        elapsed = max(0.0, now - self.updated)
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.per_minute / 60)
+        self.updated = now
+
+    def wait_time(self, now: Optional[float] = None) -> float:
+        """Seconds until a prompt may be started, 0 if one may start now."""
+        self._refill(now)
+        # Tolerate the rounding of the elapsed * rate refill, which can leave
+        # a bucket that is due a whole token just short of it
+        if self.tokens >= 1 - 1e-9:
+            return 0.0
+        return (1 - self.tokens) * 60 / self.per_minute
+
+    def consume(self, now: Optional[float] = None) -> None:
+        """Take the token for a prompt being started."""
+        self._refill(now)
+        self.tokens -= 1
+
+
+# Scheduling rank per status: executing prompts are continued before queued
+# ones; statuses missing here are never scheduled again
+_SCHEDULE_RANK = {PromptStatus.EXECUTING: 0, PromptStatus.QUEUED: 1}
+
+
+class _PromptList(List[QueuedPrompt]):
+    """The list behind QueueState.prompts, numbering the changes made to it.
+
+    version is the number of the last change made through any list method,
+    item assignment or deletion, so indexes over the list can tell when they
+    are stale.
+    """
+
+    __slots__ = ("version",)
+
+    def __new__(cls, *args: Any, **kwargs: Any) -> "_PromptList":
+        self = super().__new__(cls, *args, **kwargs)
+        self.version = _next_change()
+        return self
+
+    def append(self, *args: Any) -> None:
+        self.version = _next_change()
+        super().append(*args)
+
+    def extend(self, *args: Any) -> None:
+        self.version = _next_change()
+        super().extend(*args)
+
+    def insert(self, *args: Any) -> None:
+        self.version = _next_change()
+        super().insert(*args)
+
+    def remove(self, *args: Any) -> None:
+        self.version = _next_change()
+        super().remove(*args)
+
+    def pop(self, *args: Any) -> QueuedPrompt:
+        self.version = _next_change()
+        return super().pop(*args)
+
+    def clear(self) -> None:
+        self.version = _next_change()
+        super().clear()
+
+    def sort(self, *args: Any, **kwargs: Any) -> None:
+        self.version = _next_change()
+        super().sort(*args, **kwargs)
+
+    def reverse(self) -> None:
+        self.version = _next_change()
+        super().reverse()
+
+    def __setitem__(self, *args: Any) -> None:
+        self.version = _next_change()
+        super().__setitem__(*args)
+
+    def __delitem__(self, *args: Any) -> None:
+        self.version = _next_change()
+        super().__delitem__(*args)
+
+    def __iadd__(self, *args: Any) -> "_PromptList":
+        self.version = _next_change()
+        return super().__iadd__(*args)
+
+    def __imul__(self, *args: Any) -> "_PromptList":
+        self.version = _next_change()
+        return super().__imul__(*args)
+
+
+@dataclass(**_SLOTS)
 class QueueState:
     """Overall state of the queue system."""
 
-    prompts: List[QueuedPrompt] = field(default_factory=list)
+    # Always a _PromptList; plain lists are converted on assignment
+    prompts: List[QueuedPrompt] = field(default_factory=_PromptList)
     last_processed: Optional[datetime] = None
     total_processed: int = 0
     failed_count: int = 0
     rate_limited_count: int = 0
     current_rate_limit: Optional[RateLimitInfo] = None
 
-    def is_rate_limited(self) -> bool:
-        """Check if the queue is currently rate limited."""
+    # Prompt id -> prompt and the version of self.prompts it was built from;
+    # rebuilt whenever the list is replaced or changed
+    _by_id: Dict[str, QueuedPrompt] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _by_id_version: int = field(default=0, init=False, repr=False, compare=False)
+    # Prompts per status and the change number they were counted at; counted
+    # again after any prompt list change or status assignment
+    _status_counts: Counter = field(
+        default_factory=Counter, init=False, repr=False, compare=False
+    )
+    _status_counts_version: int = field(
+        default=0, init=False, repr=False, compare=False
+    )
+    # The prompts per status in queue order, kept the same way
+    _status_buckets: Dict[PromptStatus, List[QueuedPrompt]] = field(
+        default_factory=dict, init=False, repr=False, compare=False
+    )
+    _status_buckets_version: int = field(
+        default=0, init=False, repr=False, compare=False
+    )
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name == "prompts" and not isinstance(value, _PromptList):
+            value = _PromptList(value)
+        object.__setattr__(self, name, value)
+
+    def is_rate_limited(self, now: Optional[datetime] = None) -> bool:
+        """Check if the queue is currently rate limited.
+
+        Pass now to reuse one timestamp across the checks of a queue tick.
+        """
         if not self.current_rate_limit:
             return False
         if not self.current_rate_limit.is_rate_limited:
             return False
         # Check if rate limit has expired
         if self.current_rate_limit.reset_time:
-            return datetime.now() < self.current_rate_limit.reset_time
+            if now is None:
+                now = datetime.now()
+            return now < self.current_rate_limit.reset_time
         return True
 
-    def clear_rate_limit_if_expired(self) -> bool:
+    def clear_rate_limit_if_expired(self, now: Optional[datetime] = None) -> bool:
         """Clear rate limit if it has expired. Returns True if cleared."""
         if not self.current_rate_limit or not self.current_rate_limit.is_rate_limited:
             return False
-        if (
-            self.current_rate_limit.reset_time
-            and datetime.now() >= self.current_rate_limit.reset_time
-        ):
-            self.current_rate_limit = None
-            return True
+        if self.current_rate_limit.reset_time:
+            if now is None:
+                now = datetime.now()
+            if now >= self.current_rate_limit.reset_time:
+                self.current_rate_limit = None
+                return True
         return False
 
-    def get_next_prompt(self) -> Optional[QueuedPrompt]:
+    def get_next_prompt(self, now: Optional[datetime] = None) -> Optional[QueuedPrompt]:
         """Get the next prompt to execute (highest priority, not rate limited)."""
         # Don't return any prompt if we're rate limited
-        if self.is_rate_limited():
-            return None
-
-        # "continue" with executing prompts first
-        executing_prompts: List[QueuedPrompt] = [
-            prompt for prompt in self.prompts if prompt.status == PromptStatus.EXECUTING
-        ]
-        if executing_prompts:
-            return min(executing_prompts, key=lambda prompt: prompt.priority)
-
-        # next check for queued prompts
-        queued_prompts: List[QueuedPrompt] = [
-            prompt for prompt in self.prompts if prompt.status == PromptStatus.QUEUED
-        ]
-
-        if not queued_prompts:
+        if self.is_rate_limited(now):
             return None
 
-        # Return highest priority prompt (lowest number)
-        return min(queued_prompts, key=lambda prompt: prompt.priority)
+        # "continue" with executing prompts first, then the highest priority
+        # (lowest number) queued prompt. One pass over the list; statuses and
+        # priorities are changed in place throughout the manager, so nothing
+        # is cached between calls. Ties go to the earlier prompt in the list
+        best: Optional[QueuedPrompt] = None
+        best_key: Optional[Tuple[int, int]] = None
+        for prompt in self.prompts:
+            rank = _SCHEDULE_RANK.get(prompt.status)
+            if rank is None:
+                continue
+            key = (rank, prompt.priority)
+            if best_key is None or key < best_key:
+                best, best_key = prompt, key
+        return best
+
+    def _prompts_version(self) -> int:
+        """Number of the last change to self.prompts, unique across lists."""
+        prompts = self.prompts
+        assert isinstance(prompts, _PromptList)
+        return prompts.version
+
+    def _sync_by_id(self) -> Dict[str, QueuedPrompt]:
+        """Return the id index, rebuilding it if self.prompts changed."""
+        version = self._prompts_version()
+        if self._by_id_version != version:
+            self._by_id = {}
+            for prompt in self.prompts:
+                # First occurrence wins, as with a linear search
+                self._by_id.setdefault(prompt.id, prompt)
+            self._by_id_version = version
+        return self._by_id
+
+    def _sync_status_counts(self) -> Counter:
+        """Return the per-status counts, recounting after any change."""
+        if self._status_counts_version != _last_change[0]:
+            self._status_counts = Counter(prompt.status for prompt in self.prompts)
+            self._status_counts_version = _last_change[0]
+        return self._status_counts
+
+    def _sync_status_buckets(self) -> Dict[PromptStatus, List[QueuedPrompt]]:
+        """Return the prompts per status, bucketing them again after any change."""
+        if self._status_buckets_version != _last_change[0]:
+            buckets: Dict[PromptStatus, List[QueuedPrompt]] = {
+                status: [] for status in PromptStatus
+            }
+            for prompt in self.prompts:
+                buckets[prompt.status].append(prompt)
+            self._status_buckets = buckets
+            self._status_buckets_version = _last_change[0]
+        return self._status_buckets
+
+    def set_status(self, prompt: QueuedPrompt, status: PromptStatus) -> None:
+        """Change the status of a prompt in this queue."""
+        prompt.status = status
+
+    def get_prompts_with_status(self, status: PromptStatus) -> List[QueuedPrompt]:
+        """Prompts currently in the given status, in queue order.
+
+        Returns a new list, so callers may change statuses while iterating.
+        """
+        return list(self._sync_status_buckets()[status])
+
+    def count_status(self, status: PromptStatus) -> int:
+        """Number of prompts currently in the given status."""
+        return self._sync_status_counts()[status]
 
     def add_prompt(self, prompt: QueuedPrompt) -> None:
         """Add a prompt to the queue."""
+        index_in_sync = self._by_id_version == self._prompts_version()
         self.prompts.append(prompt)
 
+        if index_in_sync:
+            self._by_id.setdefault(prompt.id, prompt)
+            self._by_id_version = self._prompts_version()
+
     def remove_prompt(self, prompt_id: str) -> bool:
         """Remove a prompt from the queue."""
+        prompt = self.get_prompt(prompt_id)
+        if prompt is None:
+            return False
+
+        for position, candidate in enumerate(self.prompts):
+            if candidate is prompt:
+                del self.prompts[position]
+                break
+
+        # Patch the id index rather than rebuilding it
+        self._by_id.pop(prompt_id, None)
+        self._by_id_version = self._prompts_version()
+        return True
+
+    def remove_prompts(self, prompt_ids: Set[str]) -> int:
+        """Remove several prompts in one pass. Returns the number removed."""
         original_count = len(self.prompts)
-        self.prompts = [p for p in self.prompts if p.id != prompt_id]
-        return len(self.prompts) < original_count
+        self.prompts = [p for p in self.prompts if p.id not in prompt_ids]
+        return original_count - len(self.prompts)
 
     def delete_prompt(self, prompt_id: str) -> bool:
         """Permanently delete a prompt from the queue (hard delete)."""
@@ -183,26 +436,49 @@ class QueueState:
 
     def get_prompt(self, prompt_id: str) -> Optional[QueuedPrompt]:
         """Get a prompt by ID."""
-        for prompt in self.prompts:
-            if prompt.id == prompt_id:
-                return prompt
-        return None
+        return self._sync_by_id().get(prompt_id)
+
+    @property
+    def prompts_by_status(self) -> Dict[PromptStatus, List[QueuedPrompt]]:
+        """Prompts bucketed by status, each bucket in queue order."""
+        return {
+            status: list(bucket)
+            for status, bucket in self._sync_status_buckets().items()
+        }
+
+    def get_status_counts(
+        self, by_status: Optional[Dict[PromptStatus, List[QueuedPrompt]]] = None
+    ) -> Dict[str, int]:
+        """Count prompts per status value.
+
+        Completed and failed prompts use the persistent counters. Pass the
+        result of prompts_by_status to reuse an existing bucketing pass.
+        Otherwise the running counts are used, which are recounted after any
+        change to the prompts or their statuses.
+        """
+        if by_status is None:
+            active_counts = self._sync_status_counts()
+        else:
+            active_counts = Counter(
+                {status: len(bucket) for status, bucket in by_status.items()}
+            )
 
-    def get_stats(self) -> Dict[str, Any]:
-        """Get queue statistics."""
         status_counts = {}
         for status in PromptStatus:
-            if status == PromptStatus.COMPLETED:
+            if status is PromptStatus.COMPLETED:
                 # Use persistent counter for completed prompts
                 status_counts[status.value] = self.total_processed
-            elif status == PromptStatus.FAILED:
+            elif status is PromptStatus.FAILED:
                 # Use persistent counter for failed prompts
                 status_counts[status.value] = self.failed_count
             else:
                 # Count active prompts for other statuses
-                status_counts[status.value] = len(
-                    [p for p in self.prompts if p.status == status]
-                )
+                status_counts[status.value] = active_counts[status]
+        return status_counts
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue statistics."""
+        status_counts = self.get_status_counts()
 
         return {
             "total_prompts": len(self.prompts),
@@ -228,7 +504,7 @@ class QueueState:
         }
 
 
-@dataclass
+@dataclass(**_SLOTS)
 class ExecutionResult:
     """Result of executing a prompt."""
 
@@ -247,3 +523,14 @@ class ExecutionResult:
     def is_rate_limited(self) -> bool:
         """Check if this execution was rate limited."""
         return self.rate_limit_info is not None and self.rate_limit_info.is_rate_limited
+
+    @property
+    def kind(self) -> ResultKind:
+        """Classify the result for the queue manager's result handlers."""
+        if self.success:
+            if self.no_changes_detected:
+                return ResultKind.NO_CHANGES
+            return ResultKind.SUCCESS
+        if self.is_rate_limited:
+            return ResultKind.RATE_LIMITED
+        return ResultKind.FAILED
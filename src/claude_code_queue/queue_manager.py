@@ -2,38 +2,110 @@
 Queue manager with execution loop.
 """
 
+import math
 import shutil
 import signal
 import sys
-import time
-from datetime import datetime, timedelta
-from typing import Any, Callable, Dict, Optional
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from .claude_interface import ClaudeCodeInterface
 from .jj_integration import JujutsuIntegration
-from .models import ExecutionResult, PromptStatus, QueuedPrompt, QueueState
+from .models import (
+    ExecutionResult,
+    PromptStatus,
+    QueuedPrompt,
+    QueueState,
+    RequestBucket,
+    ResultKind,
+)
 from .storage import QueueStorage
 
 
 class QueueManager:
     """Manages the queue execution lifecycle."""
 
+    # Number of recent execution times averaged by _calculate_sleep_interval
+    EXECUTION_TIME_SAMPLES = 10
+
     def __init__(
         self,
         storage_dir: str = "~/.claude-queue",
         claude_command: str = "claude",
         check_interval: int = 30,
         timeout: int = 3600,
+        register_signals: bool = False,
+        max_prompts_per_minute: Optional[float] = None,
     ):
         self.storage = QueueStorage(storage_dir)
-        self.claude_interface = ClaudeCodeInterface(claude_command, timeout)
+        self.claude_command = claude_command
+        self.timeout = timeout
+        # Built on first use: most commands never talk to Claude
+        self._claude_interface: Optional[ClaudeCodeInterface] = None
         self.check_interval = check_interval
         self.running = False
         self.state: Optional[QueueState] = None
         self.last_status_message: Optional[str] = None
+        # Set to cut the sleep between iterations short (stop, new work). The
+        # signal handler runs on the main thread and calls stop(), and
+        # Event.wait returns once it is set, so Ctrl-C never waits out the sleep
+        self._wake = threading.Event()
+        # storage.get_change_marker() taken just before self.state was loaded
+        self._state_marker: Optional[Tuple[Any, ...]] = None
+        # True when self.state has changes not yet written by _flush_state
+        self._dirty = False
+        # Durations of the most recent executions, for the adaptive sleep
+        self._recent_execution_times: "deque[float]" = deque(
+            maxlen=self.EXECUTION_TIME_SAMPLES
+        )
+        # _process_execution_result handler per kind of result
+        self._result_handlers: Dict[
+            ResultKind,
+            Callable[[QueuedPrompt, ExecutionResult, str, datetime], None],
+        ] = {
+            ResultKind.SUCCESS: self._on_success,
+            ResultKind.NO_CHANGES: self._on_no_changes,
+            ResultKind.RATE_LIMITED: self._on_rate_limited,
+            ResultKind.FAILED: self._on_failure,
+        }
+        # (now, is rate limited) of the last iteration that ran no prompt: the
+        # state cannot change before the following sleep is calculated
+        self._idle_tick: Optional[Tuple[datetime, bool]] = None
+        # Runs Claude off the main thread; created by the first execution
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Optional local cap on prompt starts, on top of Claude's own limits
+        self._request_bucket: Optional[RequestBucket] = (
+            RequestBucket(max_prompts_per_minute) if max_prompts_per_minute else None
+        )
+
+        self._signals_registered = False
+        if register_signals:
+            self._register_signals()
+
+    @property
+    def claude_interface(self) -> ClaudeCodeInterface:
+        """The Claude Code interface, verified and created on first access."""
+        if self._claude_interface is None:
+            self._claude_interface = ClaudeCodeInterface(
+                self.claude_command, self.timeout
+            )
+        return self._claude_interface
+
+    @claude_interface.setter
+    def claude_interface(self, interface: ClaudeCodeInterface) -> None:
+        self._claude_interface = interface
 
+    def _register_signals(self) -> None:
+        """Install the SIGINT/SIGTERM handlers used while processing."""
+        if self._signals_registered:
+            return
         signal.signal(signal.SIGINT, self._signal_handler)
         signal.signal(signal.SIGTERM, self._signal_handler)
+        self._signals_registered = True
 
     def _signal_handler(self, signum, frame):
         """Handle shutdown signals."""
@@ -44,6 +116,7 @@ class QueueManager:
     def start(self, callback: Optional[Callable[[QueueState], None]] = None) -> None:
         """Start the queue processing loop."""
         print("Starting Claude Code Queue Manager...")
+        self._register_signals()
 
         is_working, message = self.claude_interface.test_connection()
         if not is_working:
@@ -52,7 +125,8 @@ class QueueManager:
 
         print(f"✓ {message}")
 
-        self.state = self.storage.load_queue_state()
+        self._state_marker = self.storage.get_change_marker()
+        self.state = self.storage.load_queue_state(include_failed=False)
         print(f"✓ Loaded queue with {len(self.state.prompts)} prompts")
 
         self.running = True
@@ -65,7 +139,8 @@ class QueueManager:
                     # Calculate optimal sleep interval based on next reset time
                     sleep_interval = self._calculate_sleep_interval()
                     if sleep_interval > 0:
-                        time.sleep(sleep_interval)
+                        self._wake.wait(timeout=sleep_interval)
+                    self._wake.clear()
 
         except KeyboardInterrupt:
             self._clear_status_line()
@@ -81,6 +156,7 @@ class QueueManager:
     ) -> int:
         """Process only the next queue item and stop."""
         print("Processing next queue item...")
+        self._register_signals()
 
         is_working, message = self.claude_interface.test_connection()
         if not is_working:
@@ -89,7 +165,8 @@ class QueueManager:
 
         print(f"✓ {message}")
 
-        self.state = self.storage.load_queue_state()
+        self._state_marker = self.storage.get_change_marker()
+        self.state = self.storage.load_queue_state(include_failed=False)
         print(f"✓ Loaded queue with {len(self.state.prompts)} prompts")
 
         try:
@@ -104,17 +181,20 @@ class QueueManager:
             return 1
         finally:
             if self.state:
-                for prompt in self.state.prompts:
-                    if prompt.status == PromptStatus.EXECUTING:
-                        prompt.status = PromptStatus.QUEUED
-                        prompt.add_log("Execution interrupted")
+                executing = self.state.get_prompts_with_status(PromptStatus.EXECUTING)
+                for prompt in executing:
+                    self.state.set_status(prompt, PromptStatus.QUEUED)
+                    prompt.add_log("Execution interrupted")
+                    self._mark_dirty()
 
-                self.storage.save_queue_state(self.state)
+                self._flush_state()
                 print("✓ Queue state saved")
+            self._shutdown_executor()
 
     def stop(self) -> None:
         """Stop the queue processing loop."""
         self.running = False
+        self._wake.set()
 
     def _shutdown(self) -> None:
         """Clean shutdown procedure."""
@@ -122,88 +202,103 @@ class QueueManager:
         print("Shutting down...")
 
         if self.state:
-            for prompt in self.state.prompts:
-                if prompt.status == PromptStatus.EXECUTING:
-                    prompt.status = PromptStatus.QUEUED
-                    prompt.add_log("Execution interrupted during shutdown")
+            executing = self.state.get_prompts_with_status(PromptStatus.EXECUTING)
+            for prompt in executing:
+                self.state.set_status(prompt, PromptStatus.QUEUED)
+                prompt.add_log("Execution interrupted during shutdown")
+                self._mark_dirty()
 
-            self.storage.save_queue_state(self.state)
+            self._flush_state()
             print("✓ Queue state saved")
 
+        self._shutdown_executor()
         print("Queue manager stopped")
 
+    def _shutdown_executor(self) -> None:
+        """Stop the execution thread, waiting for a running prompt to finish."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    def _reload_state(self) -> None:
+        """Reload the queue from storage, keeping in-memory counters and rate limit.
+
+        Only this process updates the counters; other commands write back the
+        values they loaded, which may be stale, so they are not re-read.
+        Failed prompts are never scheduled, so their files are not parsed.
+        """
+        self.state = self.storage.load_queue_state(
+            counters_from=self.state, include_failed=False
+        )
+
     def _process_queue_iteration(
         self, callback: Optional[Callable[[QueueState], None]] = None
     ) -> None:
         """Process one iteration of the queue."""
-        previous_total_processed = self.state.total_processed if self.state else 0
-        previous_failed_count = self.state.failed_count if self.state else 0
-        previous_rate_limited_count = self.state.rate_limited_count if self.state else 0
-        previous_last_processed = self.state.last_processed if self.state else None
-
-        # fixme : this is very bad hack, and should be properly done.
-        # self.state should have a reload_queue_state function, which does this here internally.
-        if self.state:
-            current_rate_limit = self.state.current_rate_limit
-            self.state = self.storage.load_queue_state()
-            self.state.current_rate_limit = current_rate_limit
-        else:
-            self.state = self.storage.load_queue_state()
-
-        self.state.total_processed = max(
-            self.state.total_processed, previous_total_processed
-        )
-        self.state.failed_count = max(self.state.failed_count, previous_failed_count)
-        self.state.rate_limited_count = max(
-            self.state.rate_limited_count, previous_rate_limited_count
-        )
-        if previous_last_processed and (
-            not self.state.last_processed
-            or self.state.last_processed < previous_last_processed
-        ):
-            self.state.last_processed = previous_last_processed
+        # Only re-read the prompt files when something on disk changed; the
+        # marker is taken before loading so changes made meanwhile are seen
+        marker = self.storage.get_change_marker()
+        if self.state is None or marker != self._state_marker:
+            self._reload_state()
+            self._state_marker = marker
+        state = self.state
+        assert state is not None
+
+        # One timestamp for every check made before the prompt runs
+        now = datetime.now()
+        self._idle_tick = None
 
         # Check if rate limit has expired
-        if self.state.clear_rate_limit_if_expired():
+        if state.clear_rate_limit_if_expired(now):
             self._clear_status_line()
             print("Rate limit expired, resuming queue processing")
 
-        next_prompt = self.state.get_next_prompt()
+        rate_limited = state.is_rate_limited(now)
+        next_prompt = None if rate_limited else state.get_next_prompt(now)
 
         if next_prompt is None:
+            self._idle_tick = (now, rate_limited)
             # Check if we're rate limited
-            if self.state.is_rate_limited():
-                queued_count = len(
-                    [p for p in self.state.prompts if p.status == PromptStatus.QUEUED]
-                )
-                if (
-                    self.state.current_rate_limit
-                    and self.state.current_rate_limit.reset_time
-                ):
-                    now = datetime.now()
+            if rate_limited:
+                queued_count = state.count_status(PromptStatus.QUEUED)
+                if state.current_rate_limit and state.current_rate_limit.reset_time:
                     seconds_until_reset = (
-                        self.state.current_rate_limit.reset_time - now
+                        state.current_rate_limit.reset_time - now
                     ).total_seconds()
                     if seconds_until_reset > 0:
                         reset_str = self._format_duration(seconds_until_reset)
                         self._print_status_line(
-                            f"Rate limited ({queued_count} prompts queued, reset in {reset_str})"
+                            f"Rate limited ({queued_count} prompts queued, reset in {reset_str})",
+                            now,
                         )
                     else:
                         self._print_status_line(
-                            f"Rate limited ({queued_count} prompts queued)"
+                            f"Rate limited ({queued_count} prompts queued)", now
                         )
                 else:
                     self._print_status_line(
-                        f"Rate limited ({queued_count} prompts queued)"
+                        f"Rate limited ({queued_count} prompts queued)", now
                     )
             else:
-                self._print_status_line("No prompts in queue")
+                self._print_status_line("No prompts in queue", now)
 
             if callback:
-                callback(self.state)
+                callback(state)
             return
 
+        if self._request_bucket:
+            wait_time = self._request_bucket.wait_time()
+            if wait_time > 0:
+                self._idle_tick = (now, False)
+                self._print_status_line(
+                    f"Prompt start limit reached, next start in {self._format_duration(wait_time)}",
+                    now,
+                )
+                if callback:
+                    callback(state)
+                return
+            self._request_bucket.consume()
+
         # Clear status line before printing other output
         self._clear_status_line()
 
@@ -216,148 +311,225 @@ class QueueManager:
         self._execute_prompt(next_prompt)
         self._print_separator()
 
-        self.storage.save_queue_state(self.state)
+        self._flush_state()
 
         if callback:
-            callback(self.state)
+            callback(state)
 
     def _execute_prompt(self, prompt: QueuedPrompt) -> None:
         """Execute a single prompt."""
-        prompt.status = PromptStatus.EXECUTING
+        state = self.state
+        assert state is not None
+        state.set_status(prompt, PromptStatus.EXECUTING)
         prompt.last_executed = datetime.now()
         prompt.add_log(
             f"Started execution (attempt {prompt.retry_count + 1}/{prompt.max_retries})"
         )
 
-        self.storage.save_queue_state(self.state)
+        # Written immediately: the .executing file marks the prompt as in
+        # progress if the daemon dies while Claude runs
+        self._flush_state(durable=True)
+
+        result = self._run_claude(prompt)
 
-        result = self.claude_interface.execute_prompt(prompt)
+        # Taken after the run: the prompt may have executed for minutes
+        self._process_execution_result(prompt, result, datetime.now())
 
-        self._process_execution_result(prompt, result)
+    def _run_claude(self, prompt: QueuedPrompt) -> ExecutionResult:
+        """Run the prompt on the execution thread and wait for its result.
+
+        The main thread keeps handling signals while it waits; the status
+        callback is only called once the iteration is done.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="claude-queue"
+            )
+        future = self._executor.submit(self.claude_interface.execute_prompt, prompt)
+        return future.result()
 
     def _process_execution_result(
-        self, prompt: QueuedPrompt, result: ExecutionResult
+        self,
+        prompt: QueuedPrompt,
+        result: ExecutionResult,
+        now: Optional[datetime] = None,
     ) -> None:
         """Process the result of prompt execution."""
+        state = self.state
+        assert state is not None
+        if now is None:
+            now = datetime.now()
         execution_summary = f"Execution completed in {result.execution_time:.1f}s"
+        self._recent_execution_times.append(result.execution_time)
 
-        if result.success and not result.no_changes_detected:
-            # True success: command succeeded AND changes were made to working directory
-            prompt.status = PromptStatus.COMPLETED
-            prompt.add_log(f"{execution_summary} - SUCCESS")
-            if result.output:
-                prompt.add_log(f"Output:\n{result.output}")
+        self._result_handlers[result.kind](prompt, result, execution_summary, now)
 
-            # Handle jj bookmark setting on success
-            if result.jj_bookmark_to_set and result.jj_working_dir:
-                bookmark_exists = JujutsuIntegration.bookmark_exists(
-                    result.jj_working_dir, result.jj_bookmark_to_set
-                )
-                success, message = JujutsuIntegration.set_bookmark(
-                    result.jj_working_dir,
-                    result.jj_bookmark_to_set,
-                    create=not bookmark_exists,
-                )
-                if success:
-                    print(f"🥷 {message}")
-                    prompt.add_log(f"jj bookmark: {message}")
-                else:
-                    print(f"🥷 Warning: {message}")
-                    prompt.add_log(f"jj bookmark warning: {message}")
+        state.last_processed = now
+        self._mark_dirty()
 
-            self.state.total_processed += 1
-            print(
-                f"✓ Prompt {prompt.id} completed successfully ({result.execution_time:.1f}s)"
+    def _on_success(
+        self,
+        prompt: QueuedPrompt,
+        result: ExecutionResult,
+        execution_summary: str,
+        now: datetime,
+    ) -> None:
+        """Command succeeded AND changes were made to the working directory."""
+        state = self.state
+        assert state is not None
+        state.set_status(prompt, PromptStatus.COMPLETED)
+        prompt.add_log(f"{execution_summary} - SUCCESS")
+        if result.output:
+            prompt.add_log(f"Output:\n{result.output}")
+
+        # Handle jj bookmark setting on success
+        if result.jj_bookmark_to_set and result.jj_working_dir:
+            bookmark_exists = JujutsuIntegration.bookmark_exists(
+                result.jj_working_dir, result.jj_bookmark_to_set
             )
-
-        elif result.success and result.no_changes_detected:
-            # Command succeeded but no changes were made to the working directory
-            # Treat this as a failure and increment retry counter
-            prompt.retry_count += 1
-
-            if prompt.can_retry():
-                prompt.status = PromptStatus.QUEUED
-                prompt.add_log(
-                    f"{execution_summary} - NO CHANGES DETECTED (will retry)"
-                )
-                if result.output:
-                    prompt.add_log(f"Output:\n{result.output}")
-                print(
-                    f"⚠ Prompt {prompt.id} completed but no changes detected, will retry ({prompt.retry_count}/{prompt.max_retries}) ({result.execution_time:.1f}s)"
-                )
+            success, message = JujutsuIntegration.set_bookmark(
+                result.jj_working_dir,
+                result.jj_bookmark_to_set,
+                create=not bookmark_exists,
+            )
+            if success:
+                print(f"🥷 {message}")
+                prompt.add_log(f"jj bookmark: {message}")
             else:
-                prompt.status = PromptStatus.FAILED
-                prompt.add_log(
-                    f"{execution_summary} - NO CHANGES DETECTED (max retries exceeded)"
-                )
-                if result.output:
-                    prompt.add_log(f"Output:\n{result.output}")
+                print(f"🥷 Warning: {message}")
+                prompt.add_log(f"jj bookmark warning: {message}")
 
-                self.state.failed_count += 1
-                print(
-                    f"✗ Prompt {prompt.id} failed (no changes detected) after {prompt.max_retries} attempts ({result.execution_time:.1f}s)"
-                )
+        state.total_processed += 1
+        print(
+            f"✓ Prompt {prompt.id} completed successfully ({result.execution_time:.1f}s)"
+        )
 
-        elif result.is_rate_limited:
-            # Keep prompt in queued state - rate limit is a daemon-level concern
-            prompt.status = PromptStatus.QUEUED
+    def _on_no_changes(
+        self,
+        prompt: QueuedPrompt,
+        result: ExecutionResult,
+        execution_summary: str,
+        now: datetime,
+    ) -> None:
+        """Command succeeded but no changes were made; counts as a failed attempt."""
+        if self._requeue_or_fail(prompt):
+            prompt.add_log(f"{execution_summary} - NO CHANGES DETECTED (will retry)")
+            if result.output:
+                prompt.add_log(f"Output:\n{result.output}")
+            print(
+                f"⚠ Prompt {prompt.id} completed but no changes detected, will retry ({prompt.retry_count}/{prompt.max_retries}) ({result.execution_time:.1f}s)"
+            )
+        else:
             prompt.add_log(
-                f"{execution_summary} - RATE LIMITED (will retry when limit resets)"
+                f"{execution_summary} - NO CHANGES DETECTED (max retries exceeded)"
+            )
+            if result.output:
+                prompt.add_log(f"Output:\n{result.output}")
+            print(
+                f"✗ Prompt {prompt.id} failed (no changes detected) after {prompt.max_retries} attempts ({result.execution_time:.1f}s)"
             )
 
-            if result.rate_limit_info and result.rate_limit_info.limit_message:
-                prompt.add_log(f"Message: {result.rate_limit_info.limit_message}")
+    def _on_rate_limited(
+        self,
+        prompt: QueuedPrompt,
+        result: ExecutionResult,
+        execution_summary: str,
+        now: datetime,
+    ) -> None:
+        """Keep the prompt queued; the rate limit is a daemon-level concern."""
+        state = self.state
+        assert state is not None
+        state.set_status(prompt, PromptStatus.QUEUED)
+        prompt.add_log(
+            f"{execution_summary} - RATE LIMITED (will retry when limit resets)"
+        )
 
-            # Set daemon-level rate limit
-            self.state.current_rate_limit = result.rate_limit_info
-            self.state.rate_limited_count += 1
+        if result.rate_limit_info and result.rate_limit_info.limit_message:
+            prompt.add_log(f"Message: {result.rate_limit_info.limit_message}")
 
-            if result.rate_limit_info and result.rate_limit_info.reset_time:
-                time_until_reset = (
-                    result.rate_limit_info.reset_time - datetime.now()
-                ).total_seconds()
-                reset_str = self._format_duration(time_until_reset)
-                print(f"⚠ Rate limited, will resume in {reset_str}")
-            else:
-                print("⚠ Rate limited, will retry later")
+        # Set daemon-level rate limit
+        state.current_rate_limit = result.rate_limit_info
+        state.rate_limited_count += 1
 
+        if result.rate_limit_info and result.rate_limit_info.reset_time:
+            time_until_reset = (result.rate_limit_info.reset_time - now).total_seconds()
+            reset_str = self._format_duration(time_until_reset)
+            print(f"⚠ Rate limited, will resume in {reset_str}")
         else:
-            prompt.retry_count += 1
-
-            if prompt.can_retry():
-                prompt.status = PromptStatus.QUEUED
-                prompt.add_log(f"{execution_summary} - FAILED (will retry)")
-                if result.error:
-                    prompt.add_log(f"Error: {result.error}")
-                print(
-                    f"✗ Prompt {prompt.id} failed, will retry ({prompt.retry_count}/{prompt.max_retries}) ({result.execution_time:.1f}s)"
-                )
-            else:
-                prompt.status = PromptStatus.FAILED
-                prompt.add_log(f"{execution_summary} - FAILED (max retries exceeded)")
-                if result.error:
-                    prompt.add_log(f"Error: {result.error}")
-
-                self.state.failed_count += 1
-                print(
-                    f"✗ Prompt {prompt.id} failed permanently after {prompt.max_retries} attempts ({result.execution_time:.1f}s)"
-                )
+            print("⚠ Rate limited, will retry later")
+
+    def _on_failure(
+        self,
+        prompt: QueuedPrompt,
+        result: ExecutionResult,
+        execution_summary: str,
+        now: datetime,
+    ) -> None:
+        """Command failed; retry while attempts are left."""
+        if self._requeue_or_fail(prompt):
+            prompt.add_log(f"{execution_summary} - FAILED (will retry)")
+            if result.error:
+                prompt.add_log(f"Error: {result.error}")
+            print(
+                f"✗ Prompt {prompt.id} failed, will retry ({prompt.retry_count}/{prompt.max_retries}) ({result.execution_time:.1f}s)"
+            )
+        else:
+            prompt.add_log(f"{execution_summary} - FAILED (max retries exceeded)")
+            if result.error:
+                prompt.add_log(f"Error: {result.error}")
+            print(
+                f"✗ Prompt {prompt.id} failed permanently after {prompt.max_retries} attempts ({result.execution_time:.1f}s)"
+            )
 
-        self.state.last_processed = datetime.now()
+    def _requeue_or_fail(self, prompt: QueuedPrompt) -> bool:
+        """Count a failed attempt and queue the prompt again if it may retry.
+
+        Returns True if the prompt was queued again, False if it failed for good.
+        """
+        state = self.state
+        assert state is not None
+        prompt.retry_count += 1
+        # can_retry only holds for failed prompts, so mark the attempt failed
+        # before asking; the prompt is still executing at this point
+        state.set_status(prompt, PromptStatus.FAILED)
+        if prompt.can_retry():
+            state.set_status(prompt, PromptStatus.QUEUED)
+            return True
+
+        state.failed_count += 1
+        return False
+
+    def _mark_dirty(self) -> None:
+        """Record that self.state changed and must be written by _flush_state."""
+        self._dirty = True
+
+    def _flush_state(self, durable: bool = False) -> None:
+        """Save self.state once for all changes since the last save.
+
+        With durable=True the state is written even if nothing was marked.
+        """
+        if self.state is not None and (self._dirty or durable):
+            self.storage.save_queue_state(self.state)
+            self._dirty = False
 
     def _format_duration(self, seconds: float) -> str:
         """Format duration in seconds to human readable format."""
         if seconds < 0:
             return "now"
+        return self._format_int_seconds(int(seconds))
 
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def _format_int_seconds(seconds: int) -> str:
+        """Format a non-negative whole number of seconds, cached per value."""
         if seconds < 60:
-            return f"{int(seconds)}s"
+            return f"{seconds}s"
         elif seconds < 3600:
-            minutes = int(seconds // 60)
+            minutes = seconds // 60
             return f"{minutes}m"
         else:
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
+            hours = seconds // 3600
+            minutes = (seconds % 3600) // 60
             if minutes == 0:
                 return f"{hours}h"
             return f"{hours}h {minutes}m"
@@ -370,12 +542,12 @@ class QueueManager:
             width = 80
         print("-" * width)
 
-    def _print_status_line(self, message: str) -> None:
+    def _print_status_line(self, message: str, now: Optional[datetime] = None) -> None:
         """Print or update a status line with timestamp using VT100 control codes.
 
         If the same status type is printed again, it will update the line in place.
         """
-        timestamp = datetime.now().strftime("%H:%M:%S")
+        timestamp = (now or datetime.now()).strftime("%H:%M:%S")
         full_message = f"⏳ {message} {timestamp}"
 
         # Check if we need to clear the previous line
@@ -398,18 +570,30 @@ class QueueManager:
             sys.stdout.write("\r\033[K")
             self.last_status_message = None
 
-    def _calculate_sleep_interval(self) -> int:
-        """Calculate optimal sleep interval based on queue state and reset times."""
+    def _calculate_sleep_interval(self, now: Optional[datetime] = None) -> int:
+        """Calculate optimal sleep interval based on queue state and reset times.
+
+        Without now, reuses the timestamp and rate-limit check of an iteration
+        that ran no prompt, and takes a fresh reading otherwise.
+        """
         if not self.state:
             return self.check_interval
 
+        rate_limited: Optional[bool] = None
+        if now is None:
+            if self._idle_tick is not None:
+                now, rate_limited = self._idle_tick
+            else:
+                now = datetime.now()
+        if rate_limited is None:
+            rate_limited = self.state.is_rate_limited(now)
+
         # Check if we're rate limited at the daemon level
-        if self.state.is_rate_limited():
+        if rate_limited:
             if (
                 self.state.current_rate_limit
                 and self.state.current_rate_limit.reset_time
             ):
-                now = datetime.now()
                 seconds_until_reset = (
                     self.state.current_rate_limit.reset_time - now
                 ).total_seconds()
@@ -431,14 +615,22 @@ class QueueManager:
                 return int(wait_time)
 
         # Check if there are any queued prompts
-        queued_prompts = [
-            p for p in self.state.prompts if p.status == PromptStatus.QUEUED
-        ]
-        if not queued_prompts:
+        if not self.state.count_status(PromptStatus.QUEUED):
             # No prompts waiting, use normal check interval
             return self.check_interval
 
-        # If there are queued prompts and no rate limit, use the normal check interval
+        if self._request_bucket:
+            wait_time = self._request_bucket.wait_time()
+            if wait_time > 0:
+                return max(1, min(math.ceil(wait_time), self.check_interval))
+
+        # Prompts are waiting and not rate limited: poll again after half the
+        # mean recent execution time, within [1, check_interval]
+        if self._recent_execution_times:
+            mean_time = sum(self._recent_execution_times) / len(
+                self._recent_execution_times
+            )
+            return max(1, min(int(mean_time / 2), self.check_interval))
         return self.check_interval
 
     def add_prompt(self, prompt: QueuedPrompt) -> bool:
@@ -451,6 +643,7 @@ class QueueManager:
 
             success = self.storage.save_queue_state(self.state)
             if success:
+                self._wake.set()
                 print(f"✓ Added prompt {prompt.id} to queue")
             else:
                 print(f"✗ Failed to save prompt {prompt.id}")
@@ -469,15 +662,16 @@ class QueueManager:
 
             prompt = self.state.get_prompt(prompt_id)
             if prompt:
-                if prompt.status == PromptStatus.EXECUTING:
+                if prompt.status is PromptStatus.EXECUTING:
                     print(f"Cannot remove executing prompt {prompt_id}")
                     return False
 
-                prompt.status = PromptStatus.CANCELLED
+                self.state.set_status(prompt, PromptStatus.CANCELLED)
                 prompt.add_log("Cancelled by user")
 
                 success = self.storage.save_queue_state(self.state)
                 if success:
+                    self._wake.set()
                     print(f"✓ Cancelled prompt {prompt_id}")
                 else:
                     print(f"✗ Failed to cancel prompt {prompt_id}")
@@ -493,39 +687,46 @@ class QueueManager:
 
     def delete_prompt(self, prompt_id: str) -> bool:
         """Permanently delete a prompt from storage (hard delete)."""
+        return self.delete_prompts([prompt_id])
+
+    def delete_prompts(self, prompt_ids: List[str]) -> bool:
+        """Permanently delete prompts from storage, saving the state only once.
+
+        Returns True if every prompt was deleted.
+        """
         try:
             if not self.state:
                 self.state = self.storage.load_queue_state()
 
-            prompt = self.state.get_prompt(prompt_id)
-            if prompt:
-                if prompt.status == PromptStatus.EXECUTING:
+            all_success = True
+            to_remove = set()
+            executing = PromptStatus.EXECUTING
+            for prompt_id in prompt_ids:
+                prompt = self.state.get_prompt(prompt_id)
+                if prompt and prompt.status is executing:
                     print(f"Cannot delete executing prompt {prompt_id}")
-                    return False
-
-                # Remove from state
-                removed_from_state = self.state.delete_prompt(prompt_id)
+                    all_success = False
+                    continue
 
                 # Delete files from storage
                 files_deleted = self.storage.delete_prompt_files(prompt_id)
 
-                if removed_from_state or files_deleted:
-                    # Save updated state
-                    self.storage.save_queue_state(self.state)
+                if prompt:
+                    to_remove.add(prompt_id)
                     print(f"✓ Deleted prompt {prompt_id}")
-                    return True
-                else:
-                    print(f"✗ Failed to delete prompt {prompt_id}")
-                    return False
-            else:
-                # Prompt not in memory, but might exist in files - try deleting files anyway
-                files_deleted = self.storage.delete_prompt_files(prompt_id)
-                if files_deleted:
+                elif files_deleted:
+                    # Prompt not in memory, but its files existed
                     print(f"✓ Deleted prompt {prompt_id} (files only)")
-                    return True
                 else:
                     print(f"Prompt {prompt_id} not found")
-                    return False
+                    all_success = False
+
+            if to_remove:
+                # Remove from state in a single pass and save it once
+                self.state.remove_prompts(to_remove)
+                self.storage.save_queue_state(self.state)
+
+            return all_success
 
         except Exception as e:
             print(f"Error deleting prompt: {e}")
@@ -569,6 +770,7 @@ class QueueManager:
 
             success = self.storage.save_queue_state(self.state)
             if success:
+                self._wake.set()
                 print(f"✓ Created new prompt {new_prompt.id} based on {prompt_id}")
 
                 # Only delete the original if the new prompt was successfully created
@@ -615,7 +817,7 @@ class QueueManager:
             self.state = self.storage.load_queue_state()
 
         current_time = datetime.now()
-        is_rate_limited = self.state.is_rate_limited()
+        is_rate_limited = self.state.is_rate_limited(current_time)
 
         info = {
             "current_time": current_time,
@@ -637,10 +839,34 @@ class QueueManager:
     def get_next_prompt_id(self) -> Optional[str]:
         """Get the ID of the next prompt that would be processed."""
         if not self.state:
-            self.state = self.storage.load_queue_state()
+            # Nothing loaded yet: the frontmatter headers are enough to pick
+            # the prompt, and a fresh load carries no rate limit to check
+            headers = self.storage.load_prompt_headers()
+            next_header = min(
+                headers,
+                key=lambda h: (
+                    h.status is not PromptStatus.EXECUTING,
+                    h.priority,
+                    h.created_at,
+                ),
+                default=None,
+            )
+            return next_header.id if next_header else None
 
         # Check if rate limit has expired
         self.state.clear_rate_limit_if_expired()
 
         next_prompt = self.state.get_next_prompt()
         return next_prompt.id if next_prompt else None
+
+    def get_next_prompt_path(self) -> Optional[str]:
+        """Get the file path of the next prompt that would be processed."""
+        next_prompt_id = self.get_next_prompt_id()
+        if not next_prompt_id:
+            return None
+
+        # Queued and executing prompts always live in the queue directory
+        file_path = self.storage.get_prompt_path(
+            next_prompt_id, directories=[self.storage.queue_dir]
+        )
+        return str(file_path) if file_path else None
@@ -3,69 +3,274 @@ Queue storage system with markdown support.
 """
 
 import json
+import os
 import re
 import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import replace
 from datetime import datetime
+from functools import lru_cache
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple, Union
 
 import yaml  # type: ignore
 
-from .models import PromptStatus, QueuedPrompt, QueueState
+try:
+    import orjson  # type: ignore
+except ImportError:  # optional accelerator, stdlib json is used without it
+    orjson = None
+
+from .models import VALID_PERMISSION_MODES, PromptStatus, QueuedPrompt, QueueState
+
+# libyaml bindings when PyYAML was built with them: same results, parsed in C
+_YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+_YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+
+def _dump_state_json(data: Any) -> bytes:
+    """Encode the state file, with orjson if installed."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_INDENT_2)
+    return json.dumps(data, indent=2).encode("utf-8")
+
+
+# Both accept the raw bytes of the state file
+_load_state_json = orjson.loads if orjson is not None else json.loads
+
+# Characters not allowed in prompt filenames, each replaced by a dash
+_FILENAME_INVALID_TABLE = str.maketrans(dict.fromkeys('<>:"/\\|?*', "-"))
+# Runs of dashes and whitespace, collapsed to one dash
+_FILENAME_SEPARATOR_RE = re.compile(r"[-\s]+")
+
+# A top-level "key = value" line with no colon anywhere on it: in a block
+# mapping every unindented line is a key, which needs a colon. Quoted and
+# flow scalars may continue on unindented lines, so the pre-scan is only
+# trusted when none of _SCALAR_OPENERS appears
+_ASSIGNMENT_LINE_RE = re.compile(r"^[\w.-]+[ \t]*=[^:\n]*$", re.MULTILINE)
+_SCALAR_OPENERS = ('"', "'", "[", "{")
+
+# Parsed prompt files kept for re-scans of an unchanged queue
+PARSE_CACHE_SIZE = 4096
+
+# File path -> ((st_mtime_ns, st_size, st_ctime_ns), parsed prompt), least
+# recently used first
+_parse_cache: "OrderedDict[str, Tuple[Tuple[int, int, int], QueuedPrompt]]" = (
+    OrderedDict()
+)
+# Held around every _parse_cache access, since prompts are parsed from
+# several threads at once
+_parse_cache_lock = threading.Lock()
+
+# Prompt files loaded at once before _load_prompts_from_files hands them to
+# a thread pool, and the most threads it uses
+PARALLEL_LOAD_MIN_FILES = 32
+PARALLEL_LOAD_MAX_WORKERS = 8
+
+
+def _copy_parsed(prompt: QueuedPrompt) -> QueuedPrompt:
+    """Copy a parsed prompt so callers can change it without touching the cache."""
+    return replace(
+        prompt,
+        context_files=list(prompt.context_files),
+        allowed_tools=(
+            list(prompt.allowed_tools) if prompt.allowed_tools is not None else None
+        ),
+    )
+
+
+def _load_frontmatter(frontmatter: str) -> Dict[str, Any]:
+    """Load YAML frontmatter as a mapping, or {} when it is not a valid one.
+
+    Frontmatter with a "key = value" line is rejected without invoking YAML,
+    and the first content event is checked before building anything, so a
+    frontmatter that is not a mapping is rejected without a full load.
+    """
+    if _ASSIGNMENT_LINE_RE.search(frontmatter) and not any(
+        opener in frontmatter for opener in _SCALAR_OPENERS
+    ):
+        return {}
+    try:
+        for event in yaml.parse(frontmatter, Loader=_YAML_LOADER):
+            if isinstance(event, (yaml.StreamStartEvent, yaml.DocumentStartEvent)):
+                continue
+            if not isinstance(event, yaml.MappingStartEvent):
+                return {}
+            break
+        else:
+            return {}
+        return yaml.load(frontmatter, Loader=_YAML_LOADER)
+    except yaml.YAMLError:
+        return {}
+
+
+def _dump_stable_frontmatter(items: Sequence[Tuple[str, Any]]) -> str:
+    """YAML for the frontmatter fields that rarely change between writes.
+
+    items are (key, value) pairs; prompts sharing the same options reuse one
+    dump. Keys keep the fixed order write_prompt_file passes them in, so
+    there is nothing to sort.
+    """
+    # Values are tagged with their type, so 1, 1.0 and True, which hash and
+    # compare equal, are not served each other's dump
+    frozen = tuple((key, _freeze_value(value)) for key, value in items)
+    try:
+        return _dump_frozen_frontmatter(frozen)
+    except TypeError:
+        # A value that does not hash, like a mapping: skip the cache
+        return _dump_frontmatter_items(items)
+
+
+def _freeze_value(value: Any) -> Tuple[type, Any]:
+    """(type, value) for a frontmatter value, lists turned into tuples."""
+    if isinstance(value, list):
+        return (list, tuple(_freeze_value(item) for item in value))
+    return (type(value), value)
+
+
+def _thaw_value(frozen: Tuple[type, Any]) -> Any:
+    """The frontmatter value _freeze_value was given."""
+    kind, value = frozen
+    if kind is list:
+        return [_thaw_value(item) for item in value]
+    return value
+
+
+@lru_cache(maxsize=1024, typed=True)
+def _dump_frozen_frontmatter(items: Tuple[Tuple[str, Tuple[type, Any]], ...]) -> str:
+    """_dump_frontmatter_items for frozen items, memoized."""
+    return _dump_frontmatter_items([(key, _thaw_value(value)) for key, value in items])
+
+
+def _dump_frontmatter_items(items: Sequence[Tuple[str, Any]]) -> str:
+    """Dump (key, value) pairs as a YAML mapping."""
+    return yaml.dump(
+        dict(items), Dumper=_YAML_DUMPER, default_flow_style=False, sort_keys=False
+    )
+
+
+def _volatile_frontmatter(prompt: QueuedPrompt) -> str:
+    """Frontmatter lines for the fields that change with every execution.
+
+    Formatted directly: the timestamps are single-quoted so they load back as
+    strings, as yaml.dump writes them, and status values are plain words.
+    """
+    lines = [f"created_at: '{prompt.created_at.isoformat()}'\n"]
+    if prompt.last_executed:
+        lines.append(f"last_executed: '{prompt.last_executed.isoformat()}'\n")
+    lines.append(f"retry_count: {prompt.retry_count}\n")
+    lines.append(f"status: {prompt.status.value}\n")
+    return "".join(lines)
+
+
+class PromptHeader(NamedTuple):
+    """Scheduling fields of a prompt file, read without its body."""
+
+    id: str
+    priority: int
+    created_at: datetime
+    status: PromptStatus = PromptStatus.QUEUED
+
+
+def _prompt_id_from_path(file_path: Path) -> str:
+    """Prompt id encoded in a prompt filename, the part before the first dash."""
+    return file_path.stem.split("-", 1)[0] if "-" in file_path.stem else file_path.stem
+
+
+def _scan_prompt_entries(directory: Path, prefix: str = "") -> List[os.DirEntry]:
+    """Markdown files in directory whose names start with prefix, in listing order.
+
+    One os.scandir pass: names are matched with plain string checks and the
+    file type comes from the directory listing, without a stat per entry.
+    """
+    try:
+        with os.scandir(directory) as entries:
+            return [
+                entry
+                for entry in entries
+                if entry.name.startswith(prefix)
+                and entry.name.endswith(".md")
+                and entry.is_file()
+            ]
+    except OSError:
+        return []
+
+
+def _scan_prompt_files(directory: Path, prefix: str = "") -> List[Path]:
+    """Paths of the files _scan_prompt_entries lists."""
+    return [Path(entry.path) for entry in _scan_prompt_entries(directory, prefix)]
+
+
+def invalidate_parse_cache(file_path: Optional[Union[str, Path]] = None) -> None:
+    """Forget parsed prompt files, for one path or all."""
+    with _parse_cache_lock:
+        if file_path is None:
+            _parse_cache.clear()
+        else:
+            _parse_cache.pop(str(file_path), None)
 
 
 class MarkdownPromptParser:
     """Parser for markdown-based prompt files."""
 
+    # Characters parse_prompt_header reads looking for the end of the frontmatter
+    HEADER_READ_SIZE = 4096
+
+    invalidate_parse_cache = staticmethod(invalidate_parse_cache)
+
     @staticmethod
     def parse_prompt_file(file_path: Path) -> Optional[QueuedPrompt]:
-        """Parse a markdown prompt file into a QueuedPrompt object."""
+        """Parse a markdown prompt file into a QueuedPrompt object.
+
+        A file whose modification time, size and change time are unchanged
+        since its last parse is answered from the parse cache.
+        """
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                content = f.read()
-
-            if content.startswith("---\n"):
-                parts = content.split("---\n", 2)
-                if len(parts) >= 3:
-                    frontmatter = parts[1]
-                    markdown_content = parts[2].strip()
-
-                    # Strip execution log section if present (use specific pattern to avoid false positives)
-                    execution_log_marker = "\n## Execution Log\n"
-                    if execution_log_marker in markdown_content:
-                        # Split at the execution log header and take only the content before it
-                        markdown_content = markdown_content.split(execution_log_marker)[
-                            0
-                        ].strip()
-                else:
-                    frontmatter = ""
-                    markdown_content = content
+            stat = file_path.stat()
+            key = str(file_path)
+            signature = (stat.st_mtime_ns, stat.st_size, stat.st_ctime_ns)
+            with _parse_cache_lock:
+                cached = _parse_cache.get(key)
+                if cached is not None and cached[0] == signature:
+                    _parse_cache.move_to_end(key)
+            if cached is not None and cached[0] == signature:
+                return _copy_parsed(cached[1])
+
+            # Split as bytes so the execution log, usually the bulk of the
+            # file, is never decoded
+            raw = file_path.read_bytes()
+            if b"\r" in raw:
+                # Newlines as text mode reading translates them
+                raw = raw.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+
+            parts = raw.split(b"---\n", 2) if raw.startswith(b"---\n") else []
+            if len(parts) >= 3:
+                frontmatter = parts[1].decode("utf-8")
+                body = parts[2]
+
+                # Strip execution log section if present (use specific pattern to avoid false positives)
+                log_start = body.find(
+                    b"\n## Execution Log\n", len(body) - len(body.lstrip())
+                )
+                if log_start != -1:
+                    body = body[:log_start]
+                markdown_content = body.decode("utf-8").strip()
             else:
                 frontmatter = ""
-                markdown_content = content
+                markdown_content = raw.decode("utf-8")
 
-            metadata: dict = {}
-            if frontmatter.strip():
-                try:
-                    metadata = yaml.safe_load(frontmatter) or {}
-                except yaml.YAMLError:
-                    metadata = {}
-
-            prompt_id = (
-                file_path.stem.split("-", 1)[0]
-                if "-" in file_path.stem
-                else file_path.stem
-            )
+            metadata = _load_frontmatter(frontmatter) if frontmatter.strip() else {}
 
             prompt = QueuedPrompt(
-                id=prompt_id,
+                id=_prompt_id_from_path(file_path),
                 content=markdown_content,
                 working_directory=metadata.get("working_directory", "."),
                 priority=metadata.get("priority", 0),
                 context_files=metadata.get("context_files", []),
                 max_retries=metadata.get("max_retries", 3),
                 estimated_tokens=metadata.get("estimated_tokens"),
-                created_at=datetime.fromtimestamp(file_path.stat().st_ctime),
+                created_at=datetime.fromtimestamp(stat.st_ctime),
                 permission_mode=metadata.get("permission_mode"),
                 allowed_tools=metadata.get("allowed_tools"),
                 timeout=metadata.get("timeout"),
@@ -73,12 +278,131 @@ class MarkdownPromptParser:
                 bookmark=metadata.get("bookmark"),
             )
 
+            with _parse_cache_lock:
+                _parse_cache[key] = (signature, _copy_parsed(prompt))
+                if len(_parse_cache) > PARSE_CACHE_SIZE:
+                    _parse_cache.popitem(last=False)
             return prompt
 
         except Exception as e:
             print(f"Error parsing prompt file {file_path}: {e}")
             return None
 
+    @staticmethod
+    def parse_prompt_header(file_path: Path) -> Optional[PromptHeader]:
+        """Read the id, priority and creation time of a prompt file.
+
+        Only the first HEADER_READ_SIZE characters are read. A frontmatter that
+        does not end within them, or whose values parse_prompt_file would
+        reject, is left to a full parse instead.
+        """
+        try:
+            with open(file_path, "r", encoding="utf-8") as f:
+                head = f.read(MarkdownPromptParser.HEADER_READ_SIZE)
+
+            metadata: Dict[str, Any] = {}
+            if head.startswith("---\n"):
+                end = head.find("---\n", 4)
+                if end == -1:
+                    return MarkdownPromptParser._header_from_full_parse(file_path)
+                frontmatter = head[4:end]
+                if frontmatter.strip():
+                    metadata = _load_frontmatter(frontmatter)
+
+            if not isinstance(metadata.get("priority", 0), int) or metadata.get(
+                "permission_mode", None
+            ) not in VALID_PERMISSION_MODES | {None}:
+                return MarkdownPromptParser._header_from_full_parse(file_path)
+
+            return PromptHeader(
+                id=_prompt_id_from_path(file_path),
+                priority=metadata.get("priority", 0),
+                created_at=datetime.fromtimestamp(file_path.stat().st_ctime),
+            )
+
+        except Exception as e:
+            print(f"Error parsing prompt file {file_path}: {e}")
+            return None
+
+    @staticmethod
+    def _header_from_full_parse(file_path: Path) -> Optional[PromptHeader]:
+        """Header of a prompt file that only parse_prompt_file can read."""
+        prompt = MarkdownPromptParser.parse_prompt_file(file_path)
+        if prompt is None:
+            return None
+        return PromptHeader(prompt.id, prompt.priority, prompt.created_at)
+
+    @staticmethod
+    def render_template(prompt: QueuedPrompt) -> str:
+        """Render a prompt as an editable template, commenting out unset options."""
+        lines = [
+            "---",
+            f"priority: {prompt.priority}",
+            f"working_directory: {prompt.working_directory}",
+            f"max_retries: {prompt.max_retries}",
+        ]
+
+        # Context files - optional
+        if prompt.context_files:
+            lines.append("context_files:")
+            lines.extend(f"  - {cf}" for cf in prompt.context_files)
+        else:
+            lines.append("# context_files: []")
+
+        # Estimated tokens - optional
+        if prompt.estimated_tokens:
+            lines.append(f"estimated_tokens: {prompt.estimated_tokens}")
+        else:
+            lines.append("# estimated_tokens: 1000")
+
+        # Permission mode - optional
+        if prompt.permission_mode:
+            lines.append(f"permission_mode: {prompt.permission_mode}")
+        else:
+            lines.append(
+                "# permission_mode: acceptEdits  # acceptEdits|bypassPermissions|default|delegate|dontAsk|plan"
+            )
+
+        # Allowed tools - optional
+        if prompt.allowed_tools:
+            lines.append("allowed_tools:")
+            lines.extend(f"  - {tool}" for tool in prompt.allowed_tools)
+        else:
+            lines.extend(
+                ["# allowed_tools:", "#   - Edit", "#   - Write", "#   - Bash(git:*)"]
+            )
+
+        # Timeout - optional
+        if prompt.timeout is not None:
+            lines.append(f"timeout: {prompt.timeout}")
+        else:
+            lines.append("# timeout: 3600")
+
+        # Model - optional
+        if prompt.model:
+            lines.append(f"model: {prompt.model}")
+        else:
+            lines.append("# model: sonnet  # sonnet|opus|haiku")
+
+        # Bookmark - optional
+        if prompt.bookmark:
+            lines.append(f"bookmark: {prompt.bookmark}")
+        else:
+            lines.append("# bookmark: feature-name")
+
+        # These are auto-managed fields
+        lines.extend(
+            [
+                f"created_at: {prompt.created_at.isoformat()}",
+                f"status: {prompt.status.value}",
+                f"retry_count: {prompt.retry_count}",
+                "---",
+                "",
+                prompt.content if prompt.content else "# Write your prompt here\n",
+            ]
+        )
+        return "\n".join(lines)
+
     @staticmethod
     def write_prompt_file(
         prompt: QueuedPrompt, file_path: Path, template_mode: bool = False
@@ -91,116 +415,50 @@ class MarkdownPromptParser:
             template_mode: If True, write all possible fields with comments for optional ones
         """
         try:
+            invalidate_parse_cache(file_path)
             if template_mode:
                 # In template mode, write all fields with comments for optional ones
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write("---\n")
-                    f.write(f"priority: {prompt.priority}\n")
-                    f.write(f"working_directory: {prompt.working_directory}\n")
-                    f.write(f"max_retries: {prompt.max_retries}\n")
-
-                    # Context files - optional
-                    if prompt.context_files:
-                        f.write("context_files:\n")
-                        for cf in prompt.context_files:
-                            f.write(f"  - {cf}\n")
-                    else:
-                        f.write("# context_files: []\n")
-
-                    # Estimated tokens - optional
-                    if prompt.estimated_tokens:
-                        f.write(f"estimated_tokens: {prompt.estimated_tokens}\n")
-                    else:
-                        f.write("# estimated_tokens: 1000\n")
-
-                    # Permission mode - optional
-                    if prompt.permission_mode:
-                        f.write(f"permission_mode: {prompt.permission_mode}\n")
-                    else:
-                        f.write(
-                            "# permission_mode: acceptEdits  # acceptEdits|bypassPermissions|default|delegate|dontAsk|plan\n"
-                        )
-
-                    # Allowed tools - optional
-                    if prompt.allowed_tools:
-                        f.write("allowed_tools:\n")
-                        for tool in prompt.allowed_tools:
-                            f.write(f"  - {tool}\n")
-                    else:
-                        f.write("# allowed_tools:\n")
-                        f.write("#   - Edit\n")
-                        f.write("#   - Write\n")
-                        f.write("#   - Bash(git:*)\n")
-
-                    # Timeout - optional
-                    if prompt.timeout is not None:
-                        f.write(f"timeout: {prompt.timeout}\n")
-                    else:
-                        f.write("# timeout: 3600\n")
-
-                    # Model - optional
-                    if prompt.model:
-                        f.write(f"model: {prompt.model}\n")
-                    else:
-                        f.write("# model: sonnet  # sonnet|opus|haiku\n")
-
-                    # Bookmark - optional
-                    if prompt.bookmark:
-                        f.write(f"bookmark: {prompt.bookmark}\n")
-                    else:
-                        f.write("# bookmark: feature-name\n")
-
-                    # These are auto-managed fields
-                    f.write(f"created_at: {prompt.created_at.isoformat()}\n")
-                    f.write(f"status: {prompt.status.value}\n")
-                    f.write(f"retry_count: {prompt.retry_count}\n")
-
-                    f.write("---\n\n")
-                    f.write(
-                        prompt.content
-                        if prompt.content
-                        else "# Write your prompt here\n"
-                    )
+                text = MarkdownPromptParser.render_template(prompt)
             else:
                 # Normal mode - only write non-None/non-default fields
-                metadata = {
-                    "priority": prompt.priority,
-                    "working_directory": prompt.working_directory,
-                    "max_retries": prompt.max_retries,
-                    "created_at": prompt.created_at.isoformat(),
-                    "status": prompt.status.value,
-                    "retry_count": prompt.retry_count,
-                }
+                stable = [
+                    ("priority", prompt.priority),
+                    ("working_directory", prompt.working_directory),
+                    ("max_retries", prompt.max_retries),
+                ]
 
                 if prompt.context_files:
-                    metadata["context_files"] = prompt.context_files
+                    stable.append(("context_files", prompt.context_files))
                 if prompt.estimated_tokens:
-                    metadata["estimated_tokens"] = prompt.estimated_tokens
-                if prompt.last_executed:
-                    metadata["last_executed"] = prompt.last_executed.isoformat()
+                    stable.append(("estimated_tokens", prompt.estimated_tokens))
                 if prompt.permission_mode:
-                    metadata["permission_mode"] = prompt.permission_mode
+                    stable.append(("permission_mode", prompt.permission_mode))
                 if prompt.allowed_tools:
-                    metadata["allowed_tools"] = prompt.allowed_tools
+                    stable.append(("allowed_tools", prompt.allowed_tools))
                 if prompt.timeout is not None:  # 0 is valid
-                    metadata["timeout"] = prompt.timeout
+                    stable.append(("timeout", prompt.timeout))
                 if prompt.model:
-                    metadata["model"] = prompt.model
+                    stable.append(("model", prompt.model))
                 if prompt.bookmark:
-                    metadata["bookmark"] = prompt.bookmark
-
-                with open(file_path, "w", encoding="utf-8") as f:
-                    f.write("---\n")
-                    yaml.dump(metadata, f, default_flow_style=False)
-                    f.write("---\n\n")
-                    f.write(prompt.content)
-
-                    if prompt.execution_log:
-                        f.write("\n\n## Execution Log\n\n")
-                        f.write("```\n")
-                        f.write(prompt.execution_log)
-                        f.write("```\n")
-
+                    stable.append(("bookmark", prompt.bookmark))
+
+                parts = [
+                    "---\n",
+                    _dump_stable_frontmatter(stable),
+                    _volatile_frontmatter(prompt),
+                    "---\n\n",
+                    prompt.content,
+                ]
+                if prompt.execution_log:
+                    parts += [
+                        "\n\n## Execution Log\n\n```\n",
+                        prompt.execution_log,
+                        "```\n",
+                    ]
+                text = "".join(parts)
+
+            # Encoded once and written in one call instead of per section
+            file_path.write_bytes(text.encode("utf-8"))
             return True
 
         except Exception as e:
@@ -231,39 +489,101 @@ class QueueStorage:
         ]:
             dir_path.mkdir(parents=True, exist_ok=True)
 
+        # Status -> (target directory, filename suffix, whether to clear the
+        # prompt's queue files first) for _save_single_prompt. A None suffix
+        # is the fixed "<id>-cancelled.md" name
+        self._status_targets: Dict[PromptStatus, Tuple[Path, Optional[str], bool]] = {
+            PromptStatus.QUEUED: (self.queue_dir, ".md", False),
+            PromptStatus.EXECUTING: (self.queue_dir, ".executing.md", True),
+            PromptStatus.COMPLETED: (self.completed_dir, ".md", True),
+            PromptStatus.FAILED: (self.failed_dir, ".md", True),
+            PromptStatus.CANCELLED: (self.failed_dir, None, True),
+        }
+
         self.parser = MarkdownPromptParser()
 
-    def load_queue_state(self, include_completed: bool = False) -> QueueState:
+    def load_queue_state(
+        self,
+        include_completed: bool = False,
+        counters_from: Optional[QueueState] = None,
+        include_failed: bool = True,
+    ) -> QueueState:
         """Load queue state from storage.
 
         Args:
             include_completed: If True, also load completed prompts from the completed directory.
+            counters_from: If given, take the counters and rate limit from this
+                state instead of the state file and only re-read the prompts.
+            include_failed: If False, skip the failed directory and load only the
+                queued and executing prompts needed for scheduling.
         """
         state = QueueState()
 
-        if self.state_file.exists():
-            try:
-                with open(self.state_file, "r") as f:
-                    data = json.load(f)
-
-                state.total_processed = data.get("total_processed", 0)
-                state.failed_count = data.get("failed_count", 0)
-                state.rate_limited_count = data.get("rate_limited_count", 0)
-
-                if data.get("last_processed"):
-                    state.last_processed = datetime.fromisoformat(
-                        data["last_processed"]
-                    )
-
-            except Exception as e:
-                print(f"Error loading queue state: {e}")
+        if counters_from is not None:
+            state.total_processed = counters_from.total_processed
+            state.failed_count = counters_from.failed_count
+            state.rate_limited_count = counters_from.rate_limited_count
+            state.last_processed = counters_from.last_processed
+            state.current_rate_limit = counters_from.current_rate_limit
+        else:
+            self.load_state_counters(state)
 
         state.prompts = self._load_prompts_from_files(
-            include_completed=include_completed
+            include_completed=include_completed, include_failed=include_failed
         )
 
         return state
 
+    def load_state_counters(self, state: QueueState) -> None:
+        """Read the counters saved in the state file into state."""
+        if not self.state_file.exists():
+            return
+
+        try:
+            data = _load_state_json(self.state_file.read_bytes())
+
+            state.total_processed = data.get("total_processed", 0)
+            state.failed_count = data.get("failed_count", 0)
+            state.rate_limited_count = data.get("rate_limited_count", 0)
+
+            last_processed = data.get("last_processed")
+            if isinstance(last_processed, int):
+                # Epoch nanoseconds, as briefly written instead of ISO; whole
+                # seconds and microseconds apart so the value is kept exactly
+                seconds, ns = divmod(last_processed, 1_000_000_000)
+                state.last_processed = datetime.fromtimestamp(seconds).replace(
+                    microsecond=ns // 1000
+                )
+            elif last_processed:
+                state.last_processed = datetime.fromisoformat(last_processed)
+
+        except Exception as e:
+            print(f"Error loading queue state: {e}")
+
+    def get_change_marker(self) -> Tuple[Any, ...]:
+        """Cheap fingerprint of everything load_queue_state reads.
+
+        Compares unequal after any prompt file in the queue or failed
+        directory, or the state file, is added, removed or rewritten.
+        """
+        marker: List[Any] = []
+        for directory in (self.queue_dir, self.failed_dir):
+            try:
+                latest = 0
+                count = 0
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        count += 1
+                        latest = max(latest, entry.stat().st_mtime_ns)
+                marker.append((os.stat(directory).st_mtime_ns, latest, count))
+            except OSError:
+                marker.append(None)
+        try:
+            marker.append(self.state_file.stat().st_mtime_ns)
+        except OSError:
+            marker.append(None)
+        return tuple(marker)
+
     def save_queue_state(self, state: QueueState) -> bool:
         """Save queue state to storage."""
         try:
@@ -279,8 +599,7 @@ class QueueStorage:
                 "updated_at": datetime.now().isoformat(),
             }
 
-            with open(self.state_file, "w") as f:
-                json.dump(state_data, f, indent=2)
+            self.state_file.write_bytes(_dump_state_json(state_data))
 
             return True
 
@@ -289,50 +608,91 @@ class QueueStorage:
             return False
 
     def _load_prompts_from_files(
-        self, include_completed: bool = False
+        self, include_completed: bool = False, include_failed: bool = True
     ) -> List[QueuedPrompt]:
-        """Load all prompts from markdown files."""
-        prompts = []
-        processed_ids = set()
+        """Load all prompts from markdown files.
 
-        for file_path in self.queue_dir.glob("*.executing.md"):
-            prompt = self.parser.parse_prompt_file(file_path)
-            if prompt:
-                prompt.status = PromptStatus.EXECUTING
-                prompts.append(prompt)
-                processed_ids.add(prompt.id)
-
-        for file_path in self.queue_dir.glob("*.md"):
-            if file_path.name.endswith(".executing.md"):
-                continue
+        Files are parsed in a thread pool once there are enough of them, with
+        results taken in scan order so duplicates resolve as for a serial load.
+        """
+        executing_files, queued_files = self._scan_queue_dir()
+        sources = [
+            (PromptStatus.EXECUTING, executing_files),
+            (PromptStatus.QUEUED, queued_files),
+        ]
+        # Load failed prompts from the failed directory
+        if include_failed:
+            failed_files = [
+                file_path
+                for file_path in _scan_prompt_files(self.failed_dir)
+                if "#" not in file_path.name
+            ]
+            sources.append((PromptStatus.FAILED, failed_files))
+        # Load completed prompts if requested
+        if include_completed:
+            sources.append(
+                (PromptStatus.COMPLETED, _scan_prompt_files(self.completed_dir))
+            )
 
-            prompt = self.parser.parse_prompt_file(file_path)
-            if prompt and prompt.id not in processed_ids:
-                prompt.status = PromptStatus.QUEUED
-                prompts.append(prompt)
+        files = [(status, path) for status, paths in sources for path in paths]
+        paths = [path for _, path in files]
+        if len(paths) >= PARALLEL_LOAD_MIN_FILES:
+            workers = min(PARALLEL_LOAD_MAX_WORKERS, os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                parsed = list(executor.map(self.parser.parse_prompt_file, paths))
+        else:
+            parsed = [self.parser.parse_prompt_file(path) for path in paths]
 
-        # Load failed prompts from the failed directory
-        for file_path in self.failed_dir.glob("*.md"):
-            if "#" in file_path.name:
+        prompts = []
+        processed_ids = set()
+        for (status, _), prompt in zip(files, parsed):
+            if not prompt:
                 continue
-
-            prompt = self.parser.parse_prompt_file(file_path)
-            if prompt and prompt.id not in processed_ids:
-                prompt.status = PromptStatus.FAILED
-                prompts.append(prompt)
+            # Executing, failed and completed prompts hide later files with
+            # the same id; queued prompts hide nothing
+            if status != PromptStatus.EXECUTING and prompt.id in processed_ids:
+                continue
+            prompt.status = status
+            prompts.append(prompt)
+            if status != PromptStatus.QUEUED:
                 processed_ids.add(prompt.id)
 
-        # Load completed prompts if requested
-        if include_completed:
-            for file_path in self.completed_dir.glob("*.md"):
-                prompt = self.parser.parse_prompt_file(file_path)
-                if prompt and prompt.id not in processed_ids:
-                    prompt.status = PromptStatus.COMPLETED
-                    prompts.append(prompt)
-                    processed_ids.add(prompt.id)
-
         return prompts
 
+    def load_prompt_headers(self) -> List[PromptHeader]:
+        """Headers of the executing and queued prompts, without their bodies.
+
+        Follows the order and duplicate handling of _load_prompts_from_files,
+        for callers that only need to know which prompt comes next.
+        """
+        headers = []
+        processed_ids = set()
+        executing_files, queued_files = self._scan_queue_dir()
+
+        for file_path in executing_files:
+            header = self.parser.parse_prompt_header(file_path)
+            if header:
+                headers.append(header._replace(status=PromptStatus.EXECUTING))
+                processed_ids.add(header.id)
+
+        for file_path in queued_files:
+            header = self.parser.parse_prompt_header(file_path)
+            if header and header.id not in processed_ids:
+                headers.append(header)
+
+        return headers
+
+    def _scan_queue_dir(self) -> Tuple[List[Path], List[Path]]:
+        """Split the queue directory into executing and queued prompt files."""
+        executing_files = []
+        queued_files = []
+        for file_path in _scan_prompt_files(self.queue_dir):
+            if file_path.name.endswith(".executing.md"):
+                executing_files.append(file_path)
+            else:
+                queued_files.append(file_path)
+        return executing_files, queued_files
+
     def _save_prompts_to_files(self, prompts: List[QueuedPrompt]) -> None:
         """Save prompts to appropriate directories based on status."""
         for prompt in prompts:
@@ -341,54 +701,70 @@ class QueueStorage:
     def _save_single_prompt(self, prompt: QueuedPrompt) -> bool:
         """Save a single prompt to the appropriate location."""
         try:
-            base_filename = MarkdownPromptParser.get_base_filename(prompt)
-            if prompt.status == PromptStatus.COMPLETED:
-                target_dir = self.completed_dir
-                self._remove_prompt_files(prompt.id, self.queue_dir)
-            elif prompt.status == PromptStatus.FAILED:
-                target_dir = self.failed_dir
-                self._remove_prompt_files(prompt.id, self.queue_dir)
-            elif prompt.status == PromptStatus.CANCELLED:
-                target_dir = self.failed_dir
-                base_filename = f"{prompt.id}-cancelled.md"
-                self._remove_prompt_files(prompt.id, self.queue_dir)
-            elif prompt.status == PromptStatus.EXECUTING:
-                target_dir = self.queue_dir
-                base_filename = base_filename.replace(".md", ".executing.md")
-                self._remove_prompt_files(prompt.id, self.queue_dir)
-            else:  # QUEUED
-                target_dir = self.queue_dir
-            file_path = target_dir / base_filename
+            target_dir, suffix, clear_queue = self._status_targets[prompt.status]
+            if suffix is None:
+                filename = f"{prompt.id}-cancelled.md"
+            else:
+                # get_base_filename always ends in ".md"
+                filename = MarkdownPromptParser.get_base_filename(prompt)[:-3] + suffix
+            file_path = target_dir / filename
+            if clear_queue:
+                self._move_prompt_file(prompt.id, file_path)
             return self.parser.write_prompt_file(prompt, file_path)
         except Exception as e:
             print(f"Error saving prompt {prompt.id}: {e}")
             return False
 
+    def _move_prompt_file(self, prompt_id: str, file_path: Path) -> None:
+        """Rename the prompt's queue file to file_path and remove its others.
+
+        The rewrite that follows then updates the renamed file in place, so
+        the prompt keeps a file on disk throughout a status change instead of
+        having none between the removal and the new write.
+        """
+        target = str(file_path)
+        invalidate_parse_cache(target)
+        moved = False
+        for entry in _scan_prompt_entries(self.queue_dir, prompt_id):
+            if entry.path == target:
+                moved = True
+                continue
+            invalidate_parse_cache(entry.path)
+            try:
+                if not moved and "#" not in entry.name:
+                    os.replace(entry.path, target)
+                    moved = True
+                else:
+                    os.unlink(entry.path)
+            except FileNotFoundError:
+                pass  # Already gone, nothing left to remove
+            except OSError:
+                # Across file systems, for one; drop it as a plain removal would
+                try:
+                    os.unlink(entry.path)
+                except OSError as e:
+                    print(f"Error removing file {entry.path}: {e}")
+
     def _remove_prompt_files(self, prompt_id: str, directory: Path) -> None:
         """Remove all files for a prompt ID from a directory, including any status suffixes."""
-        patterns = [
-            f"{prompt_id}.md",
-            f"{prompt_id}*.md",
-        ]
-        for pattern in patterns:
-            for file_path in directory.glob(pattern):
-                try:
-                    file_path.unlink()
-                except Exception as e:
-                    print(f"Error removing file {file_path}: {e}")
-        for file_path in directory.glob(f"{prompt_id}-#*.md"):
+        # Plain string paths straight from the listing, no Path per file
+        for entry in _scan_prompt_entries(directory, prompt_id):
+            invalidate_parse_cache(entry.path)
             try:
-                file_path.unlink()
+                os.unlink(entry.path)
+            except FileNotFoundError:
+                pass  # Already gone, nothing left to remove
             except Exception as e:
-                print(f"Error removing processed file {file_path}: {e}")
+                print(f"Error removing file {entry.path}: {e}")
 
     def delete_prompt_files(self, prompt_id: str) -> bool:
         """Permanently delete all files for a prompt ID from all directories."""
         try:
             files_found = False
             for directory in [self.queue_dir, self.completed_dir, self.failed_dir]:
-                for file_path in directory.glob(f"{prompt_id}*.md"):
+                for file_path in _scan_prompt_files(directory, prompt_id):
                     files_found = True
+                    invalidate_parse_cache(file_path)
                     try:
                         file_path.unlink()
                     except Exception as e:
@@ -400,15 +776,14 @@ class QueueStorage:
             return False
 
     @staticmethod
+    @lru_cache(maxsize=4096)
     def _sanitize_filename_static(text: str) -> str:
-        """Sanitize text for use in filename (static version for use in parser)."""
-        invalid_chars = '<>:"/\\|?*'
-        for char in invalid_chars:
-            text = text.replace(char, "-")
+        """Sanitize text for use in filename (static version for use in parser).
 
-        text = re.sub(r"[-\s]+", "-", text)
-        text = text.strip("-")
-        return text[:50]
+        Cached per text: every save of a prompt sanitizes the same title again.
+        """
+        text = _FILENAME_SEPARATOR_RE.sub("-", text.translate(_FILENAME_INVALID_TABLE))
+        return text.strip("-")[:50]
 
     def add_prompt_from_markdown(self, file_path: Path) -> Optional[QueuedPrompt]:
         """Add a prompt from an existing markdown file."""
@@ -421,15 +796,24 @@ class QueueStorage:
             # Move and rename the file to follow the naming convention
             if file_path != new_path:
                 shutil.move(str(file_path), str(new_path))
+                invalidate_parse_cache(file_path)
 
             prompt.status = PromptStatus.QUEUED
             return prompt
         return None
 
-    def get_prompt_path(self, prompt_id: str) -> Optional[Path]:
-        """Get the file path for a prompt by ID."""
-        # Search in all directories
-        for directory in [self.queue_dir, self.completed_dir, self.failed_dir]:
-            for file_path in directory.glob(f"{prompt_id}*.md"):
+    def get_prompt_path(
+        self, prompt_id: str, directories: Optional[List[Path]] = None
+    ) -> Optional[Path]:
+        """Get the file path for a prompt by ID.
+
+        Args:
+            prompt_id: The prompt ID to look for
+            directories: Directories to search, defaults to all storage directories
+        """
+        if directories is None:
+            directories = [self.queue_dir, self.completed_dir, self.failed_dir]
+        for directory in directories:
+            for file_path in _scan_prompt_files(directory, prompt_id):
                 return file_path
         return None
@@ -40,13 +40,7 @@ def test_jj_integration():
     test_prompt_id = "abc123"
     test_prompt_content = "Add a new feature to handle automatic jj commit creation when working in a jj repository"
 
-    short_desc = test_prompt_content[:80]
-    if len(test_prompt_content) > 80:
-        last_space = short_desc.rfind(" ")
-        if last_space > 60:
-            short_desc = short_desc[:last_space] + "..."
-        else:
-            short_desc = short_desc + "..."
+    short_desc = JujutsuIntegration.short_description(test_prompt_content)
 
     description = f"[{test_prompt_id}] {short_desc}"
     print(f"   Generated description: {description}")
@@ -1,16 +1,39 @@
 """Pytest configuration and shared fixtures."""
 
 from datetime import datetime, timedelta
-from pathlib import Path
+from unittest.mock import Mock
 
 import pytest
 
-from claude_code_queue.models import (
-    PromptStatus,
-    QueuedPrompt,
-    QueueState,
-    RateLimitInfo,
-)
+from claude_code_queue.models import PromptStatus, QueuedPrompt, QueueState
+
+
+@pytest.fixture
+def mock_storage(monkeypatch, empty_state):
+    """Replace the QueueStorage a QueueManager creates with one Mock.
+
+    The mock loads empty_state and reports every save as successful, so a
+    test only overrides the calls it is about.
+    """
+    storage = Mock()
+    storage.load_queue_state.return_value = empty_state
+    storage.save_queue_state.return_value = True
+    monkeypatch.setattr(
+        "claude_code_queue.queue_manager.QueueStorage", lambda *a, **k: storage
+    )
+    return storage
+
+
+@pytest.fixture
+def empty_state():
+    """A fresh, empty queue state for a test to load and fill."""
+    return QueueState()
+
+
+@pytest.fixture(scope="session")
+def future_time():
+    """A reset time an hour after the session started, still ahead in every test."""
+    return datetime.now() + timedelta(hours=1)
 
 
 @pytest.fixture
@@ -1,387 +1,366 @@
 """Tests for CLI commands."""
 
+import copy
+import json
+import os
+import signal
 from argparse import Namespace
-from io import StringIO
-from unittest.mock import MagicMock, Mock, patch
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
 
 import pytest
 
-from claude_code_queue.cli import (
-    handle_add,
-    handle_cancel,
-    handle_list,
-    handle_status,
-    handle_test,
-)
 from claude_code_queue.models import PromptStatus, QueuedPrompt, QueueState
 
+# Arguments of the add command as argparse leaves them without options
+_ADD_TEMPLATE = Namespace(
+    prompt="Test",
+    priority=5,
+    context_files=None,
+    permission_mode=None,
+    allowed_tools=None,
+    prompt_timeout=None,
+    model=None,
+    working_dir=".",
+    max_retries=3,
+    estimated_tokens=None,
+    bookmark=None,
+)
 
-class TestHandleAdd:
-    """Test handle_add CLI command."""
 
-    @patch("claude_code_queue.cli.QueueStorage")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_add_simple_prompt(self, mock_stdout, mock_storage_class):
-        """Test adding a simple prompt."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-        mock_storage.load_queue_state.return_value = QueueState()
-
-        args = Namespace(
-            prompt="Test prompt",
-            priority=5,
-            context_files=None,
-            permission_mode=None,
-            allowed_tools=None,
-            timeout=None,
-            model=None,
-            working_dir=None,
-        )
+def make_add_args(**overrides):
+    """Return add command arguments with the given fields overridden."""
+    args = copy.copy(_ADD_TEMPLATE)
+    for name, value in overrides.items():
+        setattr(args, name, value)
+    return args
 
-        handle_add(args)
 
-        # Storage should save the state
-        mock_storage.save_queue_state.assert_called_once()
+def assert_in_output(capsys, *needles):
+    """Assert the captured stdout contains any of the lowercase needles."""
+    output = capsys.readouterr().out.lower()
+    assert any(needle in output for needle in needles), output
 
-        # Check output
-        output = mock_stdout.getvalue()
-        assert "added" in output.lower()
-
-    @patch("claude_code_queue.cli.QueueStorage")
-    def test_add_prompt_with_priority(self, mock_storage_class):
-        """Test adding prompt with custom priority."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-        state = QueueState()
-        mock_storage.load_queue_state.return_value = state
-
-        args = Namespace(
-            prompt="High priority task",
-            priority=1,
-            context_files=None,
-            permission_mode=None,
-            allowed_tools=None,
-            timeout=None,
-            model=None,
-            working_dir=None,
-        )
 
-        handle_add(args)
-
-        # Check that prompt was added with correct priority
-        assert len(state.prompts) == 1
-        assert state.prompts[0].priority == 1
-
-    @patch("claude_code_queue.cli.QueueStorage")
-    def test_add_prompt_with_context_files(self, mock_storage_class):
-        """Test adding prompt with context files."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-        state = QueueState()
-        mock_storage.load_queue_state.return_value = state
-
-        args = Namespace(
-            prompt="Review files",
-            priority=5,
-            context_files=["file1.py", "file2.py"],
-            permission_mode=None,
-            allowed_tools=None,
-            timeout=None,
-            model=None,
-            working_dir=None,
-        )
+@pytest.fixture(scope="module")
+def queue_prompts():
+    """A queued and an executing prompt, shared by the tests that only read them."""
+    return (
+        QueuedPrompt(id="1", content="Prompt 1", status=PromptStatus.QUEUED),
+        QueuedPrompt(id="2", content="Prompt 2", status=PromptStatus.EXECUTING),
+    )
 
-        handle_add(args)
-
-        assert state.prompts[0].context_files == ["file1.py", "file2.py"]
-
-    @patch("claude_code_queue.cli.QueueStorage")
-    def test_add_prompt_with_model(self, mock_storage_class):
-        """Test adding prompt with specific model."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-        state = QueueState()
-        mock_storage.load_queue_state.return_value = state
-
-        args = Namespace(
-            prompt="Use Opus",
-            priority=5,
-            context_files=None,
-            permission_mode=None,
-            allowed_tools=None,
-            timeout=None,
-            model="opus",
-            working_dir=None,
-        )
 
-        handle_add(args)
-
-        assert state.prompts[0].model == "opus"
-
-    @patch("claude_code_queue.cli.QueueStorage")
-    def test_add_prompt_with_permission_mode(self, mock_storage_class):
-        """Test adding prompt with permission mode."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-        state = QueueState()
-        mock_storage.load_queue_state.return_value = state
-
-        args = Namespace(
-            prompt="Plan mode task",
-            priority=5,
-            context_files=None,
-            permission_mode="plan",
-            allowed_tools=None,
-            timeout=None,
-            model=None,
-            working_dir=None,
-        )
+@pytest.fixture
+def queued_prompt(queue_prompts):
+    """A private copy of the queued prompt for tests that change it."""
+    return copy.deepcopy(queue_prompts[0])
 
-        handle_add(args)
 
-        assert state.prompts[0].permission_mode == "plan"
+@pytest.fixture(scope="session")
+def cli():
+    """The CLI module, imported when the first test needs it."""
+    import claude_code_queue.cli as cli_module
 
+    return cli_module
 
-class TestHandleStatus:
-    """Test handle_status CLI command."""
 
-    @patch("claude_code_queue.cli.QueueStorage")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_status_empty_queue(self, mock_stdout, mock_storage_class):
-        """Test status with empty queue."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-        mock_storage.load_queue_state.return_value = QueueState()
+@pytest.fixture
+def manager(mock_storage):
+    """A queue manager whose storage is the shared mock."""
+    from claude_code_queue.queue_manager import QueueManager
 
-        args = Namespace(json=False)
-        handle_status(args)
+    return QueueManager(storage_dir="/tmp/test-queue")
 
-        output = mock_stdout.getvalue()
-        assert "queue" in output.lower()
 
-    @patch("claude_code_queue.cli.QueueStorage")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_status_with_prompts(self, mock_stdout, mock_storage_class):
-        """Test status with prompts in queue."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
+class TestCmdAdd:
+    """Test cmd_add CLI command."""
 
-        state = QueueState()
-        state.prompts = [
-            QueuedPrompt(id="1", status=PromptStatus.QUEUED),
-            QueuedPrompt(id="2", status=PromptStatus.EXECUTING),
-        ]
-        state.total_processed = 10
-        state.failed_count = 2
+    def test_add_simple_prompt(self, cli, capsys, manager, mock_storage):
+        """Test adding a simple prompt."""
+        args = make_add_args(prompt="Test prompt")
+
+        cli.cmd_add(manager, args)
 
-        mock_storage.load_queue_state.return_value = state
+        # Storage should save the state
+        mock_storage.save_queue_state.assert_called_once()
+
+        # Check output
+        assert_in_output(capsys, "added")
+
+    @pytest.mark.parametrize(
+        "overrides,attr,expected",
+        [
+            ({"priority": 1}, "priority", 1),
+            (
+                {"context_files": ["file1.py", "file2.py"]},
+                "context_files",
+                ["file1.py", "file2.py"],
+            ),
+            ({"model": "opus"}, "model", "opus"),
+            ({"permission_mode": "plan"}, "permission_mode", "plan"),
+            ({"allowed_tools": ["Read", "Edit"]}, "allowed_tools", ["Read", "Edit"]),
+        ],
+    )
+    def test_add_variants(self, cli, manager, empty_state, overrides, attr, expected):
+        """Test each prompt option is carried over to the queued prompt."""
+        cli.cmd_add(manager, make_add_args(**overrides))
+
+        assert len(empty_state.prompts) == 1
+        assert getattr(empty_state.prompts[0], attr) == expected
+
+
+class TestCmdStatus:
+    """Test cmd_status CLI command."""
+
+    def test_status_empty_queue(self, cli, capsys, manager):
+        """Test status with empty queue."""
+        args = Namespace(json=False, detailed=False)
+        cli.cmd_status(manager, args)
 
-        args = Namespace(json=False)
-        handle_status(args)
+        assert_in_output(capsys, "queue")
 
-        output = mock_stdout.getvalue()
+    def test_status_with_prompts(
+        self, cli, capsys, manager, empty_state, queue_prompts
+    ):
+        """Test status with prompts in queue."""
+        empty_state.prompts = list(queue_prompts)
+        empty_state.total_processed = 10
+        empty_state.failed_count = 2
+
+        args = Namespace(json=False, detailed=False)
+        cli.cmd_status(manager, args)
+
+        output = capsys.readouterr().out
         assert "10" in output  # total_processed
         assert "2" in output  # failed_count
 
-    @patch("claude_code_queue.cli.QueueStorage")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_status_json_output(self, mock_stdout, mock_storage_class):
+    def test_status_json_output(self, cli, capsys, manager, empty_state):
         """Test status with JSON output."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
+        empty_state.total_processed = 5
 
-        state = QueueState()
-        state.total_processed = 5
-        mock_storage.load_queue_state.return_value = state
+        args = Namespace(json=True, detailed=False)
+        cli.cmd_status(manager, args)
 
-        args = Namespace(json=True)
-        handle_status(args)
+        parsed = json.loads(capsys.readouterr().out)
+        assert parsed["total_processed"] == 5
+        assert parsed["total_prompts"] == 0
 
-        output = mock_stdout.getvalue()
-        # Should contain JSON
-        assert "{" in output
-        assert "}" in output
 
+class TestCmdList:
+    """Test cmd_list CLI command."""
 
-class TestHandleList:
-    """Test handle_list CLI command."""
-
-    @patch("claude_code_queue.cli.QueueStorage")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_list_all_prompts(self, mock_stdout, mock_storage_class):
+    def test_list_all_prompts(self, cli, capsys, manager, empty_state, queue_prompts):
         """Test listing all prompts."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-
-        state = QueueState()
-        state.prompts = [
-            QueuedPrompt(id="1", content="Prompt 1", status=PromptStatus.QUEUED),
-            QueuedPrompt(id="2", content="Prompt 2", status=PromptStatus.EXECUTING),
-        ]
-        mock_storage.load_queue_state.return_value = state
+        empty_state.prompts = list(queue_prompts)
 
-        args = Namespace(status=None, json=False)
-        handle_list(args)
+        args = Namespace(status=None, json=False, all=False)
+        cli.cmd_list(manager, args)
 
-        output = mock_stdout.getvalue()
+        output = capsys.readouterr().out
         assert "Prompt 1" in output
         assert "Prompt 2" in output
 
-    @patch("claude_code_queue.cli.QueueStorage")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_list_filtered_by_status(self, mock_stdout, mock_storage_class):
+    def test_list_filtered_by_status(
+        self, cli, capsys, manager, empty_state, queue_prompts
+    ):
         """Test listing prompts filtered by status."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
+        empty_state.prompts = list(queue_prompts)
 
-        state = QueueState()
-        state.prompts = [
-            QueuedPrompt(id="1", content="Queued", status=PromptStatus.QUEUED),
-            QueuedPrompt(id="2", content="Executing", status=PromptStatus.EXECUTING),
+        args = Namespace(status="queued", json=False, all=False)
+        cli.cmd_list(manager, args)
+
+        output = capsys.readouterr().out
+        assert "Prompt 1" in output
+        # Should not show executing prompt
+        assert "Prompt 2" not in output
+
+    def test_list_keeps_queue_order_for_equal_priorities(
+        self, cli, capsys, manager, empty_state
+    ):
+        """Test JSON lists in queue order and text sorts stably by priority."""
+        now = datetime.now()
+        empty_state.prompts = [
+            QueuedPrompt(id="new", priority=1, created_at=now),
+            QueuedPrompt(id="urgent", priority=0, created_at=now),
+            QueuedPrompt(id="old", priority=1, created_at=now - timedelta(hours=1)),
         ]
-        mock_storage.load_queue_state.return_value = state
 
-        args = Namespace(status="queued", json=False)
-        handle_list(args)
+        cli.cmd_list(manager, Namespace(status=None, json=True, all=False))
+        listed = json.loads(capsys.readouterr().out)
+        assert [item["id"] for item in listed] == ["new", "urgent", "old"]
 
-        output = mock_stdout.getvalue()
-        assert "Queued" in output
-        # Should not show executing prompt
-        assert "Executing" not in output
+        cli.cmd_list(manager, Namespace(status=None, json=False, all=False))
+        output = capsys.readouterr().out
+        assert output.index("urgent") < output.index("new") < output.index("old")
 
-    @patch("claude_code_queue.cli.QueueStorage")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_list_empty_queue(self, mock_stdout, mock_storage_class):
+    def test_list_empty_queue(self, cli, capsys, manager):
         """Test listing when queue is empty."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-        mock_storage.load_queue_state.return_value = QueueState()
+        args = Namespace(status=None, json=False, all=False)
+        cli.cmd_list(manager, args)
 
-        args = Namespace(status=None, json=False)
-        handle_list(args)
+        assert_in_output(capsys, "no prompts", "empty")
 
-        output = mock_stdout.getvalue()
-        assert "no prompts" in output.lower() or "empty" in output.lower()
 
+class TestCmdCancel:
+    """Test cmd_cancel CLI command."""
 
-class TestHandleCancel:
-    """Test handle_cancel CLI command."""
-
-    @patch("claude_code_queue.cli.QueueStorage")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_cancel_existing_prompt(self, mock_stdout, mock_storage_class):
+    def test_cancel_existing_prompt(
+        self, cli, capsys, manager, mock_storage, empty_state, queued_prompt
+    ):
         """Test cancelling an existing prompt."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-
-        state = QueueState()
-        prompt = QueuedPrompt(
-            id="test-123", content="To cancel", status=PromptStatus.QUEUED
-        )
-        state.prompts = [prompt]
-        mock_storage.load_queue_state.return_value = state
+        prompt = queued_prompt
+        empty_state.prompts = [prompt]
 
-        args = Namespace(prompt_id="test-123")
-        handle_cancel(args)
+        args = Namespace(prompt_id=prompt.id)
+        cli.cmd_cancel(manager, args)
 
         # Prompt should be cancelled
         assert prompt.status == PromptStatus.CANCELLED
         mock_storage.save_queue_state.assert_called_once()
 
-        output = mock_stdout.getvalue()
-        assert "cancelled" in output.lower()
+        assert_in_output(capsys, "cancelled")
 
-    @patch("claude_code_queue.cli.QueueStorage")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_cancel_nonexistent_prompt(self, mock_stdout, mock_storage_class):
+    def test_cancel_nonexistent_prompt(self, cli, capsys, manager):
         """Test cancelling a non-existent prompt."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-        mock_storage.load_queue_state.return_value = QueueState()
-
         args = Namespace(prompt_id="nonexistent")
-        handle_cancel(args)
+        cli.cmd_cancel(manager, args)
+
+        assert_in_output(capsys, "not found")
+
+
+@pytest.fixture(scope="class")
+def interface_class():
+    """Patch the Claude interface class once for the tests of a class."""
+    with patch(
+        "claude_code_queue.queue_manager.ClaudeCodeInterface", new_callable=Mock
+    ) as mock_class:
+        yield mock_class
+
+
+class TestCmdTest:
+    """Test cmd_test CLI command."""
+
+    @pytest.mark.parametrize(
+        "connection,exit_code,needles",
+        [
+            ((True, "Working"), 0, ("working", "success")),
+            ((False, "Connection failed"), 1, ("failed",)),
+        ],
+    )
+    def test_test_connection(
+        self, cli, interface_class, capsys, manager, connection, exit_code, needles
+    ):
+        """Test the connection check result is printed and sets the exit code."""
+        mock_interface = Mock()
+        mock_interface.test_connection.return_value = connection
+        interface_class.return_value = mock_interface
 
-        output = mock_stdout.getvalue()
-        assert "not found" in output.lower()
+        assert cli.cmd_test(manager, Namespace()) == exit_code
+        assert_in_output(capsys, *needles)
 
 
-class TestHandleTest:
-    """Test handle_test CLI command."""
+class TestCLIArgumentParsing:
+    """Test CLI argument parsing and validation."""
 
-    @patch("claude_code_queue.cli.ClaudeCodeInterface")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_test_connection_success(self, mock_stdout, mock_interface_class):
-        """Test successful connection test."""
-        mock_interface = Mock()
-        mock_interface.test_connection.return_value = (True, "Working")
-        mock_interface_class.return_value = mock_interface
+    def test_add_with_invalid_permission_mode_raises_error(self, cli, manager):
+        """Test that invalid permission mode raises error during add."""
+        args = make_add_args(permission_mode="invalid_mode")
 
-        args = Namespace(claude_command="claude", timeout=3600)
-        handle_test(args)
+        # Should raise ValueError due to invalid permission mode
+        with pytest.raises(ValueError):
+            cli.cmd_add(manager, args)
 
-        output = mock_stdout.getvalue()
-        assert "working" in output.lower() or "success" in output.lower()
 
-    @patch("claude_code_queue.cli.ClaudeCodeInterface")
-    @patch("sys.stdout", new_callable=StringIO)
-    def test_test_connection_failure(self, mock_stdout, mock_interface_class):
-        """Test failed connection test."""
-        mock_interface = Mock()
-        mock_interface.test_connection.return_value = (False, "Connection failed")
-        mock_interface_class.return_value = mock_interface
+class TestMainArgumentParsing:
+    """Test how main() splits the command line between the parsers."""
 
-        args = Namespace(claude_command="claude", timeout=3600)
-        handle_test(args)
+    def test_add_dash_prefixed_prompt_after_double_dash(
+        self, cli, monkeypatch, tmp_path
+    ):
+        """Test 'add -- -text' adds the dash-prefixed text as the prompt."""
+        from claude_code_queue.storage import QueueStorage
 
-        output = mock_stdout.getvalue()
-        assert "failed" in output.lower()
+        monkeypatch.setattr(
+            "sys.argv",
+            ["claude-queue", "--storage-dir", str(tmp_path), "add", "--", "-fix it"],
+        )
 
+        assert cli.main() == 0
+        state = QueueStorage(str(tmp_path)).load_queue_state()
+        assert [prompt.content for prompt in state.prompts] == ["-fix it"]
 
-class TestCLIArgumentParsing:
-    """Test CLI argument parsing and validation."""
+    def test_command_options_after_prompt(self, cli, monkeypatch, tmp_path):
+        """Test command options are still parsed after the prompt text."""
+        from claude_code_queue.storage import QueueStorage
 
-    @patch("claude_code_queue.cli.QueueStorage")
-    def test_add_with_invalid_permission_mode_raises_error(self, mock_storage_class):
-        """Test that invalid permission mode raises error during add."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-        mock_storage.load_queue_state.return_value = QueueState()
-
-        args = Namespace(
-            prompt="Test",
-            priority=5,
-            context_files=None,
-            permission_mode="invalid_mode",
-            allowed_tools=None,
-            timeout=None,
-            model=None,
-            working_dir=None,
+        monkeypatch.setattr(
+            "sys.argv",
+            ["claude-queue", "--storage-dir", str(tmp_path), "add", "Fix", "-p", "4"],
         )
 
-        # Should raise ValueError due to invalid permission mode
-        with pytest.raises(ValueError):
-            handle_add(args)
-
-    @patch("claude_code_queue.cli.QueueStorage")
-    def test_add_with_allowed_tools_list(self, mock_storage_class):
-        """Test adding prompt with allowed tools list."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-        state = QueueState()
-        mock_storage.load_queue_state.return_value = state
-
-        args = Namespace(
-            prompt="Test",
-            priority=5,
-            context_files=None,
-            permission_mode=None,
-            allowed_tools=["Read", "Edit"],
-            timeout=None,
-            model=None,
-            working_dir=None,
-        )
+        assert cli.main() == 0
+        state = QueueStorage(str(tmp_path)).load_queue_state()
+        assert [prompt.priority for prompt in state.prompts] == [4]
 
-        handle_add(args)
 
-        assert state.prompts[0].allowed_tools == ["Read", "Edit"]
+class TestPathFastPath:
+    """Test the argparse-free 'path <id>' route through main()."""
+
+    @pytest.fixture
+    def storage_dir(self, cli, monkeypatch, tmp_path):
+        """Point the fast path's default storage at a queue with one prompt."""
+        from claude_code_queue.storage import QueueStorage
+
+        storage = QueueStorage(str(tmp_path))
+        storage.save_queue_state(
+            QueueState(prompts=[QueuedPrompt(id="abc123", content="Fast path")])
+        )
+        monkeypatch.setattr(cli, "DEFAULT_STORAGE_DIR", str(tmp_path))
+        return tmp_path
+
+    def test_path_by_id(self, cli, capsys, monkeypatch, storage_dir):
+        """Test 'path <id>' prints the prompt's file and exits 0."""
+        monkeypatch.setattr("sys.argv", ["claude-queue", "path", "abc123"])
+
+        assert cli.main() == 0
+        output = capsys.readouterr().out.strip()
+        assert output == str(storage_dir / "queue" / "abc123-Fast-path.md")
+
+    def test_path_next(self, cli, capsys, monkeypatch, storage_dir):
+        """Test 'path next' prints the next prompt's file and exits 0."""
+        monkeypatch.setattr("sys.argv", ["claude-queue", "path", "next"])
+
+        assert cli.main() == 0
+        output = capsys.readouterr().out.strip()
+        assert output == str(storage_dir / "queue" / "abc123-Fast-path.md")
+
+
+class TestSpawnEditor:
+    """Test spawn_editor."""
+
+    @pytest.mark.skipif(
+        not hasattr(os, "posix_spawnp"), reason="editor is started by posix_spawnp"
+    )
+    def test_interrupted_wait_terminates_editor(self, cli):
+        """Test the editor is terminated and reaped when the wait is interrupted."""
+        # "sleep 30" stands in for an editor the user is still working in
+        wait_for_editor = cli.spawn_editor("sleep", "30")
+        real_waitpid = os.waitpid
+        reaped = []
+
+        def waitpid(pid, options):
+            if not reaped:
+                reaped.append(None)
+                raise KeyboardInterrupt
+            result = real_waitpid(pid, options)
+            reaped.append(result)
+            return result
+
+        with patch.object(cli.os, "waitpid", side_effect=waitpid):
+            with pytest.raises(KeyboardInterrupt):
+                wait_for_editor()
+
+        _, status = reaped[1]
+        assert os.WIFSIGNALED(status)
+        assert os.WTERMSIG(status) == signal.SIGTERM
@@ -0,0 +1,238 @@
+"""Unit tests for jj_integration module."""
+
+import subprocess
+from unittest.mock import Mock, patch
+
+import pytest
+
+from claude_code_queue.jj_integration import JJ_TIMEOUT, JujutsuIntegration
+
+
+@pytest.fixture(autouse=True)
+def clear_repo_cache():
+    """Start and end every test with empty repository and bookmark caches."""
+    JujutsuIntegration.invalidate_repo_cache()
+    JujutsuIntegration.invalidate_bookmark_cache()
+    yield
+    JujutsuIntegration.invalidate_repo_cache()
+    JujutsuIntegration.invalidate_bookmark_cache()
+
+
+class TestIsJjRepository:
+    """Test jj repository detection."""
+
+    def test_detects_repository_root(self, tmp_path):
+        """Test a directory containing .jj is a repository."""
+        (tmp_path / ".jj").mkdir()
+        assert JujutsuIntegration.is_jj_repository(str(tmp_path)) is True
+
+    def test_detects_repository_from_subdirectory(self, tmp_path):
+        """Test a nested directory inside a jj repository is detected."""
+        (tmp_path / ".jj").mkdir()
+        nested = tmp_path / "src" / "pkg"
+        nested.mkdir(parents=True)
+        assert JujutsuIntegration.is_jj_repository(str(nested)) is True
+
+    def test_plain_directory_is_not_repository(self, tmp_path):
+        """Test a directory without .jj is not a repository."""
+        assert JujutsuIntegration.is_jj_repository(str(tmp_path)) is False
+
+    def test_missing_directory_is_not_repository(self, tmp_path):
+        """Test a nonexistent directory is not a repository."""
+        assert JujutsuIntegration.is_jj_repository(str(tmp_path / "missing")) is False
+
+    def test_result_is_cached(self, tmp_path):
+        """Test repeated checks reuse the cached result."""
+        (tmp_path / ".jj").mkdir()
+        assert JujutsuIntegration.is_jj_repository(str(tmp_path)) is True
+
+        with patch("claude_code_queue.jj_integration._find_jj_dir") as mock_find:
+            assert JujutsuIntegration.is_jj_repository(str(tmp_path)) is True
+            mock_find.assert_not_called()
+
+    def test_invalidate_repo_cache(self, tmp_path):
+        """Test invalidating the cache picks up a newly created repository."""
+        assert JujutsuIntegration.is_jj_repository(str(tmp_path)) is False
+
+        (tmp_path / ".jj").mkdir()
+        JujutsuIntegration.invalidate_repo_cache(str(tmp_path))
+
+        assert JujutsuIntegration.is_jj_repository(str(tmp_path)) is True
+
+
+class TestJjCommands:
+    """Test jj subcommand invocation."""
+
+    @patch("subprocess.run")
+    def test_set_bookmark_invokes_jj(self, mock_run, tmp_path):
+        """Test set_bookmark runs 'jj bookmark set' in the working directory."""
+        mock_run.return_value = Mock(returncode=0, stdout="", stderr="")
+
+        success, message = JujutsuIntegration.set_bookmark(str(tmp_path), "feature")
+
+        assert success is True
+        assert "feature" in message
+        args, kwargs = mock_run.call_args
+        assert args[0] == ["jj", "bookmark", "set", "feature"]
+        assert kwargs["cwd"] == str(tmp_path)
+        assert kwargs["timeout"] == JJ_TIMEOUT
+
+    @patch("subprocess.run")
+    def test_set_bookmark_timeout(self, mock_run, tmp_path):
+        """Test a hanging jj call is reported as a timeout."""
+        mock_run.side_effect = subprocess.TimeoutExpired(cmd="jj", timeout=JJ_TIMEOUT)
+
+        success, message = JujutsuIntegration.set_bookmark(
+            str(tmp_path), "feature", create=True
+        )
+
+        assert success is False
+        assert "Timeout" in message
+
+
+class TestBookmarkCache:
+    """Test bookmark listings are reused between checks."""
+
+    @patch("subprocess.run")
+    def test_bookmark_list_is_reused(self, mock_run, tmp_path):
+        """Test several bookmark checks run 'jj bookmark list' once."""
+        mock_run.return_value = Mock(
+            returncode=0, stdout=b"main\nfeature\n", stderr=b""
+        )
+
+        assert JujutsuIntegration.bookmark_exists(str(tmp_path), "main") is True
+        assert JujutsuIntegration.bookmark_exists(str(tmp_path), "feature") is True
+        assert JujutsuIntegration.bookmark_exists(str(tmp_path), "other") is False
+        assert mock_run.call_count == 1
+        args, _ = mock_run.call_args
+        assert args[0][:4] == ["jj", "bookmark", "list", "--all"]
+        assert "-T" in args[0]
+
+    @patch("subprocess.run")
+    def test_remote_bookmark_is_not_local(self, mock_run, tmp_path):
+        """Test a bookmark only present on a remote does not count as existing."""
+        mock_run.return_value = Mock(
+            returncode=0, stdout=b"main\nmain@origin\nfeature@origin\n", stderr=b""
+        )
+
+        assert JujutsuIntegration.bookmark_exists(str(tmp_path), "main") is True
+        assert JujutsuIntegration.bookmark_exists(str(tmp_path), "feature") is False
+
+    @patch("subprocess.run")
+    def test_set_bookmark_invalidates_cache(self, mock_run, tmp_path):
+        """Test setting a bookmark forces the next check to list again."""
+        mock_run.return_value = Mock(returncode=0, stdout=b"main\n", stderr=b"")
+        assert JujutsuIntegration.bookmark_exists(str(tmp_path), "feature") is False
+
+        JujutsuIntegration.set_bookmark(str(tmp_path), "feature", create=True)
+        mock_run.return_value = Mock(
+            returncode=0, stdout=b"main\nfeature\n", stderr=b""
+        )
+
+        assert JujutsuIntegration.bookmark_exists(str(tmp_path), "feature") is True
+        assert mock_run.call_count == 3
+
+    @patch("subprocess.run")
+    def test_failed_listing_is_not_cached(self, mock_run, tmp_path):
+        """Test a failing 'jj bookmark list' is retried on the next check."""
+        mock_run.return_value = Mock(returncode=1, stdout=b"", stderr=b"error")
+
+        assert JujutsuIntegration.bookmark_exists(str(tmp_path), "main") is False
+        assert JujutsuIntegration.bookmark_exists(str(tmp_path), "main") is False
+        assert mock_run.call_count == 2
+
+
+class TestHasWorkingCopyChanges:
+    """Test working-copy change detection."""
+
+    @pytest.mark.parametrize("stdout,expected", [(b"1", True), (b"0", False)])
+    @patch("subprocess.run")
+    def test_reads_template_output(self, mock_run, tmp_path, stdout, expected):
+        """Test the one-token jj log answer is mapped to has_changes."""
+        (tmp_path / ".jj").mkdir()
+        mock_run.return_value = Mock(returncode=0, stdout=stdout, stderr=b"")
+
+        assert JujutsuIntegration.has_working_copy_changes(str(tmp_path)) == (
+            expected,
+            None,
+        )
+        args, _ = mock_run.call_args
+        assert args[0][:5] == ["jj", "log", "-r", "@", "--no-graph"]
+
+    @patch("subprocess.run")
+    def test_reports_jj_failure(self, mock_run, tmp_path):
+        """Test a failing jj call returns its stderr."""
+        (tmp_path / ".jj").mkdir()
+        mock_run.return_value = Mock(returncode=1, stdout=b"", stderr=b"broken")
+
+        has_changes, error = JujutsuIntegration.has_working_copy_changes(str(tmp_path))
+
+        assert has_changes is False
+        assert "broken" in error
+
+
+class TestPrepareDispatch:
+    """Test the single discovery pass for a dispatch."""
+
+    def test_repository_context(self, tmp_path):
+        """Test a jj repository yields a context that creates changes."""
+        (tmp_path / ".jj").mkdir()
+        nested = tmp_path / "src"
+        nested.mkdir()
+
+        with patch("claude_code_queue.jj_integration.is_jj_available") as available:
+            available.return_value = True
+            context = JujutsuIntegration.prepare_dispatch(str(nested))
+
+        assert context.should_create_change is True
+        assert context.skip_reason is None
+        assert context.repo_root == str(tmp_path.resolve())
+
+    def test_jj_missing_context(self, tmp_path):
+        """Test a missing jj binary is reported before the repository check."""
+        with patch("claude_code_queue.jj_integration.is_jj_available") as available:
+            available.return_value = False
+            context = JujutsuIntegration.prepare_dispatch(str(tmp_path))
+
+        assert context.should_create_change is False
+        assert context.skip_reason == "jj not in PATH"
+
+    @patch("subprocess.run")
+    def test_has_changes_reuses_context(self, mock_run, tmp_path):
+        """Test passing the context skips the repository walk and records the result."""
+        (tmp_path / ".jj").mkdir()
+        mock_run.return_value = Mock(returncode=0, stdout=b"1", stderr=b"")
+        with patch("claude_code_queue.jj_integration.is_jj_available") as available:
+            available.return_value = True
+            context = JujutsuIntegration.prepare_dispatch(str(tmp_path))
+
+        with patch("claude_code_queue.jj_integration._find_jj_dir") as mock_find:
+            result = JujutsuIntegration.has_working_copy_changes(str(tmp_path), context)
+            mock_find.assert_not_called()
+
+        assert result == (True, None)
+        assert context.has_changes is True
+
+
+class TestShortDescription:
+    """Test the change description shortening."""
+
+    def test_short_content_unchanged(self):
+        """Test content within the width is used as is."""
+        assert JujutsuIntegration.short_description("Fix the bug") == "Fix the bug"
+
+    def test_uses_first_line(self):
+        """Test only the first line of a multi-line prompt is used."""
+        content = "Fix the bug\n\nMore details follow here."
+        assert JujutsuIntegration.short_description(content) == "Fix the bug"
+
+    def test_breaks_at_word_boundary(self):
+        """Test long content is cut at the last space past the minimum cut."""
+        content = "word " * 30
+        result = JujutsuIntegration.short_description(content)
+        assert result == ("word " * 16).rstrip() + "..."
+
+    def test_hard_cut_without_spaces(self):
+        """Test content without a usable space is cut at the width."""
+        content = "x" * 100
+        assert JujutsuIntegration.short_description(content) == "x" * 80 + "..."
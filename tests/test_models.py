@@ -1,5 +1,6 @@
 """Unit tests for models module."""
 
+import random
 from datetime import datetime, timedelta
 
 import pytest
@@ -11,8 +12,25 @@ from claude_code_queue.models import (
     QueuedPrompt,
     QueueState,
     RateLimitInfo,
+    RequestBucket,
+    ResultKind,
 )
 
+# Fixed clock for the rate limit tests, passed as now to the state checks
+NOW = datetime(2024, 1, 1, 12, 0, 0)
+PAST = datetime(2024, 1, 1, 11, 0, 0)
+FUTURE = datetime(2024, 1, 1, 13, 0, 0)
+
+
+@pytest.fixture(scope="module")
+def stats_state():
+    """A queue with two queued and one executing prompt, for tests that only read it."""
+    state = QueueState(total_processed=10, failed_count=2)
+    state.add_prompt(QueuedPrompt(id="1", status=PromptStatus.QUEUED))
+    state.add_prompt(QueuedPrompt(id="2", status=PromptStatus.QUEUED))
+    state.add_prompt(QueuedPrompt(id="3", status=PromptStatus.EXECUTING))
+    return state
+
 
 class TestPromptStatus:
     """Test PromptStatus enum."""
@@ -29,13 +47,19 @@ class TestPromptStatus:
         actual = {status.name for status in PromptStatus}
         assert actual == expected
 
-    def test_status_values(self):
+    @pytest.mark.parametrize(
+        "status,value",
+        [
+            (PromptStatus.QUEUED, "queued"),
+            (PromptStatus.EXECUTING, "executing"),
+            (PromptStatus.COMPLETED, "completed"),
+            (PromptStatus.FAILED, "failed"),
+            (PromptStatus.CANCELLED, "cancelled"),
+        ],
+    )
+    def test_status_values(self, status, value):
         """Verify status string values."""
-        assert PromptStatus.QUEUED.value == "queued"
-        assert PromptStatus.EXECUTING.value == "executing"
-        assert PromptStatus.COMPLETED.value == "completed"
-        assert PromptStatus.FAILED.value == "failed"
-        assert PromptStatus.CANCELLED.value == "cancelled"
+        assert status.value == value
 
 
 class TestQueuedPrompt:
@@ -65,8 +89,10 @@ class TestQueuedPrompt:
             model="opus",
             permission_mode="acceptEdits",
             timeout=600,
+            created_at=now,
         )
         assert prompt.id == "custom-123"
+        assert prompt.created_at == now
         assert prompt.content == "Test content"
         assert prompt.priority == 5
         assert prompt.working_directory == "/tmp/test"
@@ -74,11 +100,11 @@ class TestQueuedPrompt:
         assert prompt.permission_mode == "acceptEdits"
         assert prompt.timeout == 600
 
-    def test_valid_permission_modes(self):
-        """Test all valid permission modes are accepted."""
-        for mode in VALID_PERMISSION_MODES:
-            prompt = QueuedPrompt(permission_mode=mode)
-            assert prompt.permission_mode == mode
+    # Sorted: set order changes with hash seeds and xdist workers must agree
+    @pytest.mark.parametrize("mode", sorted(VALID_PERMISSION_MODES))
+    def test_valid_permission_mode(self, mode):
+        """Test each valid permission mode is accepted."""
+        assert QueuedPrompt(permission_mode=mode).permission_mode == mode
 
     def test_invalid_permission_mode_raises_error(self):
         """Test invalid permission mode raises ValueError."""
@@ -91,38 +117,55 @@ class TestQueuedPrompt:
         prompt.add_log("Test message 1")
         prompt.add_log("Test message 2")
 
-        assert "Test message 1" in prompt.execution_log
-        assert "Test message 2" in prompt.execution_log
-        assert prompt.execution_log.count("[") == 2  # Two timestamp entries
-
-    def test_can_retry_when_failed_with_retries_remaining(self):
-        """Test can_retry returns True for failed prompts with retries left."""
-        prompt = QueuedPrompt(status=PromptStatus.FAILED, retry_count=1, max_retries=3)
-        assert prompt.can_retry() is True
-
-    def test_cannot_retry_when_max_retries_exceeded(self):
-        """Test can_retry returns False when max retries exceeded."""
-        prompt = QueuedPrompt(status=PromptStatus.FAILED, retry_count=3, max_retries=3)
-        assert prompt.can_retry() is False
+        # One timestamped line per entry
+        lines = prompt.execution_log.splitlines()
+        assert len(lines) == 2
+        assert lines[0].startswith("[") and lines[0].endswith("] Test message 1")
+        assert lines[1].startswith("[") and lines[1].endswith("] Test message 2")
 
-    def test_cannot_retry_when_completed(self):
-        """Test can_retry returns False for completed prompts."""
-        prompt = QueuedPrompt(
-            status=PromptStatus.COMPLETED, retry_count=0, max_retries=3
-        )
-        assert prompt.can_retry() is False
-
-    def test_cannot_retry_when_cancelled(self):
-        """Test can_retry returns False for cancelled prompts."""
+    def test_add_log_after_reading(self):
+        """Test entries added after a read are appended in order."""
+        prompt = QueuedPrompt()
+        prompt.add_log("first")
+        prompt.add_log("second")
+        assert prompt.execution_log.endswith("second\n")
+
+        prompt.add_log("third")
+        log = prompt.execution_log
+        assert log.index("first") < log.index("second") < log.index("third")
+        assert log.count("\n") == 3
+
+        prompt.execution_log = ""
+        assert prompt.execution_log == ""
+
+    def test_execution_log_constructor_argument(self):
+        """Test execution_log is accepted by the constructor and compared."""
+        created_at = datetime.now()
+        prompt = QueuedPrompt(id="1", created_at=created_at, execution_log="old\n")
+        prompt.add_log("new")
+
+        assert prompt.execution_log.startswith("old\n")
+        assert prompt != QueuedPrompt(id="1", created_at=created_at)
+        assert QueuedPrompt(
+            id="1", created_at=created_at, execution_log="old\n"
+        ) == QueuedPrompt(id="1", created_at=created_at, execution_log="old\n")
+
+    @pytest.mark.parametrize(
+        "status,retry_count,max_retries,expected",
+        [
+            (PromptStatus.FAILED, 1, 3, True),
+            (PromptStatus.FAILED, 3, 3, False),
+            (PromptStatus.COMPLETED, 0, 3, False),
+            (PromptStatus.CANCELLED, 0, 3, False),
+            (PromptStatus.QUEUED, 0, 3, False),
+        ],
+    )
+    def test_can_retry(self, status, retry_count, max_retries, expected):
+        """Test only failed prompts with retries left can be retried."""
         prompt = QueuedPrompt(
-            status=PromptStatus.CANCELLED, retry_count=0, max_retries=3
+            status=status, retry_count=retry_count, max_retries=max_retries
         )
-        assert prompt.can_retry() is False
-
-    def test_cannot_retry_when_queued(self):
-        """Test can_retry returns False for queued prompts."""
-        prompt = QueuedPrompt(status=PromptStatus.QUEUED, retry_count=0, max_retries=3)
-        assert prompt.can_retry() is False
+        assert prompt.can_retry() is expected
 
 
 class TestRateLimitInfo:
@@ -142,43 +185,57 @@ class TestRateLimitInfo:
         info = RateLimitInfo.from_claude_response(response)
         assert info.is_rate_limited is False
 
-    def test_from_claude_response_rate_limit_detected(self):
-        """Test parsing response with rate limit indicator."""
-        response = "Error: Rate limit exceeded. Please try again later."
+    @pytest.mark.parametrize(
+        "response",
+        [
+            "Error: Rate limit exceeded. Please try again later.",
+            "Usage limit reached for this hour.",
+            "Too many requests. Please wait.",
+            "API quota exceeded.",
+            "Limit exceeded. Try again in 30 minutes.",
+            "RATE LIMIT EXCEEDED",
+        ],
+    )
+    def test_from_claude_response_detects_rate_limit(self, response):
+        """Test each rate limit message is detected, regardless of case."""
         info = RateLimitInfo.from_claude_response(response)
         assert info.is_rate_limited is True
-        assert "rate limit" in info.limit_message.lower()
+        assert info.limit_message == response
         assert info.timestamp is not None
 
-    def test_from_claude_response_usage_limit(self):
-        """Test parsing 'usage limit reached' message."""
-        response = "Usage limit reached for this hour."
-        info = RateLimitInfo.from_claude_response(response)
-        assert info.is_rate_limited is True
 
-    def test_from_claude_response_too_many_requests(self):
-        """Test parsing 'too many requests' message."""
-        response = "Too many requests. Please wait."
-        info = RateLimitInfo.from_claude_response(response)
-        assert info.is_rate_limited is True
+class TestRequestBucket:
+    """Test RequestBucket token bucket."""
 
-    def test_from_claude_response_quota_exceeded(self):
-        """Test parsing 'quota exceeded' message."""
-        response = "API quota exceeded."
-        info = RateLimitInfo.from_claude_response(response)
-        assert info.is_rate_limited is True
+    def test_allows_burst_up_to_capacity(self):
+        """Test a full bucket allows per_minute starts before waiting."""
+        bucket = RequestBucket(2)
+        start = bucket.updated
 
-    def test_from_claude_response_limit_exceeded(self):
-        """Test parsing 'limit exceeded' message."""
-        response = "Limit exceeded. Try again in 30 minutes."
-        info = RateLimitInfo.from_claude_response(response)
-        assert info.is_rate_limited is True
+        for _ in range(2):
+            assert bucket.wait_time(start) == 0
+            bucket.consume(start)
 
-    def test_from_claude_response_case_insensitive(self):
-        """Test rate limit detection is case insensitive."""
-        response = "RATE LIMIT EXCEEDED"
-        info = RateLimitInfo.from_claude_response(response)
-        assert info.is_rate_limited is True
+        assert bucket.wait_time(start) == pytest.approx(30)
+
+    def test_refills_over_time(self):
+        """Test tokens come back at per_minute / 60 per second."""
+        bucket = RequestBucket(2)
+        start = bucket.updated
+        bucket.consume(start)
+        bucket.consume(start)
+
+        assert bucket.wait_time(start + 15) == pytest.approx(15)
+        assert bucket.wait_time(start + 30) == 0
+
+    def test_fractional_rate_still_allows_one_start(self):
+        """Test a rate below one per minute keeps room for a single prompt."""
+        bucket = RequestBucket(0.5)
+        start = bucket.updated
+
+        assert bucket.wait_time(start) == 0
+        bucket.consume(start)
+        assert bucket.wait_time(start) == pytest.approx(120)
 
 
 class TestQueueState:
@@ -194,6 +251,15 @@ class TestQueueState:
         assert state.rate_limited_count == 0
         assert state.current_rate_limit is None
 
+    def test_last_processed_constructor_argument(self):
+        """Test last_processed is accepted by the constructor and compared."""
+        last_processed = datetime(2024, 5, 1, 12, 30, 45, 123456)
+        state = QueueState(last_processed=last_processed)
+
+        assert state.last_processed == last_processed
+        assert state == QueueState(last_processed=last_processed)
+        assert state != QueueState()
+
     def test_add_prompt(self):
         """Test adding prompts to queue."""
         state = QueueState()
@@ -220,6 +286,54 @@ class TestQueueState:
         assert len(state.prompts) == 1
         assert state.prompts[0].id == "2"
 
+    def test_remove_prompt_in_place(self):
+        """Test removal edits the prompt list and keeps lookups and counts right."""
+        state = QueueState()
+        for prompt_id in ["1", "2", "3"]:
+            state.add_prompt(QueuedPrompt(id=prompt_id))
+        prompts = state.prompts
+        assert state.get_next_prompt().id == "1"
+
+        assert state.remove_prompt("1") is True
+
+        assert state.prompts is prompts
+        assert state.get_prompt("1") is None
+        assert state.get_status_counts()["queued"] == 2
+        assert state.get_next_prompt().id == "2"
+
+    def test_remove_then_add_does_not_schedule_removed_prompt(self):
+        """Test a removal followed by an add rebuilds the schedule."""
+        state = QueueState()
+        state.add_prompt(QueuedPrompt(id="a", priority=1))
+        state.add_prompt(QueuedPrompt(id="b", priority=2))
+        assert state.get_next_prompt().id == "a"
+
+        state.remove_prompt("a")
+        state.add_prompt(QueuedPrompt(id="c", priority=0))
+
+        assert state.get_next_prompt().id == "c"
+
+    def test_replaced_prompt_is_not_scheduled(self):
+        """Test a prompt replaced in the list at the same length is not returned."""
+        state = QueueState()
+        state.add_prompt(QueuedPrompt(id="a", priority=1))
+        state.add_prompt(QueuedPrompt(id="b", priority=2))
+        assert state.get_next_prompt().id == "a"
+
+        state.prompts[0] = QueuedPrompt(id="c", priority=3)
+
+        assert state.get_next_prompt().id == "b"
+
+    def test_remove_prompts(self):
+        """Test removing several prompts at once."""
+        state = QueueState()
+        for prompt_id in ["1", "2", "3"]:
+            state.add_prompt(QueuedPrompt(id=prompt_id))
+
+        removed = state.remove_prompts({"1", "3", "missing"})
+        assert removed == 2
+        assert [p.id for p in state.prompts] == ["2"]
+
     def test_remove_nonexistent_prompt(self):
         """Test removing non-existent prompt returns False."""
         state = QueueState()
@@ -237,88 +351,174 @@ class TestQueueState:
         assert found.id == "test-123"
         assert found.content == "Test"
 
-    def test_get_nonexistent_prompt(self):
-        """Test getting non-existent prompt returns None."""
-        state = QueueState()
-        found = state.get_prompt("nonexistent")
-        assert found is None
-
-    def test_get_next_prompt_returns_highest_priority(self):
-        """Test get_next_prompt returns highest priority (lowest number)."""
+    def test_get_prompt_follows_prompt_list_changes(self):
+        """Test lookups stay correct after removals and list replacement."""
         state = QueueState()
-        state.add_prompt(QueuedPrompt(id="1", priority=10, status=PromptStatus.QUEUED))
-        state.add_prompt(QueuedPrompt(id="2", priority=5, status=PromptStatus.QUEUED))
-        state.add_prompt(QueuedPrompt(id="3", priority=15, status=PromptStatus.QUEUED))
+        state.add_prompt(QueuedPrompt(id="1"))
+        state.add_prompt(QueuedPrompt(id="2"))
+        assert state.get_prompt("1") is not None
 
-        next_prompt = state.get_next_prompt()
-        assert next_prompt is not None
-        assert next_prompt.id == "2"  # Priority 5 is highest
+        state.remove_prompt("1")
+        assert state.get_prompt("1") is None
+        assert state.get_prompt("2") is not None
 
-    def test_get_next_prompt_skips_executing(self):
-        """Test get_next_prompt skips executing prompts."""
-        state = QueueState()
-        state.add_prompt(
-            QueuedPrompt(id="1", priority=1, status=PromptStatus.EXECUTING)
-        )
-        state.add_prompt(QueuedPrompt(id="2", priority=5, status=PromptStatus.QUEUED))
+        state.prompts = [QueuedPrompt(id="3")]
+        assert state.get_prompt("2") is None
+        assert state.get_prompt("3") is not None
 
-        next_prompt = state.get_next_prompt()
-        assert next_prompt.id == "2"
-
-    def test_get_next_prompt_skips_completed(self):
-        """Test get_next_prompt skips completed prompts."""
+    def test_get_nonexistent_prompt(self):
+        """Test getting non-existent prompt returns None."""
         state = QueueState()
-        state.add_prompt(
-            QueuedPrompt(id="1", priority=1, status=PromptStatus.COMPLETED)
-        )
-        state.add_prompt(QueuedPrompt(id="2", priority=5, status=PromptStatus.QUEUED))
+        found = state.get_prompt("nonexistent")
+        assert found is None
 
-        next_prompt = state.get_next_prompt()
-        assert next_prompt.id == "2"
-
-    def test_get_next_prompt_returns_none_when_empty(self):
-        """Test get_next_prompt returns None when no executable prompts."""
-        state = QueueState()
-        next_prompt = state.get_next_prompt()
-        assert next_prompt is None
+    @pytest.mark.parametrize(
+        "prompts,expected_id",
+        [
+            pytest.param(
+                [
+                    (10, PromptStatus.QUEUED),
+                    (5, PromptStatus.QUEUED),
+                    (15, PromptStatus.QUEUED),
+                ],
+                "2",
+                id="highest-priority",
+            ),
+            pytest.param(
+                [(1, PromptStatus.QUEUED), (5, PromptStatus.EXECUTING)],
+                "2",
+                id="continues-executing",
+            ),
+            pytest.param(
+                [(1, PromptStatus.COMPLETED), (5, PromptStatus.QUEUED)],
+                "2",
+                id="skips-completed",
+            ),
+            pytest.param([], None, id="empty"),
+        ],
+    )
+    def test_get_next_prompt(self, empty_state, prompts, expected_id):
+        """Test get_next_prompt returns the prompt to run next.
+
+        prompts are (priority, status) pairs, added with ids "1", "2", ...; an
+        executing prompt is continued before any queued one, otherwise the
+        lowest priority number wins.
+        """
+        for prompt_id, (priority, status) in enumerate(prompts, 1):
+            empty_state.add_prompt(
+                QueuedPrompt(id=str(prompt_id), priority=priority, status=status)
+            )
+
+        next_prompt = empty_state.get_next_prompt()
+        assert (next_prompt.id if next_prompt else None) == expected_id
 
     def test_get_next_prompt_returns_none_when_rate_limited(self):
         """Test get_next_prompt returns None when queue is rate limited."""
         state = QueueState()
-        future_time = datetime.now() + timedelta(hours=1)
         state.current_rate_limit = RateLimitInfo(
             is_rate_limited=True,
-            reset_time=future_time,
+            reset_time=FUTURE,
         )
         state.add_prompt(QueuedPrompt(id="1", priority=5, status=PromptStatus.QUEUED))
 
-        next_prompt = state.get_next_prompt()
+        next_prompt = state.get_next_prompt(now=NOW)
         assert next_prompt is None
 
     def test_get_next_prompt_returns_prompt_after_rate_limit_expires(self):
         """Test get_next_prompt returns prompt after rate limit expires."""
         state = QueueState()
-        past_time = datetime.now() - timedelta(hours=1)
         state.current_rate_limit = RateLimitInfo(
             is_rate_limited=True,
-            reset_time=past_time,
+            reset_time=PAST,
         )
         state.add_prompt(QueuedPrompt(id="1", priority=5, status=PromptStatus.QUEUED))
 
         # Rate limit should not block since reset_time is in the past
-        next_prompt = state.get_next_prompt()
+        next_prompt = state.get_next_prompt(now=NOW)
         assert next_prompt is not None
         assert next_prompt.id == "1"
 
+    def test_get_next_prompt_keeps_list_order_for_ties(self):
+        """Test prompts with equal priority are returned in list order."""
+        state = QueueState()
+        now = datetime.now()
+        for offset, prompt_id in [(2, "c"), (0, "a"), (1, "b")]:
+            created_at = now + timedelta(seconds=offset)
+            state.add_prompt(
+                QueuedPrompt(id=prompt_id, priority=1, created_at=created_at)
+            )
+
+        assert state.get_next_prompt().id == "c"
+        state.get_prompt("c").status = PromptStatus.COMPLETED
+        assert state.get_next_prompt().id == "a"
+
+    def test_get_next_prompt_continues_prompt_set_executing(self):
+        """Test a prompt moved to executing after a call is returned next."""
+        state = QueueState()
+        state.add_prompt(QueuedPrompt(id="a", priority=0))
+        state.add_prompt(QueuedPrompt(id="b", priority=5))
+        assert state.get_next_prompt().id == "a"
+
+        state.set_status(state.get_prompt("b"), PromptStatus.EXECUTING)
+
+        assert state.get_next_prompt().id == "b"
+
+    def test_get_next_prompt_follows_priority_changes(self):
+        """Test a priority lowered in place is seen on the next call."""
+        state = QueueState()
+        state.add_prompt(QueuedPrompt(id="a", priority=1))
+        state.add_prompt(QueuedPrompt(id="b", priority=5))
+        assert state.get_next_prompt().id == "a"
+
+        state.get_prompt("b").priority = 0
+
+        assert state.get_next_prompt().id == "b"
+
+    def test_get_next_prompt_sees_prompt_requeued_directly(self):
+        """Test a finished prompt set back to queued without set_status is seen."""
+        state = QueueState()
+        prompt = QueuedPrompt(id="1")
+        state.add_prompt(prompt)
+        prompt.status = PromptStatus.COMPLETED
+        assert state.get_next_prompt() is None
+
+        prompt.status = PromptStatus.QUEUED
+
+        assert state.get_next_prompt() is prompt
+
+    def test_get_next_prompt_follows_status_changes(self):
+        """Test a handed-out prompt is continued, then requeued in order."""
+        state = QueueState()
+        state.add_prompt(QueuedPrompt(id="1", priority=1))
+        state.add_prompt(QueuedPrompt(id="2", priority=0))
+
+        first = state.get_next_prompt()
+        assert first.id == "2"
+
+        first.status = PromptStatus.EXECUTING
+        state.add_prompt(QueuedPrompt(id="3", priority=-1))
+        assert state.get_next_prompt().id == "2"
+
+        first.status = PromptStatus.QUEUED
+        assert state.get_next_prompt().id == "3"
+
+    def test_get_next_prompt_after_prompts_replaced(self):
+        """Test assigning a new prompts list rebuilds the schedule."""
+        state = QueueState()
+        state.add_prompt(QueuedPrompt(id="1", priority=1))
+        assert state.get_next_prompt().id == "1"
+
+        state.prompts = [QueuedPrompt(id="2", priority=3)]
+        assert state.get_next_prompt().id == "2"
+
     def test_is_rate_limited_returns_true_when_rate_limited(self):
         """Test is_rate_limited returns True when rate limited."""
         state = QueueState()
-        future_time = datetime.now() + timedelta(hours=1)
         state.current_rate_limit = RateLimitInfo(
             is_rate_limited=True,
-            reset_time=future_time,
+            reset_time=FUTURE,
         )
-        assert state.is_rate_limited() is True
+        assert state.is_rate_limited(now=NOW) is True
 
     def test_is_rate_limited_returns_false_when_not_rate_limited(self):
         """Test is_rate_limited returns False when not rate limited."""
@@ -328,34 +528,46 @@ class TestQueueState:
     def test_is_rate_limited_returns_false_after_reset(self):
         """Test is_rate_limited returns False after reset time passes."""
         state = QueueState()
-        past_time = datetime.now() - timedelta(hours=1)
         state.current_rate_limit = RateLimitInfo(
             is_rate_limited=True,
-            reset_time=past_time,
+            reset_time=PAST,
         )
-        assert state.is_rate_limited() is False
+        assert state.is_rate_limited(now=NOW) is False
 
     def test_clear_rate_limit_if_expired_clears_expired_limit(self):
         """Test clear_rate_limit_if_expired clears expired limits."""
         state = QueueState()
-        past_time = datetime.now() - timedelta(hours=1)
         state.current_rate_limit = RateLimitInfo(
             is_rate_limited=True,
-            reset_time=past_time,
+            reset_time=PAST,
         )
-        result = state.clear_rate_limit_if_expired()
+        result = state.clear_rate_limit_if_expired(now=NOW)
         assert result is True
         assert state.current_rate_limit is None
 
+    def test_rate_limit_checks_use_given_time(self):
+        """Test rate limit checks compare against the passed timestamp."""
+        state = QueueState()
+        reset_time = FUTURE
+        state.current_rate_limit = RateLimitInfo(
+            is_rate_limited=True, reset_time=reset_time
+        )
+        state.add_prompt(QueuedPrompt(id="1"))
+        later = reset_time + timedelta(seconds=1)
+
+        assert state.is_rate_limited(now=later) is False
+        assert state.get_next_prompt(now=later).id == "1"
+        assert state.clear_rate_limit_if_expired(now=reset_time) is True
+        assert state.current_rate_limit is None
+
     def test_clear_rate_limit_if_expired_keeps_active_limit(self):
         """Test clear_rate_limit_if_expired keeps active limits."""
         state = QueueState()
-        future_time = datetime.now() + timedelta(hours=1)
         state.current_rate_limit = RateLimitInfo(
             is_rate_limited=True,
-            reset_time=future_time,
+            reset_time=FUTURE,
         )
-        result = state.clear_rate_limit_if_expired()
+        result = state.clear_rate_limit_if_expired(now=NOW)
         assert result is False
         assert state.current_rate_limit is not None
 
@@ -370,32 +582,170 @@ class TestQueueState:
         assert stats["rate_limited_count"] == 0
         assert stats["last_processed"] is None
 
-    def test_get_stats_with_prompts(self):
+    def test_get_stats_with_prompts(self, stats_state):
         """Test get_stats with various prompt statuses."""
-        state = QueueState()
-        state.add_prompt(QueuedPrompt(id="1", status=PromptStatus.QUEUED))
-        state.add_prompt(QueuedPrompt(id="2", status=PromptStatus.QUEUED))
-        state.add_prompt(QueuedPrompt(id="3", status=PromptStatus.EXECUTING))
-        state.total_processed = 10
-        state.failed_count = 2
-
-        stats = state.get_stats()
+        stats = stats_state.get_stats()
 
         assert stats["total_prompts"] == 3
-        assert stats["status_counts"]["queued"] == 2
-        assert stats["status_counts"]["executing"] == 1
-        assert stats["status_counts"]["completed"] == 10
-        assert stats["status_counts"]["failed"] == 2
+        assert stats["status_counts"] == {
+            "queued": 2,
+            "executing": 1,
+            "completed": 10,
+            "failed": 2,
+            "cancelled": 0,
+        }
         assert stats["total_processed"] == 10
         assert stats["failed_count"] == 2
 
+    def test_get_status_counts_reuses_buckets(self):
+        """Test status counts from prompts_by_status match a fresh count."""
+        state = QueueState(total_processed=4, failed_count=1)
+        state.add_prompt(QueuedPrompt(id="1", status=PromptStatus.QUEUED))
+        state.add_prompt(QueuedPrompt(id="2", status=PromptStatus.CANCELLED))
+
+        counts = state.get_status_counts(state.prompts_by_status)
+
+        assert counts == state.get_status_counts()
+        assert counts["queued"] == 1
+        assert counts["cancelled"] == 1
+        assert counts["completed"] == 4
+        assert counts["failed"] == 1
+
+    def test_set_status_updates_counts(self):
+        """Test status changes through set_status are reflected in the counts."""
+        state = QueueState()
+        prompt = QueuedPrompt(id="1")
+        state.add_prompt(prompt)
+        state.add_prompt(QueuedPrompt(id="2"))
+        assert state.get_status_counts()["queued"] == 2
+
+        state.set_status(prompt, PromptStatus.EXECUTING)
+        state.add_prompt(QueuedPrompt(id="3"))
+
+        counts = state.get_status_counts()
+        assert prompt.status == PromptStatus.EXECUTING
+        assert counts["queued"] == 2
+        assert counts["executing"] == 1
+        assert counts == state.get_status_counts(state.prompts_by_status)
+
+    def test_direct_status_change_updates_counts(self):
+        """Test a status assigned without set_status is still counted."""
+        state = QueueState()
+        prompt = QueuedPrompt(id="1")
+        state.add_prompt(prompt)
+        assert state.get_status_counts()["queued"] == 1
+
+        prompt.status = PromptStatus.CANCELLED
+
+        counts = state.get_stats()["status_counts"]
+        assert counts["queued"] == 0
+        assert counts["cancelled"] == 1
+
+    def test_status_counts_follow_list_changes(self):
+        """Test counts follow changes made on the prompts list itself."""
+        state = QueueState(prompts=[QueuedPrompt(id="1"), QueuedPrompt(id="2")])
+        assert state.count_status(PromptStatus.QUEUED) == 2
+
+        state.prompts[0] = QueuedPrompt(id="3", status=PromptStatus.CANCELLED)
+        assert state.count_status(PromptStatus.QUEUED) == 1
+        assert state.count_status(PromptStatus.CANCELLED) == 1
+
+        state.prompts.append(QueuedPrompt(id="4"))
+        del state.prompts[0]
+        assert state.count_status(PromptStatus.QUEUED) == 2
+        assert state.count_status(PromptStatus.CANCELLED) == 0
+
+    def test_status_counts_match_a_scan(self):
+        """Test counts match a fresh scan through mixed status and list changes."""
+        rng = random.Random(0)
+        state = QueueState()
+        statuses = list(PromptStatus)
+        for step in range(300):
+            action = rng.randrange(4)
+            if action == 0 or not state.prompts:
+                state.add_prompt(QueuedPrompt(id=str(step)))
+            elif action == 1:
+                state.set_status(rng.choice(state.prompts), rng.choice(statuses))
+            elif action == 2:
+                rng.choice(state.prompts).status = rng.choice(statuses)
+            else:
+                state.remove_prompt(rng.choice(state.prompts).id)
+
+            for status in statuses:
+                expected = [p for p in state.prompts if p.status is status]
+                assert state.count_status(status) == len(expected)
+                assert state.get_prompts_with_status(status) == expected
+
+    def test_get_prompts_with_status(self):
+        """Test status lookups follow adds, status changes and removals."""
+        state = QueueState()
+        first = QueuedPrompt(id="1")
+        state.add_prompt(first)
+        state.add_prompt(QueuedPrompt(id="2"))
+
+        state.set_status(first, PromptStatus.EXECUTING)
+        assert state.get_prompts_with_status(PromptStatus.EXECUTING) == [first]
+        assert state.count_status(PromptStatus.QUEUED) == 1
+
+        state.remove_prompt("1")
+        assert state.get_prompts_with_status(PromptStatus.EXECUTING) == []
+
+    def test_status_lookups_follow_direct_changes(self):
+        """Test lookups see direct status changes and same-length replacements."""
+        state = QueueState()
+        first = QueuedPrompt(id="1")
+        state.add_prompt(first)
+        state.add_prompt(QueuedPrompt(id="2"))
+        assert state.count_status(PromptStatus.QUEUED) == 2
+
+        first.status = PromptStatus.EXECUTING
+        state.prompts[1] = QueuedPrompt(id="3", status=PromptStatus.EXECUTING)
+
+        assert [
+            p.id for p in state.get_prompts_with_status(PromptStatus.EXECUTING)
+        ] == [
+            "1",
+            "3",
+        ]
+        assert state.count_status(PromptStatus.QUEUED) == 0
+
+    def test_status_lookups_return_copies(self):
+        """Test a returned status list is not changed by later status changes."""
+        state = QueueState()
+        state.add_prompt(QueuedPrompt(id="1", status=PromptStatus.EXECUTING))
+        state.add_prompt(QueuedPrompt(id="2", status=PromptStatus.EXECUTING))
+
+        executing = state.get_prompts_with_status(PromptStatus.EXECUTING)
+        for prompt in executing:
+            state.set_status(prompt, PromptStatus.QUEUED)
+        executing.clear()
+
+        assert state.get_prompts_with_status(PromptStatus.EXECUTING) == []
+        assert [p.id for p in state.get_prompts_with_status(PromptStatus.QUEUED)] == [
+            "1",
+            "2",
+        ]
+        assert state.prompts_by_status[PromptStatus.QUEUED] == state.prompts
+
+    def test_requeued_prompt_is_scheduled_again(self):
+        """Test a finished prompt set back to queued is returned again."""
+        state = QueueState()
+        prompt = QueuedPrompt(id="1")
+        state.add_prompt(prompt)
+        assert state.get_next_prompt() is prompt
+        state.set_status(prompt, PromptStatus.COMPLETED)
+        assert state.get_next_prompt() is None
+
+        state.set_status(prompt, PromptStatus.QUEUED)
+
+        assert state.get_next_prompt() is prompt
+
     def test_get_stats_with_current_rate_limit(self):
         """Test get_stats includes current rate limit info."""
         state = QueueState()
-        reset_time = datetime.now() + timedelta(hours=1)
         state.current_rate_limit = RateLimitInfo(
             is_rate_limited=True,
-            reset_time=reset_time,
+            reset_time=FUTURE,
         )
 
         stats = state.get_stats()
@@ -403,6 +753,28 @@ class TestQueueState:
         assert stats["current_rate_limit"]["is_rate_limited"] is True
         assert stats["current_rate_limit"]["reset_time"] is not None
 
+    def test_prompts_by_status(self):
+        """Test prompts are bucketed by status, keeping their queue order."""
+        now = datetime.now()
+        state = QueueState()
+        state.add_prompt(QueuedPrompt(id="late", priority=1, created_at=now))
+        state.add_prompt(
+            QueuedPrompt(id="early", priority=1, created_at=now - timedelta(hours=1))
+        )
+        state.add_prompt(QueuedPrompt(id="urgent", priority=0, created_at=now))
+        state.add_prompt(QueuedPrompt(id="failed", status=PromptStatus.FAILED))
+
+        by_status = state.prompts_by_status
+
+        assert set(by_status) == set(PromptStatus)
+        assert [p.id for p in by_status[PromptStatus.QUEUED]] == [
+            "late",
+            "early",
+            "urgent",
+        ]
+        assert [p.id for p in by_status[PromptStatus.FAILED]] == ["failed"]
+        assert by_status[PromptStatus.EXECUTING] == []
+
 
 class TestExecutionResult:
     """Test ExecutionResult class."""
@@ -432,32 +804,53 @@ class TestExecutionResult:
         assert result.error == "Command failed"
         assert result.is_rate_limited is False
 
-    def test_rate_limited_execution(self):
-        """Test ExecutionResult with rate limit info."""
-        rate_limit = RateLimitInfo(
-            is_rate_limited=True,
-            limit_message="Rate limit exceeded",
-        )
-        result = ExecutionResult(
-            success=False,
-            output="",
-            error="Rate limited",
-            rate_limit_info=rate_limit,
-        )
-        assert result.is_rate_limited is True
-        assert result.success is False
-
-    def test_is_rate_limited_property_false(self):
-        """Test is_rate_limited property returns False when no rate limit."""
-        result = ExecutionResult(success=True, output="Done")
-        assert result.is_rate_limited is False
-
-    def test_is_rate_limited_property_with_non_limited_info(self):
-        """Test is_rate_limited property with non-limited RateLimitInfo."""
-        rate_limit = RateLimitInfo(is_rate_limited=False)
-        result = ExecutionResult(
-            success=True,
-            output="Done",
-            rate_limit_info=rate_limit,
-        )
-        assert result.is_rate_limited is False
+    @pytest.mark.parametrize(
+        "kwargs,expected",
+        [
+            pytest.param({"success": True, "output": "Done"}, False, id="no-info"),
+            pytest.param(
+                {
+                    "success": True,
+                    "output": "Done",
+                    "rate_limit_info": RateLimitInfo(is_rate_limited=False),
+                },
+                False,
+                id="non-limited-info",
+            ),
+            pytest.param(
+                {
+                    "success": False,
+                    "output": "",
+                    "error": "Rate limited",
+                    "rate_limit_info": RateLimitInfo(
+                        is_rate_limited=True,
+                        limit_message="Rate limit exceeded",
+                    ),
+                },
+                True,
+                id="rate-limited",
+            ),
+        ],
+    )
+    def test_is_rate_limited(self, kwargs, expected):
+        """Test is_rate_limited follows the attached RateLimitInfo."""
+        assert ExecutionResult(**kwargs).is_rate_limited is expected
+
+    @pytest.mark.parametrize(
+        "kwargs,expected",
+        [
+            ({"success": True}, ResultKind.SUCCESS),
+            ({"success": True, "no_changes_detected": True}, ResultKind.NO_CHANGES),
+            (
+                {
+                    "success": False,
+                    "rate_limit_info": RateLimitInfo(is_rate_limited=True),
+                },
+                ResultKind.RATE_LIMITED,
+            ),
+            ({"success": False}, ResultKind.FAILED),
+        ],
+    )
+    def test_kind(self, kwargs, expected):
+        """Test results are classified for the queue manager."""
+        assert ExecutionResult(output="", **kwargs).kind is expected
@@ -1,26 +1,84 @@
 """Integration tests for queue_manager module."""
 
+import os
+import signal
+import sys
+import threading
+import time
 from datetime import datetime, timedelta
-from unittest.mock import MagicMock, Mock, patch
+from types import SimpleNamespace
+from unittest.mock import Mock, patch
 
 import pytest
 
+from claude_code_queue import queue_manager as qm_module
 from claude_code_queue.models import (
     ExecutionResult,
     PromptStatus,
     QueuedPrompt,
     QueueState,
+    RateLimitInfo,
 )
 from claude_code_queue.queue_manager import QueueManager
 from claude_code_queue.storage import QueueStorage
 
 
+def stub_interface(exec_result=None, conn=(True, "ok")):
+    """Return a plain stand-in for ClaudeCodeInterface.
+
+    execute_prompt returns exec_result and records each prompt in calls; use
+    a Mock instead when a test needs its assertion helpers.
+    """
+    calls = []
+
+    def execute_prompt(prompt):
+        calls.append(prompt)
+        return exec_result
+
+    return SimpleNamespace(
+        test_connection=lambda: conn, execute_prompt=execute_prompt, calls=calls
+    )
+
+
+@pytest.fixture(scope="class")
+def class_mocks():
+    """Patch the storage and Claude interface classes once per test class."""
+    with patch.object(qm_module, "ClaudeCodeInterface") as interface_class:
+        with patch.object(qm_module, "QueueStorage") as storage_class:
+            yield interface_class, storage_class
+
+
+@pytest.fixture
+def manager_classes(request, class_mocks):
+    """Hand each test the patched classes, reset to fresh return values.
+
+    The mocks are available to the test as self.mock_storage_class and
+    self.mock_interface_class.
+    """
+    interface_class, storage_class = class_mocks
+    for mock in class_mocks:
+        mock.reset_mock(return_value=True, side_effect=True)
+    request.instance.mock_interface_class = interface_class
+    request.instance.mock_storage_class = storage_class
+
+
+@pytest.fixture(scope="module")
+def manager_factory():
+    """Return a function building a QueueManager with an empty queue state."""
+
+    def make(**kwargs):
+        manager = QueueManager(**kwargs)
+        manager.state = QueueState()
+        return manager
+
+    return make
+
+
+@pytest.mark.usefixtures("manager_classes")
 class TestQueueManager:
     """Test QueueManager class."""
 
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_initialization(self, mock_storage_class, mock_interface_class):
+    def test_initialization(self):
         """Test QueueManager initialization."""
         manager = QueueManager(
             storage_dir="/tmp/test-queue",
@@ -31,12 +89,23 @@ class TestQueueManager:
 
         assert manager.check_interval == 60
         assert manager.running is False
-        mock_storage_class.assert_called_once_with("/tmp/test-queue")
-        mock_interface_class.assert_called_once_with("my-claude", 7200)
+        self.mock_storage_class.assert_called_once_with("/tmp/test-queue")
+        self.mock_interface_class.assert_not_called()
+
+        assert manager.claude_interface is self.mock_interface_class.return_value
+        assert manager.claude_interface is self.mock_interface_class.return_value
+        self.mock_interface_class.assert_called_once_with("my-claude", 7200)
+
+    @patch.object(qm_module.signal, "signal")
+    def test_signals_registered_on_request(self, mock_signal):
+        """Test signal handlers are only installed when asked for."""
+        QueueManager()
+        mock_signal.assert_not_called()
 
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_stop(self, mock_storage_class, mock_interface_class):
+        QueueManager(register_signals=True)
+        assert mock_signal.call_count == 2
+
+    def test_stop(self):
         """Test stopping the queue manager."""
         manager = QueueManager()
         manager.running = True
@@ -45,15 +114,47 @@ class TestQueueManager:
 
         assert manager.running is False
 
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_shutdown_saves_state(self, mock_storage_class, mock_interface_class):
-        """Test shutdown saves queue state."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
+    def test_stop_wakes_sleeping_loop(self, manager_factory):
+        """Test stop and newly added prompts interrupt the sleep between iterations."""
+        manager = manager_factory()
 
-        manager = QueueManager()
-        manager.state = QueueState()
+        manager.add_prompt(QueuedPrompt(id="new"))
+        assert manager._wake.is_set()
+
+        manager._wake.clear()
+        manager.stop()
+        assert manager._wake.wait(timeout=0) is True
+
+    @pytest.mark.skipif(sys.platform == "win32", reason="POSIX signal delivery")
+    def test_signal_interrupts_sleep(self):
+        """Test SIGTERM ends the sleep between iterations right away."""
+        previous = signal.getsignal(signal.SIGTERM)
+        try:
+            manager = QueueManager(check_interval=30, register_signals=True)
+            manager.running = True
+            timer = threading.Timer(0.1, os.kill, (os.getpid(), signal.SIGTERM))
+            timer.start()
+
+            started = time.monotonic()
+            assert manager._wake.wait(timeout=30) is True
+            timer.join()
+
+            assert time.monotonic() - started < 5
+            assert manager.running is False
+        finally:
+            signal.signal(signal.SIGTERM, previous)
+
+    @pytest.fixture
+    def shutdown_storage(self, manager_classes):
+        """A QueueStorage-shaped mock with successful saves, for the manager to use."""
+        storage = Mock(spec=QueueStorage)
+        storage.save_queue_state.return_value = True
+        self.mock_storage_class.return_value = storage
+        return storage
+
+    def test_shutdown_saves_state(self, manager_factory, shutdown_storage):
+        """Test shutdown saves queue state."""
+        manager = manager_factory()
         manager.state.prompts = [
             QueuedPrompt(id="1", status=PromptStatus.QUEUED),
             QueuedPrompt(id="2", status=PromptStatus.EXECUTING),
@@ -63,19 +164,22 @@ class TestQueueManager:
 
         # Executing prompt should be reset to queued
         assert manager.state.prompts[1].status == PromptStatus.QUEUED
-        mock_storage.save_queue_state.assert_called_once()
+        shutdown_storage.save_queue_state.assert_called_once()
+
+    def test_shutdown_skips_save_when_clean(self, manager_factory, shutdown_storage):
+        """Test shutdown does not rewrite a state with no unsaved changes."""
+        manager = manager_factory()
+        manager.state.prompts = [QueuedPrompt(id="1", status=PromptStatus.QUEUED)]
+
+        manager._shutdown()
+
+        shutdown_storage.save_queue_state.assert_not_called()
 
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
     def test_shutdown_adds_log_to_interrupted_prompts(
-        self, mock_storage_class, mock_interface_class
+        self, manager_factory, shutdown_storage
     ):
         """Test shutdown adds log entry to interrupted prompts."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
-
-        manager = QueueManager()
-        manager.state = QueueState()
+        manager = manager_factory()
         prompt = QueuedPrompt(id="test", status=PromptStatus.EXECUTING)
         manager.state.prompts = [prompt]
 
@@ -83,20 +187,16 @@ class TestQueueManager:
 
         assert "interrupted" in prompt.execution_log.lower()
 
-    @patch("claude_code_queue.queue_manager.time.sleep")
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_start_checks_claude_connection(
-        self, mock_storage_class, mock_interface_class, mock_sleep
-    ):
+    @patch.object(qm_module.threading.Event, "wait")
+    def test_start_checks_claude_connection(self, mock_wait):
         """Test start checks Claude connection before processing."""
         mock_interface = Mock()
         mock_interface.test_connection.return_value = (False, "Connection failed")
-        mock_interface_class.return_value = mock_interface
+        self.mock_interface_class.return_value = mock_interface
 
         mock_storage = Mock()
         mock_storage.load_queue_state.return_value = QueueState()
-        mock_storage_class.return_value = mock_storage
+        self.mock_storage_class.return_value = mock_storage
 
         manager = QueueManager()
         manager.start()
@@ -105,19 +205,14 @@ class TestQueueManager:
         mock_interface.test_connection.assert_called_once()
         assert manager.running is False
 
-    @patch("claude_code_queue.queue_manager.time.sleep")
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_process_queue_iteration_no_prompts(
-        self, mock_storage_class, mock_interface_class, mock_sleep
-    ):
+    @patch.object(qm_module.threading.Event, "wait")
+    def test_process_queue_iteration_no_prompts(self, mock_wait, manager_factory):
         """Test processing iteration with no prompts."""
         mock_storage = Mock()
         mock_storage.load_queue_state.return_value = QueueState()
-        mock_storage_class.return_value = mock_storage
+        self.mock_storage_class.return_value = mock_storage
 
-        manager = QueueManager()
-        manager.state = QueueState()
+        manager = manager_factory()
 
         callback = Mock()
         manager._process_queue_iteration(callback)
@@ -127,167 +222,344 @@ class TestQueueManager:
         # No execution should occur
         mock_storage.save_queue_state.assert_not_called()
 
+    def test_sleep_interval_follows_execution_times(self, manager_factory):
+        """Test waiting prompts are polled after half the mean execution time."""
+        manager = manager_factory(check_interval=30)
+        assert manager._calculate_sleep_interval() == 30
 
-class TestQueueManagerExecutionLifecycle:
-    """Test prompt execution lifecycle in QueueManager."""
+        manager.state.add_prompt(QueuedPrompt(id="waiting"))
+        assert manager._calculate_sleep_interval() == 30
 
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_execute_prompt_success(self, mock_storage_class, mock_interface_class):
-        """Test successful prompt execution."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
+        manager._recent_execution_times.extend([8.0, 12.0])
+        assert manager._calculate_sleep_interval() == 5
 
-        mock_interface = Mock()
-        mock_result = ExecutionResult(
-            success=True,
-            output="Task completed",
-            execution_time=5.0,
-        )
-        mock_interface.execute_prompt.return_value = mock_result
-        mock_interface_class.return_value = mock_interface
+        manager._recent_execution_times.extend([0.1] * 10)
+        assert manager._calculate_sleep_interval() == 1
 
-        manager = QueueManager()
-        prompt = QueuedPrompt(id="test", content="Test task")
-        manager.state = QueueState()
+        manager._recent_execution_times.extend([600.0] * 10)
+        assert manager._calculate_sleep_interval() == 30
 
-        manager._execute_prompt(prompt)
+    def test_prompt_start_limit(self, manager_factory):
+        """Test prompts beyond the per-minute limit wait for the bucket to refill."""
+        manager = manager_factory(check_interval=30, max_prompts_per_minute=1)
+        manager.state.add_prompt(QueuedPrompt(id="first"))
+        manager.state.add_prompt(QueuedPrompt(id="second"))
+        manager._state_marker = manager.storage.get_change_marker()
 
-        assert prompt.status == PromptStatus.COMPLETED
-        assert "completed" in prompt.execution_log.lower()
-        mock_interface.execute_prompt.assert_called_once_with(prompt)
+        with patch.object(manager, "_execute_prompt") as mock_execute:
+            manager._process_queue_iteration()
+            manager._process_queue_iteration()
 
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_execute_prompt_failure(self, mock_storage_class, mock_interface_class):
-        """Test failed prompt execution."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
+        assert mock_execute.call_count == 1
+        assert 1 <= manager._calculate_sleep_interval() <= 30
 
-        mock_interface = Mock()
-        mock_result = ExecutionResult(
-            success=False,
-            output="",
-            error="Task failed",
-            execution_time=2.0,
+    @patch.object(qm_module.signal, "signal")
+    def test_process_next_loads_state_once(self, mock_signal):
+        """Test process_next does not reload the state it just loaded."""
+        manager = QueueManager()
+        manager.claude_interface = stub_interface()
+        manager.storage.load_queue_state.return_value = QueueState()
+
+        assert manager.process_next() == 0
+
+        manager.storage.load_queue_state.assert_called_once()
+
+    @pytest.mark.parametrize(
+        "seconds,expected",
+        [
+            (-1, "now"),
+            (0.4, "0s"),
+            (59.9, "59s"),
+            (61, "1m"),
+            (7200, "2h"),
+            (5000, "1h 23m"),
+        ],
+    )
+    def test_format_duration(self, seconds, expected):
+        """Test durations are rendered by whole seconds."""
+        manager = QueueManager()
+        assert manager._format_duration(seconds) == expected
+
+    def test_rate_limit_checked_once_per_idle_tick(self, future_time):
+        """Test the sleep after an idle iteration reuses its rate-limit check."""
+        manager = QueueManager(check_interval=30)
+        manager.state = QueueState(
+            current_rate_limit=RateLimitInfo(
+                is_rate_limited=True, reset_time=future_time
+            )
+        )
+        manager.state.add_prompt(QueuedPrompt(id="waiting"))
+        manager._state_marker = manager.storage.get_change_marker()
+
+        with patch.object(
+            QueueState, "is_rate_limited", autospec=True, return_value=True
+        ) as mock_check:
+            manager._process_queue_iteration()
+            assert manager._calculate_sleep_interval() == 30
+
+        assert mock_check.call_count == 1
+
+    def test_sleep_interval_uses_given_time(self):
+        """Test the rate-limit wait is measured from the timestamp passed in."""
+        reset_time = datetime(2024, 1, 1, 12, 0, 0)
+        manager = QueueManager(check_interval=300)
+        manager.state = QueueState(
+            current_rate_limit=RateLimitInfo(
+                is_rate_limited=True, reset_time=reset_time
+            )
         )
-        mock_interface.execute_prompt.return_value = mock_result
-        mock_interface_class.return_value = mock_interface
 
-        manager = QueueManager()
-        prompt = QueuedPrompt(
-            id="test", content="Test task", retry_count=0, max_retries=3
+        assert (
+            manager._calculate_sleep_interval(reset_time - timedelta(seconds=60)) == 65
+        )
+        assert (
+            manager._calculate_sleep_interval(reset_time + timedelta(seconds=1)) == 300
         )
-        manager.state = QueueState()
 
-        manager._execute_prompt(prompt)
+    def test_delete_prompts_saves_state_once(self, manager_factory):
+        """Test deleting several prompts saves the queue state a single time."""
+        mock_storage = Mock()
+        mock_storage.delete_prompt_files.return_value = True
+        self.mock_storage_class.return_value = mock_storage
 
-        # Should increment retry count and be queued for retry
-        assert prompt.retry_count == 1
-        assert prompt.status == PromptStatus.QUEUED  # Will retry
+        manager = manager_factory()
+        manager.state.prompts = [
+            QueuedPrompt(id="1", status=PromptStatus.QUEUED),
+            QueuedPrompt(id="2", status=PromptStatus.FAILED),
+            QueuedPrompt(id="3", status=PromptStatus.EXECUTING),
+        ]
 
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_execute_prompt_rate_limited(
-        self, mock_storage_class, mock_interface_class
-    ):
-        """Test prompt execution when rate limited."""
-        from claude_code_queue.models import RateLimitInfo
+        success = manager.delete_prompts(["1", "2", "3"])
 
+        # The executing prompt is kept, so the batch is not a full success
+        assert success is False
+        assert [p.id for p in manager.state.prompts] == ["3"]
+        assert mock_storage.delete_prompt_files.call_count == 2
+        mock_storage.save_queue_state.assert_called_once_with(manager.state)
+
+    def test_get_next_prompt_path(self, manager_factory):
+        """Test the next prompt's path is looked up in the queue directory only."""
         mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
+        mock_storage.get_prompt_path.return_value = "/queue/1-first.md"
+        self.mock_storage_class.return_value = mock_storage
 
-        mock_interface = Mock()
-        rate_limit = RateLimitInfo(
-            is_rate_limited=True,
-            reset_time=datetime.now() + timedelta(hours=1),
-        )
-        mock_result = ExecutionResult(
-            success=False,
-            output="",
-            error="Rate limit exceeded",
-            rate_limit_info=rate_limit,
+        manager = manager_factory()
+        manager.state.prompts = [
+            QueuedPrompt(id="1", priority=0),
+            QueuedPrompt(id="2", priority=1),
+        ]
+
+        assert manager.get_next_prompt_path() == "/queue/1-first.md"
+        mock_storage.get_prompt_path.assert_called_once_with(
+            "1", directories=[mock_storage.queue_dir]
         )
-        mock_interface.execute_prompt.return_value = mock_result
-        mock_interface_class.return_value = mock_interface
 
-        manager = QueueManager()
-        prompt = QueuedPrompt(id="test", content="Test task")
-        manager.state = QueueState()
+    def test_get_next_prompt_path_empty_queue(self, manager_factory):
+        """Test no path is returned when nothing is queued."""
+        manager = manager_factory()
+
+        assert manager.get_next_prompt_path() is None
 
-        manager._execute_prompt(prompt)
 
-        # Prompt stays queued, daemon-level rate limit is set
-        assert prompt.status == PromptStatus.QUEUED
-        assert manager.state.current_rate_limit is not None
-        assert manager.state.current_rate_limit.is_rate_limited is True
-        assert "rate limit" in prompt.execution_log.lower()
+class TestQueueManagerWithStorage:
+    """Test QueueManager against real storage in a temporary directory."""
 
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_execute_prompt_updates_last_executed(
-        self, mock_storage_class, mock_interface_class
+    @patch.object(qm_module, "ClaudeCodeInterface")
+    def test_iteration_skips_reload_when_storage_unchanged(
+        self, mock_interface_class, tmp_path, future_time
     ):
-        """Test execution updates last_executed timestamp."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
+        """Test the queue is only re-read from disk after it changed."""
+        manager = QueueManager(storage_dir=str(tmp_path))
+        manager.state = QueueState()
+        manager.state.rate_limited_count = 1
+        manager.state.current_rate_limit = RateLimitInfo(
+            is_rate_limited=True, reset_time=future_time
+        )
 
-        mock_interface = Mock()
-        mock_result = ExecutionResult(success=True, output="Done", execution_time=1.0)
-        mock_interface.execute_prompt.return_value = mock_result
-        mock_interface_class.return_value = mock_interface
+        with patch.object(
+            manager.storage, "load_queue_state", wraps=manager.storage.load_queue_state
+        ) as mock_load:
+            manager._process_queue_iteration()
+            manager._process_queue_iteration()
+            assert mock_load.call_count == 1
 
-        manager = QueueManager()
-        prompt = QueuedPrompt(id="test", content="Test")
+            other = QueueStorage(str(tmp_path))
+            other.save_queue_state(QueueState(prompts=[QueuedPrompt(id="ext")]))
+            manager._process_queue_iteration()
+            assert mock_load.call_count == 2
+
+        assert manager.state.get_prompt("ext") is not None
+
+    @patch.object(qm_module, "ClaudeCodeInterface")
+    def test_reload_keeps_in_memory_counters(self, mock_interface_class, tmp_path):
+        """Test stale counters written by another command do not replace ours."""
+        manager = QueueManager(storage_dir=str(tmp_path))
         manager.state = QueueState()
+        manager.state.total_processed = 7
+        manager.state.failed_count = 2
 
-        manager._execute_prompt(prompt)
+        QueueStorage(str(tmp_path)).save_queue_state(
+            QueueState(prompts=[QueuedPrompt(id="ext")], total_processed=3)
+        )
+        manager._reload_state()
+
+        assert manager.state.get_prompt("ext") is not None
+        assert manager.state.total_processed == 7
+        assert manager.state.failed_count == 2
+
+    @patch.object(qm_module, "ClaudeCodeInterface")
+    def test_next_prompt_id_from_headers(self, mock_interface_class, tmp_path):
+        """Test the next prompt is picked from file headers before any state load."""
+        prompts = [
+            QueuedPrompt(id="low", content="Low", priority=5),
+            QueuedPrompt(id="high", content="High", priority=1),
+            QueuedPrompt(id="done", content="Done", status=PromptStatus.COMPLETED),
+        ]
+        QueueStorage(str(tmp_path)).save_queue_state(QueueState(prompts=prompts))
+        manager = QueueManager(storage_dir=str(tmp_path))
 
-        assert prompt.last_executed is not None
-        assert isinstance(prompt.last_executed, datetime)
+        with patch.object(manager.storage, "load_queue_state") as mock_load:
+            assert manager.get_next_prompt_id() == "high"
+            mock_load.assert_not_called()
 
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_execute_prompt_updates_state_counters(
-        self, mock_storage_class, mock_interface_class
-    ):
-        """Test execution updates state counters."""
-        mock_storage = Mock()
-        mock_storage_class.return_value = mock_storage
+        assert manager.storage.load_queue_state().get_next_prompt().id == "high"
 
-        mock_interface = Mock()
-        mock_result = ExecutionResult(success=True, output="Done", execution_time=1.0)
-        mock_interface.execute_prompt.return_value = mock_result
-        mock_interface_class.return_value = mock_interface
 
-        manager = QueueManager()
-        prompt = QueuedPrompt(id="test", content="Test")
-        manager.state = QueueState()
-        initial_processed = manager.state.total_processed
+@pytest.mark.usefixtures("manager_classes")
+class TestQueueManagerExecutionLifecycle:
+    """Test prompt execution lifecycle in QueueManager."""
+
+    @pytest.fixture
+    def exec_env(self, request, manager_classes, manager_factory):
+        """Build a manager whose interface returns the parametrized result.
+
+        request.param is (result, prompt_kwargs); yields (manager, prompt, stub).
+        """
+        result, prompt_kwargs = request.param
+        stub = stub_interface(result)
+        self.mock_storage_class.return_value = Mock()
+        self.mock_interface_class.return_value = stub
+
+        manager = manager_factory()
+        prompt = QueuedPrompt(id="test", content="Test task", **prompt_kwargs)
+        return manager, prompt, stub
+
+    @pytest.mark.parametrize(
+        "exec_env,expected_status,expected_retry,expected_processed,log_needle,"
+        "rate_limited",
+        [
+            pytest.param(
+                (
+                    ExecutionResult(
+                        success=True, output="Task completed", execution_time=5.0
+                    ),
+                    {},
+                ),
+                PromptStatus.COMPLETED,
+                0,
+                1,
+                "completed",
+                False,
+                id="success",
+            ),
+            pytest.param(
+                (
+                    ExecutionResult(
+                        success=False,
+                        output="",
+                        error="Task failed",
+                        execution_time=2.0,
+                    ),
+                    {"retry_count": 0, "max_retries": 3},
+                ),
+                # Should be queued for retry
+                PromptStatus.QUEUED,
+                1,
+                0,
+                None,
+                False,
+                id="failure",
+            ),
+            pytest.param(
+                (
+                    ExecutionResult(
+                        success=False,
+                        output="",
+                        error="Task failed",
+                        execution_time=2.0,
+                    ),
+                    {"retry_count": 2, "max_retries": 3},
+                ),
+                # The last attempt failed, so no retry is left
+                PromptStatus.FAILED,
+                3,
+                0,
+                "max retries exceeded",
+                False,
+                id="final-failure",
+            ),
+            pytest.param(
+                (
+                    ExecutionResult(
+                        success=False,
+                        output="",
+                        error="Rate limit exceeded",
+                        rate_limit_info=RateLimitInfo(
+                            is_rate_limited=True,
+                            reset_time=datetime.now() + timedelta(hours=1),
+                        ),
+                    ),
+                    {},
+                ),
+                # Prompt stays queued, daemon-level rate limit is set
+                PromptStatus.QUEUED,
+                0,
+                0,
+                "rate limit",
+                True,
+                id="rate_limited",
+            ),
+        ],
+        indirect=["exec_env"],
+    )
+    def test_execute_prompt_outcome(
+        self,
+        exec_env,
+        expected_status,
+        expected_retry,
+        expected_processed,
+        log_needle,
+        rate_limited,
+    ):
+        """Test status, retries, timestamps and counters after one execution."""
+        manager, prompt, stub = exec_env
 
         manager._execute_prompt(prompt)
 
-        assert manager.state.total_processed == initial_processed + 1
+        assert stub.calls == [prompt]
+        assert prompt.status == expected_status
+        assert prompt.retry_count == expected_retry
+        assert isinstance(prompt.last_executed, datetime)
+        assert manager.state.total_processed == expected_processed
         assert manager.state.last_processed is not None
+        if log_needle:
+            assert log_needle in prompt.execution_log.lower()
+        limit = manager.state.current_rate_limit
+        assert (limit is not None and limit.is_rate_limited) is rate_limited
 
 
+@pytest.mark.usefixtures("manager_classes")
 class TestQueueManagerCallbacks:
     """Test callback functionality in QueueManager."""
 
-    @patch("claude_code_queue.queue_manager.time.sleep")
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_callback_called_on_iteration(
-        self, mock_storage_class, mock_interface_class, mock_sleep
-    ):
+    @patch.object(qm_module.threading.Event, "wait")
+    def test_callback_called_on_iteration(self, mock_wait):
         """Test callback is called after each iteration."""
         mock_storage = Mock()
         mock_storage.load_queue_state.return_value = QueueState()
-        mock_storage_class.return_value = mock_storage
+        self.mock_storage_class.return_value = mock_storage
 
-        mock_interface = Mock()
-        mock_interface.test_connection.return_value = (True, "Working")
-        mock_interface_class.return_value = mock_interface
+        self.mock_interface_class.return_value = stub_interface()
 
         manager = QueueManager()
         callback = Mock()
@@ -303,14 +575,9 @@ class TestQueueManagerCallbacks:
         # Callback should have been called
         assert callback.call_count >= 1
 
-    @patch("claude_code_queue.queue_manager.ClaudeCodeInterface")
-    @patch("claude_code_queue.queue_manager.QueueStorage")
-    def test_callback_receives_current_state(
-        self, mock_storage_class, mock_interface_class
-    ):
+    def test_callback_receives_current_state(self, manager_factory):
         """Test callback receives current queue state."""
-        manager = QueueManager()
-        manager.state = QueueState()
+        manager = manager_factory()
         manager.state.total_processed = 5
 
         callback = Mock()
@@ -320,3 +587,30 @@ class TestQueueManagerCallbacks:
         state_arg = callback.call_args[0][0]
         assert isinstance(state_arg, QueueState)
         assert state_arg.total_processed == 5
+
+    def test_callback_called_after_prompt_runs(self, manager_factory):
+        """Test Claude runs off the main thread and the callback follows the run."""
+        worker_threads = []
+
+        def execute(prompt):
+            worker_threads.append(threading.current_thread())
+            return ExecutionResult(success=True, output="Done", execution_time=1.0)
+
+        mock_interface = Mock()
+        mock_interface.execute_prompt.side_effect = execute
+        self.mock_interface_class.return_value = mock_interface
+
+        manager = manager_factory(check_interval=1)
+        prompt = QueuedPrompt(id="run")
+        manager.state.add_prompt(prompt)
+        # The iteration reloads the queue before scheduling
+        manager.storage.load_queue_state.return_value = manager.state
+
+        seen_statuses = []
+        callback = Mock(side_effect=lambda state: seen_statuses.append(prompt.status))
+        manager._process_queue_iteration(callback)
+        manager._shutdown_executor()
+
+        callback.assert_called_once_with(manager.state)
+        assert seen_statuses == [PromptStatus.COMPLETED]
+        assert worker_threads[0] is not threading.main_thread()
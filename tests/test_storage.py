@@ -1,10 +1,13 @@
 """Unit tests for storage module."""
 
+import json
 from datetime import datetime
-from pathlib import Path
+from unittest.mock import patch
 
 import pytest
+import yaml
 
+from claude_code_queue import storage as storage_module
 from claude_code_queue.models import PromptStatus, QueuedPrompt, QueueState
 from claude_code_queue.storage import MarkdownPromptParser, QueueStorage
 
@@ -116,6 +119,127 @@ Content
         assert prompt is not None
         assert prompt.priority == 0  # Default when YAML is invalid
 
+    def test_parse_assignment_frontmatter_skips_yaml(self, tmp_path):
+        """Test "key = value" frontmatter is rejected before reaching YAML."""
+        file_path = tmp_path / "abc123-ini.md"
+        file_path.write_text("---\npriority = 5\nmodel = opus\n---\n\nContent")
+
+        with patch("claude_code_queue.storage.yaml.parse") as mock_parse:
+            prompt = MarkdownPromptParser.parse_prompt_file(file_path)
+            mock_parse.assert_not_called()
+
+        assert prompt.priority == 0
+        assert prompt.content == "Content"
+
+    def test_parse_frontmatter_with_equals_in_values(self, tmp_path):
+        """Test values containing "=" are still parsed as YAML."""
+        file_path = tmp_path / "abc123-eq.md"
+        file_path.write_text(
+            "---\npriority: 2\nbookmark: a=b=c\n"
+            "allowed_tools:\n- Bash(x=1)\n---\n\nBody"
+        )
+
+        prompt = MarkdownPromptParser.parse_prompt_file(file_path)
+
+        assert prompt.priority == 2
+        assert prompt.bookmark == "a=b=c"
+        assert prompt.allowed_tools == ["Bash(x=1)"]
+
+    @pytest.mark.parametrize(
+        "frontmatter,key,expected",
+        [
+            ("a=b: 1\n", "a=b", 1),
+            ('bookmark: "x\ny = 1"\n', "bookmark", "x y = 1"),
+            ("allowed_tools: [Read,\nx = 1]\n", "allowed_tools", ["Read", "x = 1"]),
+        ],
+        ids=["equals-in-key", "quoted-continuation", "flow-continuation"],
+    )
+    def test_load_frontmatter_keeps_valid_yaml_with_equals(
+        self, frontmatter, key, expected
+    ):
+        """Test the "key = value" pre-scan leaves valid YAML to the parser."""
+        assert storage_module._load_frontmatter(frontmatter)[key] == expected
+
+    def test_parse_non_mapping_frontmatter(self, tmp_path):
+        """Test a frontmatter that is not a mapping falls back to defaults."""
+        file_path = tmp_path / "abc123-list.md"
+        file_path.write_text("---\n- priority\n- 5\n---\n\nContent")
+
+        with patch("claude_code_queue.storage.yaml.load") as mock_load:
+            prompt = MarkdownPromptParser.parse_prompt_file(file_path)
+            mock_load.assert_not_called()
+
+        assert prompt.priority == 0
+        assert prompt.content == "Content"
+
+    def test_parse_reuses_unchanged_file(self, tmp_path):
+        """Test an unchanged file is not parsed again and callers get copies."""
+        file_path = tmp_path / "abc123-cached.md"
+        file_path.write_text("---\npriority: 2\ncontext_files:\n- a.py\n---\n\nBody")
+
+        first = MarkdownPromptParser.parse_prompt_file(file_path)
+        first.context_files.append("b.py")
+        first.status = PromptStatus.FAILED
+
+        with patch("claude_code_queue.storage.yaml.load") as mock_load:
+            second = MarkdownPromptParser.parse_prompt_file(file_path)
+            mock_load.assert_not_called()
+
+        assert second is not first
+        assert second.priority == 2
+        assert second.context_files == ["a.py"]
+        assert second.status == PromptStatus.QUEUED
+
+    def test_parse_crlf_prompt_strips_execution_log(self, tmp_path):
+        """Test CRLF files are split on the frontmatter and log like LF files."""
+        file_path = tmp_path / "abc123-crlf.md"
+        file_path.write_bytes(
+            b"---\r\npriority: 4\r\n---\r\n\r\nBody \xc3\xa9\r\n"
+            b"\r\n## Execution Log\r\n\r\n\xff not utf-8\r\n"
+        )
+
+        prompt = MarkdownPromptParser.parse_prompt_file(file_path)
+
+        assert prompt.priority == 4
+        assert prompt.content == "Body \u00e9"
+
+    def test_parse_prompt_header(self, tmp_path):
+        """Test the header is read from the frontmatter without a full parse."""
+        file_path = tmp_path / "abc123-title.md"
+        file_path.write_text("---\npriority: 3\n---\n\n" + "Body\n" * 2000)
+
+        with patch.object(MarkdownPromptParser, "parse_prompt_file") as mock_parse:
+            header = MarkdownPromptParser.parse_prompt_header(file_path)
+            mock_parse.assert_not_called()
+
+        assert header.id == "abc123"
+        assert header.priority == 3
+        assert header.status == PromptStatus.QUEUED
+
+    def test_parse_prompt_header_falls_back_for_long_frontmatter(self, tmp_path):
+        """Test a frontmatter ending past the header read is parsed in full."""
+        files = "".join(f"- file{i}.py\n" for i in range(1000))
+        file_path = tmp_path / "abc123-title.md"
+        file_path.write_text(f"---\ncontext_files:\n{files}priority: 7\n---\n\nBody")
+
+        header = MarkdownPromptParser.parse_prompt_header(file_path)
+
+        assert header.priority == 7
+
+    def test_write_invalidates_parse_cache(self, tmp_path):
+        """Test rewriting a prompt file is seen by the next parse."""
+        file_path = tmp_path / "abc123-cached.md"
+        MarkdownPromptParser.write_prompt_file(
+            QueuedPrompt(id="abc123", content="Body", priority=1), file_path
+        )
+        assert MarkdownPromptParser.parse_prompt_file(file_path).priority == 1
+
+        MarkdownPromptParser.write_prompt_file(
+            QueuedPrompt(id="abc123", content="Body", priority=2), file_path
+        )
+
+        assert MarkdownPromptParser.parse_prompt_file(file_path).priority == 2
+
     def test_write_prompt_file_basic(self, tmp_path):
         """Test writing a basic prompt to file."""
         prompt = QueuedPrompt(
@@ -171,6 +295,66 @@ Content
         assert "max_retries: 5" in content
         assert "retry_count: 2" in content
 
+    def test_write_prompt_file_frontmatter_loads_back(self, tmp_path):
+        """Test the directly formatted fields load back as the values yaml.dump wrote."""
+        created = datetime(2024, 1, 1, 12, 0, 0)
+        executed = datetime(2024, 1, 1, 12, 30, 0)
+        prompt = QueuedPrompt(
+            id="test-789",
+            content="Body",
+            created_at=created,
+            last_executed=executed,
+            retry_count=1,
+            status=PromptStatus.EXECUTING,
+        )
+        file_path = tmp_path / "test.md"
+        MarkdownPromptParser.write_prompt_file(prompt, file_path)
+
+        metadata = yaml.safe_load(file_path.read_text().split("---\n", 2)[1])
+
+        assert metadata["created_at"] == created.isoformat()
+        assert metadata["last_executed"] == executed.isoformat()
+        assert metadata["retry_count"] == 1
+        assert metadata["status"] == "executing"
+        assert metadata["priority"] == 0
+
+    def test_write_prompt_file_with_unhashable_frontmatter_values(self, tmp_path):
+        """Test list values, nested ones included, are written and load back."""
+        prompt = QueuedPrompt(
+            id="test-790",
+            content="Body",
+            context_files=["a.py", ["nested.py"]],
+            allowed_tools=["Read", "Edit"],
+        )
+        file_path = tmp_path / "test.md"
+
+        assert MarkdownPromptParser.write_prompt_file(prompt, file_path) is True
+
+        metadata = yaml.safe_load(file_path.read_text().split("---\n", 2)[1])
+        assert metadata["context_files"] == ["a.py", ["nested.py"]]
+        assert metadata["allowed_tools"] == ["Read", "Edit"]
+
+    def test_write_prompt_file_keeps_bool_and_int_values_apart(self, tmp_path):
+        """Test equal-hashing values of different types are dumped as themselves."""
+        file_path = tmp_path / "test.md"
+        written = []
+        for timeout, context_files in [(1, [1]), (True, [True]), (1.0, [1.0])]:
+            prompt = QueuedPrompt(
+                id="test-791",
+                content="Body",
+                timeout=timeout,
+                context_files=context_files,
+            )
+            MarkdownPromptParser.write_prompt_file(prompt, file_path)
+            metadata = yaml.safe_load(file_path.read_text().split("---\n", 2)[1])
+            written.append((metadata["timeout"], metadata["context_files"][0]))
+
+        assert [(type(a), type(b)) for a, b in written] == [
+            (int, int),
+            (bool, bool),
+            (float, float),
+        ]
+
     def test_write_prompt_with_execution_log(self, tmp_path):
         """Test writing prompt with execution log."""
         prompt = QueuedPrompt(id="test", content="Test")
@@ -228,6 +412,22 @@ class TestQueueStorage:
         assert storage.completed_dir.exists()
         assert storage.failed_dir.exists()
 
+    def test_change_marker_tracks_prompt_files(self, tmp_path):
+        """Test the change marker moves when prompt files change."""
+        storage = QueueStorage(str(tmp_path / "queue"))
+        empty = storage.get_change_marker()
+        assert storage.get_change_marker() == empty
+
+        prompt = QueuedPrompt(id="marker", content="Test")
+        state = QueueState()
+        state.add_prompt(prompt)
+        storage.save_queue_state(state)
+        saved = storage.get_change_marker()
+        assert saved != empty
+
+        storage.delete_prompt_files("marker")
+        assert storage.get_change_marker() != saved
+
     def test_save_and_load_queue_state(self, tmp_path):
         """Test saving and loading queue state."""
         storage = QueueStorage(str(tmp_path / "queue"))
@@ -237,7 +437,8 @@ class TestQueueStorage:
         state.total_processed = 10
         state.failed_count = 2
         state.rate_limited_count = 1
-        state.last_processed = datetime.now()
+        last_processed = datetime.now()
+        state.last_processed = last_processed
 
         # Save state
         success = storage.save_queue_state(state)
@@ -248,7 +449,51 @@ class TestQueueStorage:
         assert loaded_state.total_processed == 10
         assert loaded_state.failed_count == 2
         assert loaded_state.rate_limited_count == 1
-        assert loaded_state.last_processed is not None
+        assert loaded_state.last_processed == last_processed
+        saved = json.loads(storage.state_file.read_text())
+        assert saved["last_processed"] == last_processed.isoformat()
+
+    def test_load_queue_state_with_nanosecond_last_processed(self, tmp_path):
+        """Test a state file with last_processed in epoch nanoseconds still loads."""
+        storage = QueueStorage(str(tmp_path / "queue"))
+        last_processed = datetime(2024, 5, 1, 12, 30, 45, 123456)
+        ns = int(last_processed.replace(microsecond=0).timestamp()) * 10**9 + 123456000
+        storage.state_file.write_text(
+            f'{{"total_processed": 3, "last_processed": {ns}}}'
+        )
+
+        loaded_state = storage.load_queue_state()
+
+        assert loaded_state.total_processed == 3
+        assert loaded_state.last_processed == last_processed
+
+    def test_load_queue_state_with_iso_last_processed(self, tmp_path):
+        """Test a state file with an ISO last_processed timestamp loads."""
+        storage = QueueStorage(str(tmp_path / "queue"))
+        storage.state_file.write_text(
+            '{"total_processed": 3, "last_processed": "2024-05-01T12:30:45.123456"}'
+        )
+
+        loaded_state = storage.load_queue_state()
+
+        assert loaded_state.total_processed == 3
+        assert loaded_state.last_processed == datetime(2024, 5, 1, 12, 30, 45, 123456)
+
+    def test_load_queue_state_without_failed(self, tmp_path):
+        """Test failed prompts can be left out when only scheduling matters."""
+        storage = QueueStorage(str(tmp_path / "queue"))
+        state = QueueState(
+            prompts=[
+                QueuedPrompt(id="waiting", content="Waiting"),
+                QueuedPrompt(id="broken", content="Broken", status=PromptStatus.FAILED),
+            ]
+        )
+        storage.save_queue_state(state)
+
+        assert storage.load_queue_state().get_prompt("broken") is not None
+
+        loaded = storage.load_queue_state(include_failed=False)
+        assert [p.id for p in loaded.prompts] == ["waiting"]
 
     def test_save_single_prompt_queued(self, tmp_path):
         """Test saving a queued prompt."""
@@ -283,6 +528,38 @@ class TestQueueStorage:
         files = list(storage.queue_dir.glob("test-456*.executing.md"))
         assert len(files) == 1
 
+    def test_save_single_prompt_executing_title_with_md(self, tmp_path):
+        """Test only the extension gets the executing suffix."""
+        storage = QueueStorage(str(tmp_path / "queue"))
+        prompt = QueuedPrompt(
+            id="test-789",
+            content="Update README.md now",
+            status=PromptStatus.EXECUTING,
+        )
+
+        storage._save_single_prompt(prompt)
+
+        names = [p.name for p in storage.queue_dir.iterdir()]
+        assert names == ["test-789-Update-README.md-now.executing.md"]
+
+    def test_status_change_renames_queue_file(self, tmp_path):
+        """Test a status change renames the queue file and drops the others."""
+        storage = QueueStorage(str(tmp_path / "queue"))
+        prompt = QueuedPrompt(id="test-321", content="Moving prompt")
+        storage._save_single_prompt(prompt)
+        (queued_file,) = storage.queue_dir.iterdir()
+        inode = queued_file.stat().st_ino
+        (storage.queue_dir / "test-321-#old.md").write_text("Old")
+
+        prompt.status = PromptStatus.EXECUTING
+        prompt.add_log("Started")
+        storage._save_single_prompt(prompt)
+
+        (executing_file,) = storage.queue_dir.iterdir()
+        assert executing_file.name == "test-321-Moving-prompt.executing.md"
+        assert executing_file.stat().st_ino == inode
+        assert "Started" in executing_file.read_text()
+
     def test_save_single_prompt_completed(self, tmp_path):
         """Test saving a completed prompt moves it to completed directory."""
         storage = QueueStorage(str(tmp_path / "queue"))
@@ -330,6 +607,57 @@ class TestQueueStorage:
         assert statuses["test1"] == PromptStatus.QUEUED
         assert statuses["test2"] == PromptStatus.EXECUTING
 
+    def test_load_prompts_skips_directories(self, tmp_path):
+        """Test a directory named like a prompt file is not parsed."""
+        storage = QueueStorage(str(tmp_path / "queue"))
+        (storage.queue_dir / "test1-prompt.md").write_text("# Test 1")
+        (storage.queue_dir / "notes.md").mkdir()
+
+        prompts = storage._load_prompts_from_files()
+
+        assert [p.id for p in prompts] == ["test1"]
+
+    def test_load_prompt_headers_match_loaded_prompts(self, tmp_path):
+        """Test headers list the queued and executing prompts like a full load."""
+        storage = QueueStorage(str(tmp_path / "queue"))
+        storage.save_queue_state(
+            QueueState(
+                prompts=[
+                    QueuedPrompt(id="q1", content="One", priority=2),
+                    QueuedPrompt(id="ex", content="Two", status=PromptStatus.EXECUTING),
+                    QueuedPrompt(id="f1", content="Three", status=PromptStatus.FAILED),
+                ]
+            )
+        )
+
+        headers = storage.load_prompt_headers()
+        prompts = storage._load_prompts_from_files(include_failed=False)
+
+        assert [(h.id, h.priority, h.status) for h in headers] == [
+            (p.id, p.priority, p.status) for p in prompts
+        ]
+
+    def test_parallel_load_matches_serial_load(self, tmp_path):
+        """Test a load large enough for the thread pool keeps order and statuses."""
+        storage = QueueStorage(str(tmp_path / "queue"))
+        prompts = [
+            QueuedPrompt(id=f"p{i:03d}", content=f"Prompt {i}", priority=i % 5)
+            for i in range(storage_module.PARALLEL_LOAD_MIN_FILES + 8)
+        ]
+        prompts[0].status = PromptStatus.EXECUTING
+        prompts[1].status = PromptStatus.FAILED
+        storage.save_queue_state(QueueState(prompts=prompts))
+
+        parallel = storage._load_prompts_from_files()
+        MarkdownPromptParser.invalidate_parse_cache()
+        with patch.object(storage_module, "PARALLEL_LOAD_MIN_FILES", len(prompts) + 1):
+            serial = storage._load_prompts_from_files()
+
+        assert [(p.id, p.status, p.priority) for p in parallel] == [
+            (p.id, p.status, p.priority) for p in serial
+        ]
+        assert len(parallel) == len(prompts)
+
     def test_remove_prompt_files(self, tmp_path):
         """Test removing all files for a prompt ID."""
         storage = QueueStorage(str(tmp_path / "queue"))